@@ -0,0 +1,226 @@
+"""
+Grounded App - Vectorized Feature Building
+Builds model windows for many histories at once from columnar arrays.
+
+ScenarioTester.prepare_features works on one pandas DataFrame per history,
+which is fine for a handful of scenarios but far too slow for thousands.
+Here every field is a (n_histories, n_days) array and the whole batch is
+featurized with NumPy in one go. The output matches prepare_features
+column for column:
+
+    context one-hot (6) | time one-hot (5) | method one-hot (5) |
+    day-of-week one-hot (7) | scaled numericals (9)
+
+Categorical fields are stored as integer codes into the vocabularies below.
+"""
+
+import numpy as np
+
+
+# Categories matching training (DataPreprocessor)
+CONTEXTS = ['alone', 'friends', 'family', 'work', 'party', 'none']
+TIMES = ['morning', 'afternoon', 'evening', 'night', 'none']
+METHODS = ['smoking', 'vaping', 'edibles', 'drinking', 'none']
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+CATEGORICAL_VOCABS = {
+    'context': CONTEXTS,
+    'time_of_day': TIMES,
+    'method': METHODS,
+}
+
+# Raw numerical inputs, in the order the scaler was fitted on
+NUMERICAL_COLS = ['amount', 'cost', 'mood', 'sleep_quality',
+                  'craving_intensity', 'reminder_opens', 'messages_read']
+
+FEATURE_NAMES = (
+    [f'context_{c}' for c in CONTEXTS]
+    + [f'time_{t}' for t in TIMES]
+    + [f'method_{m}' for m in METHODS]
+    + [f'day_{d}' for d in DAYS]
+    + NUMERICAL_COLS
+    + ['frequency_7day', 'frequency_30day']
+)
+
+N_FEATURES = len(FEATURE_NAMES)
+
+# Embedding input variant: each categorical field becomes one integer code
+# into a shared embedding table. A field's codes start at the column where
+# its one-hot block starts, so code == index of the hot one-hot column.
+CATEGORY_FIELDS = ['context', 'time_of_day', 'method', 'day_of_week']
+CATEGORY_SIZES = [len(CONTEXTS), len(TIMES), len(METHODS), len(DAYS)]
+CATEGORY_OFFSETS = np.cumsum([0] + CATEGORY_SIZES[:-1])
+N_CATEGORY_CODES = sum(CATEGORY_SIZES)
+N_NUMERICAL = N_FEATURES - N_CATEGORY_CODES
+
+
+def encode_categorical(values, vocab):
+    """
+    Map category strings to integer codes.
+    Unknown values fall back to 'none' (the last entry in every vocab).
+    """
+    lookup = {name: i for i, name in enumerate(vocab)}
+    fallback = len(vocab) - 1
+    values = np.asarray(values, dtype=object)
+    flat = [lookup.get(v, fallback) for v in values.ravel()]
+    return np.asarray(flat, dtype=np.int8).reshape(values.shape)
+
+
+def rolling_frequency(frequency, window):
+    """
+    Trailing mean over the last `window` days with min_periods=1.
+    Same as pandas `rolling(window, min_periods=1).mean()` along axis 1.
+    """
+    frequency = np.asarray(frequency, dtype=np.float64)
+    csum = np.cumsum(frequency, axis=1)
+    n_days = frequency.shape[1]
+    shifted = np.zeros_like(csum)
+    if window < n_days:
+        shifted[:, window:] = csum[:, :-window]
+    counts = np.minimum(np.arange(1, n_days + 1), window)
+    return (csum - shifted) / counts
+
+
+def histories_to_columns(histories, sequence_length=14):
+    """
+    Turn a list of day-dict histories (as from ScenarioTester.create_day)
+    into columnar arrays holding the last `sequence_length` days of each.
+    """
+    recent = [h[-sequence_length:] for h in histories]
+
+    columns = {}
+    for field, vocab in CATEGORICAL_VOCABS.items():
+        columns[field] = encode_categorical([[d[field] for d in h] for h in recent], vocab)
+    for field in NUMERICAL_COLS:
+        columns[field] = np.array([[d[field] for d in h] for h in recent], dtype=np.float64)
+    columns['day_of_week'] = np.array([[d['day_of_week'] for d in h] for h in recent], dtype=np.int8)
+    columns['frequency'] = np.array([[d['frequency'] for d in h] for h in recent], dtype=np.float64)
+
+    return columns
+
+
+def grouped_rolling_mean(values, group_ids, window):
+    """
+    Trailing mean within each group for long-format (one row per day) data.
+    Rows must already be sorted by group then day. Same as
+    `df.groupby(group)[col].rolling(window, min_periods=1).mean()`.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    group_ids = np.asarray(group_ids)
+    n = len(values)
+    if n == 0:
+        return values
+
+    idx = np.arange(n)
+    new_group = np.r_[True, group_ids[1:] != group_ids[:-1]]
+    group_start = np.maximum.accumulate(np.where(new_group, idx, 0))
+
+    first = np.maximum(idx - window + 1, group_start)
+    csum = np.r_[0.0, np.cumsum(values)]
+    return (csum[idx + 1] - csum[first]) / (idx - first + 1)
+
+
+def featurize_columns(columns, scaler, dtype=np.float32):
+    """
+    Build (..., N_FEATURES) model input from columnar arrays.
+
+    Columns are usually (n, n_days) windows, in which case the rolling
+    frequencies are computed inside each window like ScenarioTester does.
+    Long-format callers can pass precomputed 'frequency_7day' and
+    'frequency_30day' columns instead (see featurize_frame).
+
+    `scaler` is the fitted MinMaxScaler from training; only its `scale_`
+    and `min_` are used, so there is no per-call sklearn overhead.
+    """
+    shape = columns['day_of_week'].shape
+    out = np.empty(shape + (N_FEATURES,), dtype=dtype)
+
+    col = 0
+    for field, vocab in CATEGORICAL_VOCABS.items():
+        codes = columns[field]
+        for i in range(len(vocab)):
+            out[..., col] = codes == i
+            col += 1
+
+    dow = columns['day_of_week']
+    for i in range(len(DAYS)):
+        out[..., col] = dow == i
+        col += 1
+
+    numerical = [columns[field] for field in NUMERICAL_COLS]
+    if 'frequency_7day' in columns:
+        numerical.append(columns['frequency_7day'])
+        numerical.append(columns['frequency_30day'])
+    else:
+        numerical.append(rolling_frequency(columns['frequency'], 7))
+        numerical.append(rolling_frequency(columns['frequency'], 30))
+
+    scale = scaler.scale_
+    offset = scaler.min_
+    for i, values in enumerate(numerical):
+        out[..., col] = values * scale[i] + offset[i]
+        col += 1
+
+    return out
+
+
+def split_onehot(features):
+    """
+    One-hot features (..., N_FEATURES) → (codes, numerics) for the embedding
+    model: codes is int32 (..., 4) into the shared table, numerics is the
+    scaled numerical block (..., N_NUMERICAL).
+
+    A block with no hot column (value outside the vocab) maps to that
+    field's last entry, i.e. 'none'.
+    """
+    features = np.asarray(features)
+    codes = np.empty(features.shape[:-1] + (len(CATEGORY_FIELDS),), dtype=np.int32)
+    for i, (offset, size) in enumerate(zip(CATEGORY_OFFSETS, CATEGORY_SIZES)):
+        block = features[..., offset:offset + size]
+        hot = block.argmax(axis=-1)
+        codes[..., i] = offset + np.where(block.max(axis=-1) > 0, hot, size - 1)
+    numerics = features[..., N_CATEGORY_CODES:].astype(np.float32)
+    return codes, numerics
+
+
+def featurize_frame(df, scaler, dtype=np.float32):
+    """
+    Per-day features for a long-format DataFrame (one row per user-day),
+    sorted by user_id then day. Rolling frequencies run over each user's
+    full history, the same way DataPreprocessor.prepare_features does in
+    training. Returns (n_rows, N_FEATURES).
+    """
+    columns = {field: encode_categorical(df[field].values, vocab)
+               for field, vocab in CATEGORICAL_VOCABS.items()}
+    for field in NUMERICAL_COLS:
+        columns[field] = df[field].values.astype(np.float64)
+    columns['day_of_week'] = df['day_of_week'].values.astype(np.int8)
+
+    users = df['user_id'].values
+    frequency = df['frequency'].values
+    columns['frequency_7day'] = grouped_rolling_mean(frequency, users, 7)
+    columns['frequency_30day'] = grouped_rolling_mean(frequency, users, 30)
+
+    return featurize_columns(columns, scaler, dtype)
+
+
+def columns_to_histories(columns):
+    """
+    Inverse of histories_to_columns - turn (n, n_days) columns back into
+    lists of day dicts, e.g. to build request payloads.
+    """
+    n, n_days = columns['day_of_week'].shape
+    histories = []
+    for i in range(n):
+        history = []
+        for d in range(n_days):
+            day = {field: vocab[columns[field][i, d]]
+                   for field, vocab in CATEGORICAL_VOCABS.items()}
+            for field in NUMERICAL_COLS:
+                day[field] = float(columns[field][i, d])
+            day['day_of_week'] = int(columns['day_of_week'][i, d])
+            day['frequency'] = int(columns['frequency'][i, d])
+            day['used'] = bool(day['frequency'])
+            history.append(day)
+        histories.append(history)
+    return histories
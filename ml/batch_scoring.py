@@ -0,0 +1,327 @@
+"""
+Grounded App - Batch Scoring for Exported Histories
+Scores large per-user daily record files without loading them into memory.
+
+The input is a long-format file (CSV, JSONL or Parquet) with one row per
+user-day, grouped by user_id and ordered by day. It is read in chunks; users
+that straddle a chunk boundary are carried over to the next chunk, so every
+user is featurized from their complete history with the training
+vocabularies and rolling windows. Chunks are scored in worker processes and
+results are appended to the output as they come back, with a bounded number
+of chunks in flight.
+
+Expected columns:
+    user_id, day_of_week, used (or frequency), context, time_of_day, method,
+    amount, cost, mood, sleep_quality, craving_intensity,
+    reminder_opens, messages_read   (+ optional day_num)
+
+Modes:
+    latest  one score per user - risk for the day after their last record
+    all     one score per 14-day window - risk for the day after day_num
+
+Usage:
+    python batch_scoring.py score exports/history.csv --output scores.csv
+    python batch_scoring.py score history.parquet --mode all --workers 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from batch_features import featurize_frame
+
+
+SEQUENCE_LENGTH = 14
+
+# Filled in for columns an export doesn't have (same as ScenarioTester.create_day)
+COLUMN_DEFAULTS = {
+    'context': 'none', 'time_of_day': 'none', 'method': 'none',
+    'amount': 0, 'cost': 0, 'mood': 5, 'sleep_quality': 7,
+    'craving_intensity': 3, 'reminder_opens': 0, 'messages_read': 0,
+}
+
+# Per-process model state, set up once by _init_worker
+_worker = {}
+
+
+def read_chunks(path, chunk_rows):
+    """Yield DataFrames of about `chunk_rows` rows from CSV, JSONL or Parquet."""
+
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow is needed for Parquet input: pip install pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif path.endswith(('.jsonl', '.json')):
+        yield from pd.read_json(path, lines=True, chunksize=chunk_rows)
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def complete_user_chunks(chunks):
+    """
+    Re-cut chunks so no user is split across two of them.
+    The trailing user of each chunk is held back and prepended to the next.
+    """
+
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        if chunk.empty:
+            continue
+
+        last_user = chunk['user_id'].iloc[-1]
+        tail = (chunk['user_id'] == last_user).values
+        # Only hold back the final contiguous run of the last user
+        cut = len(chunk) - np.argmin(tail[::-1]) if not tail.all() else 0
+        carry = chunk.iloc[cut:]
+        if cut > 0:
+            yield chunk.iloc[:cut]
+
+    if carry is not None and not carry.empty:
+        yield carry
+
+
+def normalize_records(df):
+    """Fill defaults, derive frequency and sort each user's days."""
+
+    df = df.copy()
+    for column, default in COLUMN_DEFAULTS.items():
+        if column not in df:
+            df[column] = default
+        else:
+            df[column] = df[column].fillna(default)
+
+    if 'frequency' not in df:
+        df['frequency'] = df['used'].astype(float)
+
+    if 'day_num' in df:
+        df = df.sort_values(['user_id', 'day_num'], kind='stable')
+    else:
+        df['day_num'] = df.groupby('user_id', sort=False).cumcount()
+
+    return df.reset_index(drop=True)
+
+
+def build_windows(features, users, mode, sequence_length=SEQUENCE_LENGTH):
+    """
+    Slice per-day features into model windows.
+
+    Returns (windows, row_index) where row_index points at the last day of
+    each window in the chunk, so results can be joined back to user/day.
+    Users with fewer than `sequence_length` days produce no windows.
+    """
+
+    new_user = np.r_[True, users[1:] != users[:-1]]
+    starts = np.flatnonzero(new_user)
+    ends = np.r_[starts[1:], len(users)]
+
+    if mode == 'latest':
+        last = np.array([end - 1 for start, end in zip(starts, ends)
+                         if end - start >= sequence_length], dtype=np.int64)
+    else:
+        last = np.concatenate([np.arange(start + sequence_length - 1, end)
+                               for start, end in zip(starts, ends)] or [np.empty(0, np.int64)])
+
+    offsets = np.arange(-sequence_length + 1, 1)
+    windows = features[last[:, None] + offsets]
+    return windows, last
+
+
+def _init_worker(model_path, scaler_path, threads, cache_size=0):
+    """Load the model once per worker process with a fixed thread budget."""
+
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    import joblib
+    import tensorflow as tf
+    from model_formats import load_keras_model
+
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+    _worker['model'], _ = load_keras_model(model_path)
+    _worker['scaler'] = joblib.load(scaler_path)
+    _worker['cache'] = None
+    if cache_size:
+        from prediction_cache import PredictionCache, model_version_for
+        _worker['cache'] = PredictionCache(cache_size, model_version=model_version_for(model_path))
+
+
+def score_chunk(df, mode='latest', batch_size=4096):
+    """
+    Featurize and score one chunk of complete users.
+    Runs inside a worker (or in-process when workers=0).
+    """
+
+    df = normalize_records(df)
+    users = df['user_id'].values
+    features = featurize_frame(df, _worker['scaler'])
+    windows, rows = build_windows(features, users, mode)
+
+    def predict(X):
+        return _worker['model'].predict(X, batch_size=batch_size, verbose=0)[:, 0]
+
+    cache = _worker['cache']
+    hits_before = cache.hits if cache else 0
+    if not len(windows):
+        scores = np.empty(0, dtype=np.float32)
+    elif cache is None:
+        scores = predict(windows)
+    else:
+        scores = cache.predict(windows, predict)
+    cache_hits = (cache.hits - hits_before) if cache else 0
+
+    result = pd.DataFrame({
+        'user_id': users[rows],
+        'day_num': df['day_num'].values[rows],
+        'risk_score': scores,
+    })
+
+    if mode == 'latest':
+        # Keep users that are too new to score so every user is accounted for
+        counts = df.groupby('user_id', sort=False).size()
+        short = counts[counts < SEQUENCE_LENGTH]
+        if len(short):
+            last_day = df.groupby('user_id', sort=False)['day_num'].last()
+            result = pd.concat([result, pd.DataFrame({
+                'user_id': short.index,
+                'day_num': last_day[short.index].values,
+                'risk_score': np.nan,
+            })], ignore_index=True)
+
+    return result, int(df['user_id'].nunique()), len(df), cache_hits
+
+
+class ResultWriter:
+    """Appends result frames to CSV or JSONL as they arrive."""
+
+    def __init__(self, path):
+        self.path = path
+        self.jsonl = path.endswith(('.jsonl', '.json'))
+        self.header_written = False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        open(path, 'w').close()
+
+    def write(self, frame):
+        if self.jsonl:
+            with open(self.path, 'a') as f:
+                frame.to_json(f, orient='records', lines=True)
+        else:
+            frame.to_csv(self.path, mode='a', index=False, header=not self.header_written)
+            self.header_written = True
+
+
+def score_file(input_path, output_path, model_path, scaler_path, mode='latest',
+               chunk_rows=200_000, workers=0, threads_per_worker=1,
+               batch_size=4096, max_in_flight=None, cache_size=0):
+    """
+    Stream `input_path` through the model and write scores to `output_path`.
+    Returns throughput stats.
+    """
+
+    writer = ResultWriter(output_path)
+    chunks = complete_user_chunks(read_chunks(input_path, chunk_rows))
+    totals = {'users': 0, 'rows': 0, 'scores': 0, 'cache_hits': 0}
+    start = time.perf_counter()
+
+    def collect(result):
+        frame, n_users, n_rows, cache_hits = result
+        writer.write(frame)
+        totals['users'] += n_users
+        totals['rows'] += n_rows
+        totals['scores'] += int(frame['risk_score'].notna().sum())
+        totals['cache_hits'] += cache_hits
+        elapsed = time.perf_counter() - start
+        print(f"  Scored {totals['users']:,} users ({totals['users']/elapsed:,.0f} users/sec)")
+
+    if workers <= 0:
+        _init_worker(model_path, scaler_path, threads_per_worker, cache_size)
+        for chunk in chunks:
+            collect(score_chunk(chunk, mode, batch_size))
+    else:
+        # Bound the number of chunks held in memory at once
+        limit = max_in_flight or workers * 2
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_path, scaler_path, threads_per_worker,
+                                           cache_size)) as pool:
+            for chunk in chunks:
+                pending.append(pool.submit(score_chunk, chunk, mode, batch_size))
+                if len(pending) >= limit:
+                    collect(pending.popleft().result())
+            while pending:
+                collect(pending.popleft().result())
+
+    elapsed = time.perf_counter() - start
+    return {
+        'input': input_path,
+        'output': output_path,
+        'mode': mode,
+        'workers': workers,
+        'users': totals['users'],
+        'rows': totals['rows'],
+        'scores': totals['scores'],
+        'cache_hits': totals['cache_hits'],
+        'elapsed_s': elapsed,
+        'users_per_sec': totals['users'] / elapsed if elapsed > 0 else None,
+        'rows_per_sec': totals['rows'] / elapsed if elapsed > 0 else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grounded batch scoring")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    score = commands.add_parser('score', help="Score a history file")
+    score.add_argument('input', help="CSV, JSONL or Parquet of per-user daily records")
+    score.add_argument('--output', default='scores.csv', help="CSV or JSONL output")
+    score.add_argument('--model', default='models/grounded_model.h5')
+    score.add_argument('--scaler', default='models/feature_scaler.pkl')
+    score.add_argument('--mode', choices=['latest', 'all'], default='latest')
+    score.add_argument('--chunk-rows', type=int, default=200_000)
+    score.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                       help="Worker processes (0 = score in this process)")
+    score.add_argument('--threads-per-worker', type=int, default=1)
+    score.add_argument('--batch-size', type=int, default=4096)
+    score.add_argument('--cache-size', type=int, default=0,
+                       help="Per-worker cache of up to N distinct windows")
+    score.add_argument('--stats', default=None, help="Write throughput stats as JSON")
+    args = parser.parse_args()
+
+    print("="*80)
+    print(" "*28 + "GROUNDED BATCH SCORING")
+    print("="*80)
+
+    stats = score_file(args.input, args.output, args.model, args.scaler,
+                       mode=args.mode, chunk_rows=args.chunk_rows,
+                       workers=args.workers, threads_per_worker=args.threads_per_worker,
+                       batch_size=args.batch_size, cache_size=args.cache_size)
+
+    print(f"\n✓ Users scored: {stats['users']:,} ({stats['scores']:,} scores)")
+    print(f"✓ Throughput: {stats['users_per_sec']:,.0f} users/sec | "
+          f"{stats['rows_per_sec']:,.0f} rows/sec")
+    if args.cache_size:
+        print(f"✓ Cache hits: {stats['cache_hits']:,} windows skipped inference")
+    print(f"✓ Scores written to {args.output}")
+
+    if args.stats:
+        with open(args.stats, 'w') as f:
+            json.dump(stats, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
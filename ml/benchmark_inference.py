@@ -0,0 +1,369 @@
+"""
+Grounded App - Inference Latency & Cold-Start Benchmark
+Measures how long it takes to import, load and score the exported model.
+
+For each model format (see model_formats.py) and thread setting, a fresh
+Python process is started so load and first-prediction numbers are true
+cold starts rather than benefiting from whatever the parent already loaded:
+
+    • import time of numpy / tensorflow
+    • model load time and peak RSS after loading
+    • first-prediction latency (includes graph tracing / tensor allocation)
+    • steady-state p50 / p99 per call for batch sizes 1 … 4096
+    • single-thread vs default multi-thread
+
+Results go to a versioned JSON file named after the model version and a hash
+of the model file, so runs for different builds sit side by side and can be
+diffed with --compare.
+
+With --load-runs N every probe is repeated and the median load time / load
+RSS is kept; --markdown writes the per-format load comparison as a table.
+
+Usage:
+    python benchmark_inference.py --model-dir models --derive-missing
+    python benchmark_inference.py --load-runs 5 --threads 1 --batch-sizes 1 --markdown benchmarks/load_formats.md
+    python benchmark_inference.py --compare benchmarks/inference_1.0.0_ab12cd34ef56_20251020-101500.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+
+SCHEMA_VERSION = 1
+DEFAULT_BATCH_SIZES = [1, 4, 16, 64, 256, 1024, 4096]
+FORMATS = ['h5', 'keras', 'savedmodel', 'tflite', 'npz']
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process (Linux reports KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def time_calls(predict, x, min_iters=5, max_iters=200, budget_s=2.0):
+    """Per-call latencies (ms) after two warm-up calls."""
+    predict(x)
+    predict(x)
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_iters and (len(times) < min_iters or time.perf_counter() - start < budget_s):
+        t0 = time.perf_counter()
+        predict(x)
+        times.append((time.perf_counter() - t0) * 1000)
+    return np.array(times)
+
+
+def probe(fmt, path, threads, batch_sizes, input_shape):
+    """
+    Runs inside a fresh process: load one format, time first and
+    steady-state predictions. Returns a dict (printed as JSON by main).
+    """
+
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    import tensorflow as tf
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+    from model_formats import load_predict_fn
+    from pipeline_profiler import current_rss_mb
+
+    # Current, not peak, RSS - the TensorFlow import peak would hide the load
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    predict = load_predict_fn(fmt, path, num_threads=threads or os.cpu_count())
+    load_s = time.perf_counter() - start
+    rss_after_load = current_rss_mb()
+
+    rng = np.random.default_rng(0)
+    x1 = rng.random((1,) + tuple(input_shape), dtype=np.float32)
+    start = time.perf_counter()
+    predict(x1)
+    first_predict_ms = (time.perf_counter() - start) * 1000
+
+    steady = {}
+    for batch in batch_sizes:
+        x = rng.random((batch,) + tuple(input_shape), dtype=np.float32)
+        try:
+            times = time_calls(predict, x)
+        except Exception as e:
+            steady[str(batch)] = {'error': str(e).splitlines()[0]}
+            continue
+        steady[str(batch)] = {
+            'iterations': len(times),
+            'p50_ms': float(np.percentile(times, 50)),
+            'p99_ms': float(np.percentile(times, 99)),
+            'mean_ms': float(times.mean()),
+            'windows_per_sec': float(batch / (np.median(times) / 1000)),
+        }
+
+    return {
+        'format': fmt,
+        'threads': threads or 'default',
+        'load_s': load_s,
+        'load_rss_mb': rss_after_load - rss_before,
+        'peak_rss_mb': peak_rss_mb(),
+        'first_predict_ms': first_predict_ms,
+        'steady_state': steady,
+    }
+
+
+def run_probe(fmt, path, threads, batch_sizes, input_shape):
+    """Start a fresh interpreter for one probe and parse its JSON result."""
+    cmd = [sys.executable, os.path.abspath(__file__), '--probe', fmt, os.path.abspath(path),
+           '--probe-threads', str(threads),
+           '--batch-sizes', ','.join(map(str, batch_sizes)),
+           '--input-shape', ','.join(map(str, input_shape))]
+    result = subprocess.run(cmd, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        return {'format': fmt, 'threads': threads or 'default',
+                'error': result.stderr.strip().splitlines()[-1] if result.stderr else 'failed'}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_import(module, runs=3):
+    """Median wall time to import `module` in a fresh interpreter."""
+    code = (f"import os, time; os.environ['TF_CPP_MIN_LOG_LEVEL']='2'; "
+            f"t=time.perf_counter(); import {module}; print(time.perf_counter()-t)")
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return {'median_s': float(np.median(times)), 'min_s': float(min(times)), 'runs': runs}
+
+
+def artifact_size_kb(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 1024
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names) / 1024
+
+
+def run_probes(fmt, path, threads, batch_sizes, input_shape, runs=1):
+    """
+    run_probe `runs` times. Keeps the run with the median load time and
+    adds every run's load time and load RSS.
+    """
+    probes = [run_probe(fmt, path, threads, batch_sizes, input_shape) for _ in range(runs)]
+    ok = [r for r in probes if 'error' not in r]
+    if not ok:
+        return probes[0]
+    ok.sort(key=lambda r: r['load_s'])
+    result = ok[len(ok) // 2]
+    result['load_runs_s'] = [r['load_s'] for r in ok]
+    result['load_rss_runs_mb'] = [r['load_rss_mb'] for r in ok]
+    result['load_rss_mb'] = float(np.median(result['load_rss_runs_mb']))
+    return result
+
+
+def load_table(results):
+    """Markdown table of load time, load memory and size per format, fastest first."""
+    rows = sorted((r for r in results if 'error' not in r), key=lambda r: r['load_s'])
+    lines = ["| Format | Threads | Load (ms, median) | Load range (ms) | Load RSS (MB) | "
+             "First predict (ms) | Size (KB) |",
+             "|---|---|---|---|---|---|---|"]
+    for r in rows:
+        runs = r.get('load_runs_s', [r['load_s']])
+        lines.append(f"| {r['format']} | {r['threads']} | {r['load_s'] * 1000:.1f} | "
+                     f"{min(runs) * 1000:.1f}–{max(runs) * 1000:.1f} | {r['load_rss_mb']:.1f} | "
+                     f"{r['first_predict_ms']:.1f} | {r['size_kb']:.1f} |")
+    return "\n".join(lines) + "\n"
+
+
+def find_artifacts(model_dir, derive_missing, work_dir):
+    """
+    Locate each format in model_dir. With derive_missing, formats that
+    save_model_for_mobile didn't write are generated from the .h5 into work_dir.
+    """
+    from model_formats import derive_formats, format_path
+
+    found = {fmt: format_path(model_dir, fmt) for fmt in FORMATS
+             if os.path.exists(format_path(model_dir, fmt))}
+    missing = [fmt for fmt in FORMATS if fmt not in found]
+
+    if missing and derive_missing:
+        from tensorflow import keras
+        source = found.get('keras') or found.get('h5')
+        model = keras.models.load_model(source, compile=False)
+        derived = derive_formats(model, work_dir, missing)
+        print(f"✓ Derived {', '.join(missing)} from {os.path.basename(source)}")
+        found.update(derived)
+
+    return found
+
+
+def compare(current, baseline, threshold=0.2):
+    """Print p50 / load / first-prediction changes versus an earlier run."""
+
+    def index(report):
+        return {(r['format'], str(r['threads'])): r for r in report['results'] if 'error' not in r}
+
+    old, new = index(baseline), index(current)
+    print(f"\n📉 Compared with {baseline.get('model', {}).get('version')} "
+          f"({baseline.get('created_at', '?')}):")
+    regressions = 0
+    for key in sorted(new):
+        if key not in old:
+            continue
+        rows = [('load_s', old[key]['load_s'], new[key]['load_s']),
+                ('first_ms', old[key]['first_predict_ms'], new[key]['first_predict_ms'])]
+        for batch, stats in new[key]['steady_state'].items():
+            before = old[key]['steady_state'].get(batch, {})
+            if 'p50_ms' in stats and 'p50_ms' in before:
+                rows.append((f'p50_b{batch}', before['p50_ms'], stats['p50_ms']))
+        for name, a, b in rows:
+            change = (b - a) / a if a else 0.0
+            flag = '⚠' if change > threshold else ' '
+            regressions += change > threshold
+            print(f"  {flag} {key[0]:10} t={key[1]:7} {name:12} {a:10.3f} → {b:10.3f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference latency and cold-start benchmark")
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--output-dir', default='benchmarks')
+    parser.add_argument('--formats', default=','.join(FORMATS))
+    parser.add_argument('--batch-sizes', default=','.join(map(str, DEFAULT_BATCH_SIZES)))
+    parser.add_argument('--threads', default='1,0', help="0 = TensorFlow default (all cores)")
+    parser.add_argument('--import-runs', type=int, default=3)
+    parser.add_argument('--derive-missing', action='store_true',
+                        help="Generate formats the export didn't write from the .h5")
+    parser.add_argument('--compare', default=None, help="Earlier benchmark JSON to diff against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Relative slowdown flagged as a regression in --compare")
+    parser.add_argument('--load-runs', type=int, default=1,
+                        help="Cold loads per format/thread setting (median is reported)")
+    parser.add_argument('--markdown', default=None,
+                        help="Also write the load-time / memory comparison as a Markdown table")
+    parser.add_argument('--registry', default=None,
+                        help="Also store the results with the model's build in this registry")
+    # Internal: single measurement in a fresh process
+    parser.add_argument('--probe', nargs=2, metavar=('FORMAT', 'PATH'), help=argparse.SUPPRESS)
+    parser.add_argument('--probe-threads', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--input-shape', default='14,32', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    batch_sizes = [int(b) for b in args.batch_sizes.split(',')]
+    input_shape = [int(d) for d in args.input_shape.split(',')]
+
+    if args.probe:
+        print(json.dumps(probe(args.probe[0], args.probe[1], args.probe_threads,
+                               batch_sizes, input_shape)))
+        return 0
+
+    print("="*80)
+    print(" "*22 + "INFERENCE & COLD-START BENCHMARK")
+    print("="*80)
+
+    metadata_path = os.path.join(args.model_dir, 'model_metadata.json')
+    metadata = {}
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+    if 'n_features' in metadata:
+        input_shape = [metadata['sequence_length'], metadata['n_features']]
+
+    work_dir = os.path.join(args.output_dir, 'derived_models')
+    artifacts = find_artifacts(args.model_dir, args.derive_missing, work_dir)
+    formats = [fmt for fmt in args.formats.split(',') if fmt in artifacts]
+    if not formats:
+        print(f"❌ No model artifacts found in {args.model_dir}")
+        return 1
+
+    print("\n[1/2] Import times...")
+    imports = {module: measure_import(module, args.import_runs)
+               for module in ['numpy', 'tensorflow']}
+    for module, stats in imports.items():
+        print(f"   • {module:11} {stats['median_s']*1000:8.1f} ms")
+
+    print("\n[2/2] Load, first prediction and steady state per format...")
+    results = []
+    for fmt in formats:
+        for threads in [int(t) for t in args.threads.split(',')]:
+            r = run_probes(fmt, artifacts[fmt], threads, batch_sizes, input_shape, args.load_runs)
+            r['size_kb'] = artifact_size_kb(artifacts[fmt])
+            results.append(r)
+            if 'error' in r:
+                print(f"   ✗ {fmt:10} threads={r['threads']}: {r['error']}")
+                continue
+            b1 = r['steady_state'].get('1', {})
+            print(f"   • {fmt:10} threads={str(r['threads']):7} load {r['load_s']*1000:8.1f} ms | "
+                  f"first {r['first_predict_ms']:7.1f} ms | p50@1 {b1.get('p50_ms', float('nan')):6.2f} ms")
+
+    reference = artifacts.get('h5') or artifacts[formats[0]]
+    from model_formats import artifact_sha256
+    model_hash = artifact_sha256(reference)[:12]
+    version = metadata.get('model_version', 'unversioned')
+    report = {
+        'schema_version': SCHEMA_VERSION,
+        'created_at': datetime.now().isoformat(),
+        'model': {
+            'version': version,
+            'sha256_12': model_hash,
+            'metadata': metadata,
+            'artifacts': {fmt: artifacts[fmt] for fmt in formats},
+        },
+        'host': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+        },
+        'batch_sizes': batch_sizes,
+        'imports': imports,
+        'results': results,
+    }
+    try:
+        import tensorflow as tf
+        report['host']['tensorflow'] = tf.__version__
+    except ImportError:
+        pass
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    output = os.path.join(args.output_dir, f"inference_{version}_{model_hash}_{stamp}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results written to {output}")
+
+    if args.markdown:
+        with open(args.markdown, 'w') as f:
+            f.write(f"# Model load comparison - {version} ({model_hash})\n\n"
+                    f"{platform.platform()}, TensorFlow already imported, "
+                    f"{args.load_runs} cold load(s) per row.\n\n")
+            f.write(load_table(results))
+        print(f"✓ Load comparison written to {args.markdown}")
+
+    if args.registry and metadata.get('registry_key'):
+        from model_registry import ModelRegistry
+        ModelRegistry(args.registry).attach_benchmarks(metadata['registry_key'], 'inference', {
+            'report': output,
+            'created_at': report['created_at'],
+            'results': [{key: r[key] for key in ('format', 'threads', 'load_s', 'first_predict_ms',
+                                                 'steady_state', 'size_kb') if key in r}
+                        for r in results if 'error' not in r],
+        })
+        print(f"✓ Stored with build {version} in {args.registry}/")
+    elif args.registry:
+        print("⚠ Model metadata has no registry_key - results not stored in the registry")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n⚠ {regressions} metric(s) slower than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
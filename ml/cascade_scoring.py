@@ -0,0 +1,232 @@
+"""
+Grounded App - Cascade Scoring
+Answers clear-cut windows with a rule lookup and runs the neural net only on
+the rest.
+
+The labels come from GroundedDataGenerator._calculate_risk_score. For the
+predicted day, two of its inputs are already known from the window:
+
+    recent use      use days among the last 7 (>= 5 → +0.3, >= 3 → +0.15)
+    used yesterday  raises today's chance of use and today's craving
+
+Every other term (context, amount, mood, sleep, craving, use) belongs to
+the day being predicted. The rule stage keys each window by
+(recent use count, used yesterday) and looks up the positive rate of that
+bucket in the training windows. Buckets whose rate is at or below
+--low (or at or above --high) with enough support are resolved by the
+lookup; their rate is the score. All other windows go to the model. The
+stage is a few numpy operations on the window array, so it costs
+microseconds per batch.
+
+Reported for each --low setting: share of test windows routed to the model,
+throughput of the cascade vs model-only, and AUC / accuracy / recall /
+F1 of both on the same test split as traning_scriptv1.py.
+
+Usage:
+    python cascade_scoring.py --model-dir models
+    python cascade_scoring.py --low 0.005,0.01,0.02 --save-rules models/cascade_rules.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+
+RECENT_DAYS = 7  # same look-back as the frequency term of _calculate_risk_score
+
+
+def model_scores(model, X, batch_size=4096):
+    """
+    Model scores via predict_on_batch. model.predict adds ~100 ms of fixed
+    per-call overhead, which would hide the cost the cascade saves.
+    """
+    scores = [np.asarray(model.predict_on_batch(X[start:start + batch_size]))[:, 0]
+              for start in range(0, len(X), batch_size)]
+    return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+
+def rule_keys(X, none_column):
+    """
+    Bucket index per window: recent use count (0-7) * 2 + used yesterday.
+    A day counts as a use day when its 'none' context flag is off.
+    """
+    used = X[:, :, none_column] < 0.5
+    recent = used[:, -RECENT_DAYS:].sum(axis=1)
+    return recent * 2 + used[:, -1]
+
+
+class CascadeScorer:
+    """
+    Rule lookup in front of a Keras model.
+    """
+
+    def __init__(self, model, none_column, low=0.01, high=0.99, min_support=50):
+        self.model = model
+        self.none_column = none_column
+        self.low = low
+        self.high = high
+        self.min_support = min_support
+        self.rates = None
+        self.counts = None
+
+    def fit(self, X, y):
+        """Positive rate and support of every bucket on training windows."""
+        keys = rule_keys(X, self.none_column)
+        n_buckets = (RECENT_DAYS + 1) * 2
+        self.counts = np.bincount(keys, minlength=n_buckets)
+        positives = np.bincount(keys, weights=np.asarray(y, dtype=float), minlength=n_buckets)
+        self.rates = positives / np.maximum(self.counts, 1)
+        return self
+
+    def confident(self):
+        """Which buckets the rule stage answers on its own."""
+        return (self.counts >= self.min_support) & ((self.rates <= self.low) | (self.rates >= self.high))
+
+    def route(self, X):
+        """(resolved mask, rule scores) for a batch of windows."""
+        keys = rule_keys(X, self.none_column)
+        return self.confident()[keys], self.rates[keys]
+
+    def predict(self, X, batch_size=4096):
+        """Scores for all windows and the mask of those the model scored."""
+        resolved, scores = self.route(X)
+        routed = ~resolved
+        if routed.any():
+            scores = scores.copy()
+            scores[routed] = model_scores(self.model, X[routed], batch_size)
+        return scores, routed
+
+    def save_rules(self, path):
+        """Bucket table for the app, which can skip the model the same way."""
+        confident = self.confident()
+        buckets = [{'recent_use_days': key // 2, 'used_yesterday': bool(key % 2),
+                    'rate': float(self.rates[key]), 'support': int(self.counts[key]),
+                    'resolved': bool(confident[key])}
+                   for key in range(len(self.rates))]
+        with open(path, 'w') as f:
+            json.dump({'recent_days': RECENT_DAYS, 'none_column': self.none_column,
+                       'low': self.low, 'high': self.high, 'min_support': self.min_support,
+                       'buckets': buckets}, f, indent=2)
+
+
+def throughput(predict, X, runs=20):
+    """Windows per second (median of `runs` full passes after one warm-up)."""
+    predict(X)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        predict(X)
+        times.append(time.perf_counter() - start)
+    return len(X) / float(np.median(times))
+
+
+def metrics_of(y, scores, threshold=0.5):
+    from evaluation import StreamingEvaluator
+    evaluator = StreamingEvaluator()
+    evaluator.update(y, scores)
+    result = evaluator.result(threshold)
+    return {name: float(result[name]) for name in ['auc', 'pr_auc', 'accuracy', 'precision', 'recall', 'f1']}
+
+
+def evaluate_cascade(cascade, X_test, y_test, runs=20, threshold=0.5):
+    """Model-only vs cascade on the same windows."""
+    baseline = model_scores(cascade.model, X_test)
+    cascade_scores, routed = cascade.predict(X_test)
+    resolved = ~routed
+    return {
+        'routed_fraction': float(routed.mean()),
+        'resolved_positives': int(y_test[resolved].sum()),
+        'model_throughput': throughput(lambda x: model_scores(cascade.model, x), X_test, runs),
+        'cascade_throughput': throughput(cascade.predict, X_test, runs),
+        'model': metrics_of(y_test, baseline, threshold),
+        'cascade': metrics_of(y_test, cascade_scores, threshold),
+        # Decisions at the threshold that differ from model-only
+        'decision_changes': int(np.sum((baseline >= threshold) != (cascade_scores >= threshold))),
+    }
+
+
+def print_results(results):
+    print(f"\n{'Low':>6} {'Routed':>7} {'Model w/s':>10} {'Cascade w/s':>12} {'Gain':>6} "
+          f"{'AUC':>15} {'Recall':>15} {'F1':>15}")
+    print("─"*95)
+    for low, r in results.items():
+        m, c = r['model'], r['cascade']
+        gain = r['cascade_throughput'] / r['model_throughput']
+        print(f"{low:>6} {r['routed_fraction']*100:6.1f}% {r['model_throughput']:10,.0f} "
+              f"{r['cascade_throughput']:12,.0f} {gain:5.2f}× "
+              f"{m['auc']:.4f}→{c['auc']:.4f} {m['recall']:.4f}→{c['recall']:.4f} {m['f1']:.4f}→{c['f1']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rule pre-filter + model cascade")
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--n-users', type=int, default=100)
+    parser.add_argument('--days-per-user', type=int, default=90)
+    parser.add_argument('--low', default='0.005,0.01,0.02,0.05',
+                        help="Comma-separated bucket rates at or below which the rule decides")
+    parser.add_argument('--high', type=float, default=0.99)
+    parser.add_argument('--min-support', type=int, default=50, help="Training windows a bucket needs")
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--runs', type=int, default=20, help="Timed passes per throughput number")
+    parser.add_argument('--save-rules', default=None, help="Write the bucket table (first --low) as JSON")
+    parser.add_argument('--output', default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    import joblib
+    from sklearn.model_selection import train_test_split
+    from model_formats import load_keras_model
+    from traning_scriptv1 import GroundedDataGenerator, DataPreprocessor
+
+    print("="*80)
+    print(" "*30 + "CASCADE SCORING")
+    print("="*80)
+
+    model, fmt = load_keras_model(args.model_dir)
+    preprocessor = DataPreprocessor()
+    preprocessor.scaler = joblib.load(os.path.join(args.model_dir, 'feature_scaler.pkl'))
+    print(f"\n✓ Model loaded ({fmt})")
+
+    # Same data and split as traning_scriptv1.main()
+    np.random.seed(42)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = GroundedDataGenerator().generate_multi_user_dataset(args.n_users, args.days_per_user)
+    X, y = preprocessor.create_sequences(preprocessor.prepare_features(data), data['risk_label'].values,
+                                         sequence_length=14, user_ids=data['user_id'].values,
+                                         day_nums=data['day_num'].values)
+    X = X.astype(np.float32)
+    idx_train, idx_test = train_test_split(np.arange(len(y)), test_size=0.2, random_state=42, stratify=y)
+    X_test, y_test = X[idx_test], y[idx_test]
+    print(f"✓ {len(idx_train):,} windows for the bucket table | {len(idx_test):,} test windows")
+
+    none_column = preprocessor.contexts.index('none')
+    results = {}
+    for low in [float(value) for value in args.low.split(',')]:
+        cascade = CascadeScorer(model, none_column, low, args.high, args.min_support).fit(X[idx_train], y[idx_train])
+        results[str(low)] = evaluate_cascade(cascade, X_test, y_test, args.runs, args.threshold)
+        if args.save_rules and len(results) == 1:
+            cascade.save_rules(args.save_rules)
+            print(f"✓ Rules written to {args.save_rules}")
+
+    print_results(results)
+    for low, r in results.items():
+        print(f"   • low={low}: {r['resolved_positives']} positive windows answered by the rule, "
+              f"{r['decision_changes']} decisions changed at {args.threshold}")
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'settings': vars(args), 'model_format': fmt, 'results': results}, f, indent=2)
+        print(f"\n✓ Report written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Grounded App - Sequence Windowing Check
+Compares DataPreprocessor.create_sequences (vectorized, sliding_window_view)
+with the original per-window loop it replaced, so the training windows are
+known to be unchanged: same X, same y, same window order.
+
+With user_ids the reference is the same loop with windows that span two
+users dropped. Inputs shorter than one window must give empty arrays.
+
+Usage:
+    python check_sequences.py
+"""
+
+import contextlib
+import io
+import sys
+
+import numpy as np
+
+
+def reference_sequences(features, labels, sequence_length=14, user_ids=None):
+    """The loop create_sequences used before it was vectorized."""
+    X, y, rows = [], [], []
+    for i in range(len(features) - sequence_length):
+        if user_ids is not None and user_ids[i] != user_ids[i + sequence_length]:
+            continue
+        X.append(features[i:i + sequence_length])
+        y.append(labels[i + sequence_length])
+        rows.append(i + sequence_length)
+    n_features = np.asarray(features).shape[1]
+    X = np.array(X) if X else np.empty((0, sequence_length, n_features))
+    return X, np.array(y, dtype=np.asarray(labels).dtype), np.array(rows, dtype=int)
+
+
+def check_case(name, preprocessor, features, labels, sequence_length=14, user_ids=None):
+    """Run both implementations on one input; print and return whether they match."""
+    expected_X, expected_y, expected_rows = reference_sequences(features, labels, sequence_length, user_ids)
+    try:
+        X, y = preprocessor.create_sequences(features, labels, sequence_length, user_ids=user_ids)
+    except Exception as e:
+        print(f"❌ {name}: raised {type(e).__name__}: {e}")
+        return False
+
+    problems = []
+    if X.shape != expected_X.shape:
+        problems.append(f"X shape {X.shape} != {expected_X.shape}")
+    elif not np.array_equal(X, expected_X):
+        problems.append("X values differ")
+    if not np.array_equal(y, expected_y):
+        problems.append("y differs")
+    if not np.array_equal(preprocessor.window_index['row'].values, expected_rows):
+        problems.append("window order / target rows differ")
+
+    if problems:
+        print(f"❌ {name}: {'; '.join(problems)}")
+        return False
+    print(f"✓ {name}: {len(y)} windows match")
+    return True
+
+
+def main():
+    from traning_scriptv1 import GroundedDataGenerator, DataPreprocessor
+
+    np.random.seed(7)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = GroundedDataGenerator().generate_multi_user_dataset(n_users=4, days_per_user=30)
+    preprocessor = DataPreprocessor()
+    features = preprocessor.prepare_features(data)
+    labels = data['risk_label'].values
+    user_ids = data['user_id'].values
+
+    print("="*60)
+    print("CREATE_SEQUENCES EQUIVALENCE CHECK")
+    print("="*60)
+
+    results = [
+        check_case("4 users, no user_ids", preprocessor, features, labels),
+        check_case("4 users, user-bounded", preprocessor, features, labels, user_ids=user_ids),
+        check_case("4 users, 7-day windows", preprocessor, features, labels, 7, user_ids),
+        check_case("10 rows (shorter than a window)", preprocessor, features[:10], labels[:10]),
+        check_case("10 rows, user-bounded", preprocessor, features[:10], labels[:10], user_ids=user_ids[:10]),
+        check_case("exactly 14 rows", preprocessor, features[:14], labels[:14], user_ids=user_ids[:14]),
+        check_case("15 rows", preprocessor, features[:15], labels[:15], user_ids=user_ids[:15]),
+    ]
+
+    print("="*60)
+    if all(results):
+        print("✓ All cases match the reference loop")
+        return 0
+    print(f"❌ {results.count(False)} case(s) differ")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
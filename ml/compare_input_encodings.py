@@ -0,0 +1,165 @@
+"""
+Grounded App - One-Hot vs Embedding Input Comparison
+Trains the model with both categorical encodings on the same data and
+compares accuracy, size and latency.
+
+    onehot      (days, 32) float input; 23 of the columns are one-hot
+    embedding   (days, 4) int32 category codes + (days, 9) numerics, with a
+                shared 23 × embedding_dim table inside the model
+
+Reported per variant: parameters, input bytes per window, first-layer
+multiply-adds, test AUC, .h5 / .tflite size, TFLite batch-1 latency and
+Keras batch-256 latency.
+
+Usage:
+    python compare_input_encodings.py --epochs 20 --output reports/input_encodings.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from batch_features import CATEGORY_FIELDS, split_onehot
+
+
+def first_layer_macs(model):
+    """Multiply-adds of the first Conv1D/recurrent layer for one window."""
+    for layer in model.layers:
+        kind = layer.__class__.__name__
+        if kind == 'Conv1D':
+            steps, channels = layer.input.shape[1:]
+            return int(steps * layer.kernel_size[0] * channels * layer.filters)
+        if kind in ('LSTM', 'GRU'):
+            steps, channels = layer.input.shape[1:]
+            gates = 4 if kind == 'LSTM' else 3
+            return int(steps * gates * layer.units * channels)
+    return None
+
+
+def input_bytes(x):
+    parts = x if isinstance(x, (list, tuple)) else [x]
+    return int(sum(part[0].nbytes for part in parts))
+
+
+def take(x, idx):
+    return [part[idx] for part in x] if isinstance(x, (list, tuple)) else x[idx]
+
+
+def evaluate_variant(name, model, X_test, y_test, workdir, threads=1):
+    """Size, latency and AUC for one trained model."""
+    from benchmark_inference import time_calls
+    from evaluation import StreamingEvaluator
+    from model_formats import _keras_predict, load_tflite, save_format
+
+    evaluator = StreamingEvaluator()
+    evaluator.update(y_test, model.predict(X_test, batch_size=4096, verbose=0)[:, 0])
+
+    h5_path = save_format(model, 'h5', os.path.join(workdir, f'{name}.h5'))
+    tflite_path = save_format(model, 'tflite', os.path.join(workdir, f'{name}.tflite'))
+
+    tflite_predict = load_tflite(tflite_path, num_threads=threads)
+    keras_predict = _keras_predict(model)
+    tflite_ms = time_calls(tflite_predict, take(X_test, slice(0, 1)), min_iters=200, max_iters=2000)
+    keras_ms = time_calls(keras_predict, take(X_test, slice(0, 256)))
+
+    # TFLite and Keras should agree on the same window
+    drift = float(np.abs(tflite_predict(take(X_test, slice(0, 1)))
+                         - keras_predict(take(X_test, slice(0, 1)))).max())
+
+    return {
+        'params': int(model.count_params()),
+        'input_bytes_per_window': input_bytes(X_test),
+        'first_layer_macs': first_layer_macs(model),
+        'test_auc': evaluator.roc_auc(),
+        'h5_kb': os.path.getsize(h5_path) / 1024,
+        'tflite_kb': os.path.getsize(tflite_path) / 1024,
+        'tflite_b1_p50_ms': float(np.percentile(tflite_ms, 50)),
+        'keras_b256_p50_ms': float(np.percentile(keras_ms, 50)),
+        'tflite_vs_keras_max_diff': drift,
+    }
+
+
+def print_comparison(results):
+    onehot, embedding = results['onehot'], results['embedding']
+    print(f"\n{'':26} {'one-hot':>12} {'embedding':>12} {'change':>9}")
+    print("─"*62)
+    for key, label in [('params', 'Parameters'),
+                       ('input_bytes_per_window', 'Input bytes / window'),
+                       ('first_layer_macs', 'First-layer MACs'),
+                       ('h5_kb', '.h5 size (KB)'),
+                       ('tflite_kb', '.tflite size (KB)'),
+                       ('tflite_b1_p50_ms', 'TFLite p50 @1 (ms)'),
+                       ('keras_b256_p50_ms', 'Keras p50 @256 (ms)'),
+                       ('test_auc', 'Test AUC')]:
+        a, b = onehot[key], embedding[key]
+        change = f"{(b - a) / a:+.0%}" if a else ''
+        fmt = '{:12.4f}' if isinstance(a, float) else '{:12,}'
+        print(f"{label:26} {fmt.format(a)} {fmt.format(b)} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare one-hot and embedding categorical inputs")
+    parser.add_argument('--n-users', type=int, default=100)
+    parser.add_argument('--days-per-user', type=int, default=90)
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--embedding-dim', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=1, help="TFLite interpreter threads")
+    parser.add_argument('--output', default=None, help="Write the comparison as JSON")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    from sklearn.model_selection import train_test_split
+    from traning_scriptv1 import GroundedDataGenerator, DataPreprocessor, train_model
+
+    print("="*80)
+    print(" "*20 + "ONE-HOT vs EMBEDDING CATEGORICAL INPUTS")
+    print("="*80)
+
+    np.random.seed(42)
+    data = GroundedDataGenerator().generate_multi_user_dataset(args.n_users, args.days_per_user)
+    preprocessor = DataPreprocessor()
+    features = preprocessor.prepare_features(data)
+    X, y = preprocessor.create_sequences(features, data['risk_label'].values, sequence_length=14,
+                                         user_ids=data['user_id'].values,
+                                         day_nums=data['day_num'].values)
+    X = X.astype(np.float32)
+
+    idx_train, idx_test = train_test_split(np.arange(len(y)), test_size=0.2, random_state=42, stratify=y)
+    idx_train, idx_val = train_test_split(idx_train, test_size=0.2, random_state=42, stratify=y[idx_train])
+    variants = {'onehot': X, 'embedding': list(split_onehot(X))}
+    print(f"\n✓ {len(y):,} windows | {len(CATEGORY_FIELDS)} categorical fields")
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix='input_encodings_')
+    for name, inputs in variants.items():
+        print(f"\n[{name}] Training {args.epochs} epochs...")
+        tf.random.set_seed(42)
+        with contextlib.redirect_stdout(io.StringIO()):
+            model, _ = train_model(take(inputs, idx_train), y[idx_train],
+                                   take(inputs, idx_val), y[idx_val],
+                                   epochs=args.epochs, categorical_input=name)
+        results[name] = evaluate_variant(name, model, take(inputs, idx_test), y[idx_test],
+                                         workdir, args.threads)
+        print(f"   ✓ AUC {results[name]['test_auc']:.4f} | "
+              f"TFLite {results[name]['tflite_kb']:.1f} KB, {results[name]['tflite_b1_p50_ms']:.3f} ms")
+
+    print_comparison(results)
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+        print(f"\n✓ Comparison written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
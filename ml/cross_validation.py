@@ -0,0 +1,266 @@
+"""
+Grounded App - User-Grouped Cross-Validation
+K-fold cross-validation where every user's windows stay in one fold.
+
+main() splits windows with a stratified train_test_split, so consecutive
+windows of the same user (which overlap by 13 of 14 days) land on both sides
+of the split and the test AUC is optimistic. Here folds come from
+GroupKFold over user_id, and the early-stopping validation set is also
+carved out by user. The MinMax scaler is refitted in every fold on that
+fold's training users only, so the held-out users' ranges never leak into
+the scaling.
+
+Folds train in parallel worker processes, each with its own TensorFlow
+thread budget so the workers don't oversubscribe the CPU. Metrics are
+reported as mean ± std over folds, together with the wall-time speedup over
+running the same folds one after another.
+
+Usage:
+    python cross_validation.py --folds 5 --workers 5
+    python cross_validation.py --folds 5 --compare-serial     # measure the real speedup
+    python traning_scriptv1.py --cv-folds 5                   # same, from the training script
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.model_selection import GroupKFold, GroupShuffleSplit
+
+
+SUMMARY_METRICS = ['auc', 'pr_auc', 'accuracy', 'precision', 'recall', 'f1', 'loss', 'ece']
+
+# Per-process training data, set up once by _init_worker
+_worker = {}
+
+
+def pin_threads(threads):
+    """Give a fresh worker process its TensorFlow thread budget (0 = TF default)."""
+
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    if threads:
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+
+def worker_pool(workers, initializer, initargs):
+    """
+    Process pool for TensorFlow work. The parent has TensorFlow loaded and
+    forking it is unsafe, so workers are spawned as fresh interpreters.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=initializer, initargs=initargs)
+
+
+def _init_worker(X, y, n_scaled, threads):
+    """Pin the thread budget before TensorFlow starts, then keep the data."""
+    pin_threads(threads)
+    _worker['X'] = X
+    _worker['y'] = y
+    _worker['n_scaled'] = n_scaled
+
+
+def unscale_windows(X, scaler):
+    """
+    Windows with a fitted MinMaxScaler undone on their trailing numerical
+    columns (DataPreprocessor puts them last), ready for scale_fold.
+    """
+    X = np.array(X, dtype=np.float32)
+    n_scaled = len(scaler.scale_)
+    X[..., -n_scaled:] = (X[..., -n_scaled:] - scaler.min_) / scaler.scale_
+    return X
+
+
+def scale_fold(X, train_idx, val_idx, test_idx, n_scaled):
+    """
+    (X_train, X_val, X_test) of one fold, MinMax-scaled with a scaler fitted
+    on the days in the training and validation users' windows.
+    """
+    from sklearn.preprocessing import MinMaxScaler
+
+    fit_rows = np.r_[train_idx, val_idx]
+    scaler = MinMaxScaler().fit(X[fit_rows, :, -n_scaled:].reshape(-1, n_scaled))
+
+    def scaled(idx):
+        part = X[idx]
+        part[..., -n_scaled:] = part[..., -n_scaled:] * scaler.scale_ + scaler.min_
+        return part
+
+    return scaled(train_idx), scaled(val_idx), scaled(test_idx)
+
+
+def make_folds(y, user_ids, n_folds=5, val_fraction=0.2, seed=42):
+    """
+    (train_idx, val_idx, test_idx) per fold. Test users come from GroupKFold;
+    validation users are drawn from the remaining training users.
+    """
+    folds = []
+    for fold, (train_idx, test_idx) in enumerate(GroupKFold(n_splits=n_folds).split(y, y, user_ids)):
+        splitter = GroupShuffleSplit(n_splits=1, test_size=val_fraction, random_state=seed + fold)
+        fit_part, val_part = next(splitter.split(train_idx, groups=user_ids[train_idx]))
+        folds.append((train_idx[fit_part], train_idx[val_part], test_idx))
+    return folds
+
+
+def run_fold(fold, train_idx, val_idx, test_idx, model_type='hybrid', epochs=100, seed=42):
+    """Train and evaluate one fold. Runs in a worker (or inline for serial runs)."""
+
+    from tensorflow import keras
+    from evaluation import evaluate_arrays
+    from traning_scriptv1 import train_model
+
+    # Seeds Python, NumPy and TensorFlow - and with them Keras' initializers
+    keras.utils.set_random_seed(seed + fold)
+    y = _worker['y']
+    X_train, X_val, X_test = scale_fold(_worker['X'], train_idx, val_idx, test_idx, _worker['n_scaled'])
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        model, history = train_model(X_train, y[train_idx], X_val, y[val_idx],
+                                     model_type=model_type, epochs=epochs)
+    train_s = time.perf_counter() - start
+
+    metrics = evaluate_arrays(model, X_test, y[test_idx]).result(threshold=0.5)
+    return {
+        'fold': fold,
+        'n_train': len(train_idx),
+        'n_val': len(val_idx),
+        'n_test': len(test_idx),
+        'epochs_run': len(history.history['loss']),
+        'train_s': train_s,
+        'wall_s': time.perf_counter() - start,
+        **{name: float(metrics[name]) for name in SUMMARY_METRICS},
+    }
+
+
+def run_folds(X, y, n_scaled, folds, workers, threads, model_type='hybrid', epochs=100):
+    """
+    Run every fold; workers=1 runs them in this process. Returns (results, wall_s).
+    """
+    def report(r):
+        print(f"   • Fold {r['fold'] + 1}: AUC {r['auc']:.4f} | "
+              f"{r['epochs_run']} epochs in {r['train_s']:.1f} s")
+        return r
+
+    start = time.perf_counter()
+    if workers <= 1:
+        _init_worker(X, y, n_scaled, threads)
+        results = [report(run_fold(i, *fold, model_type=model_type, epochs=epochs))
+                   for i, fold in enumerate(folds)]
+        return results, time.perf_counter() - start
+
+    with worker_pool(workers, _init_worker, (X, y, n_scaled, threads)) as pool:
+        futures = [pool.submit(run_fold, i, *fold, model_type=model_type, epochs=epochs)
+                   for i, fold in enumerate(folds)]
+        results = [report(future.result()) for future in futures]
+    return results, time.perf_counter() - start
+
+
+def summarize(results):
+    """Mean and std of each metric over folds."""
+    return {name: {'mean': float(np.mean([r[name] for r in results])),
+                   'std': float(np.std([r[name] for r in results]))}
+            for name in SUMMARY_METRICS}
+
+
+def cross_validate(X, y, user_ids, scaler, n_folds=5, workers=None, threads=None,
+                   model_type='hybrid', epochs=100, compare_serial=False, seed=42):
+    """
+    Grouped K-fold CV of the training pipeline. X are windows as
+    DataPreprocessor builds them and scaler the one prepare_features fitted;
+    it is undone and refitted per fold. Returns a report dict with per-fold
+    results, mean ± std metrics and timings.
+    """
+    # More workers than cores only adds contention (and one TF start-up per worker)
+    workers = workers or min(n_folds, os.cpu_count() or 1)
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    folds = make_folds(y, np.asarray(user_ids), n_folds, seed=seed)
+    X = unscale_windows(X, scaler)
+    n_scaled = len(scaler.scale_)
+
+    print(f"\n🔀 {n_folds} user-grouped folds | {workers} workers × {threads} threads")
+    results, parallel_s = run_folds(X, y, n_scaled, folds, workers, threads, model_type, epochs)
+    report = {
+        'n_folds': n_folds,
+        'workers': workers,
+        'threads_per_worker': threads,
+        'model_type': model_type,
+        'folds': results,
+        'summary': summarize(results),
+        'parallel_s': parallel_s,
+        # How many folds were effectively running at once
+        'concurrency': sum(r['wall_s'] for r in results) / parallel_s,
+    }
+
+    if compare_serial:
+        print("\n⏱  Re-running folds serially for the speedup baseline...")
+        serial_results, serial_s = run_folds(X, y, n_scaled, folds, 1, 0, model_type, epochs)
+        report['serial_s'] = serial_s
+        report['speedup'] = serial_s / parallel_s
+        report['serial_summary'] = summarize(serial_results)
+
+    return report
+
+
+def print_report(report):
+    print("\n📊 Cross-validation (mean ± std over folds):")
+    for name, stats in report['summary'].items():
+        print(f"   • {name:10} {stats['mean']:.4f} ± {stats['std']:.4f}")
+
+    print(f"\n⏱  Parallel wall time: {report['parallel_s']:.1f} s "
+          f"(≈{report['concurrency']:.1f} folds running at once)")
+    if 'speedup' in report:
+        print(f"   Serial wall time:   {report['serial_s']:.1f} s → speedup ×{report['speedup']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="User-grouped K-fold cross-validation")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=None, help="Default: one per fold, up to the core count")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="TF threads per worker (default: cores / workers)")
+    parser.add_argument('--model-type', default='hybrid', choices=['hybrid', 'lstm', 'gru'])
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--n-users', type=int, default=100)
+    parser.add_argument('--days-per-user', type=int, default=90)
+    parser.add_argument('--compare-serial', action='store_true',
+                        help="Also run the folds serially and report the speedup")
+    parser.add_argument('--output', default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    from traning_scriptv1 import GroundedDataGenerator, DataPreprocessor
+
+    print("="*80)
+    print(" "*22 + "USER-GROUPED CROSS-VALIDATION")
+    print("="*80)
+
+    data = GroundedDataGenerator().generate_multi_user_dataset(args.n_users, args.days_per_user)
+    preprocessor = DataPreprocessor()
+    features = preprocessor.prepare_features(data)
+    X, y = preprocessor.create_sequences(features, data['risk_label'].values, sequence_length=14,
+                                         user_ids=data['user_id'].values,
+                                         day_nums=data['day_num'].values)
+
+    report = cross_validate(X, y, preprocessor.window_index['user_id'].values, preprocessor.scaler,
+                            args.folds, args.workers, args.threads, args.model_type, args.epochs,
+                            args.compare_serial)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Report written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""
+Grounded App - Single-Pass Evaluation
+Computes every evaluation metric from one batched inference pass.
+
+evaluate_model used to run the test set through the model twice
+(model.predict for the report, model.evaluate for loss/accuracy/AUC).
+StreamingEvaluator instead takes scores batch by batch and keeps only
+fixed-size accumulators - per-bin positive/negative counts, loss sum and
+calibration sums - so the same code handles an in-memory test set or
+sharded test sets that never fit in memory at once.
+
+From those accumulators it reports:
+    • loss (binary cross-entropy, same clipping as Keras), accuracy
+    • ROC AUC and PR AUC
+    • confusion matrix, precision, recall, F1 at any threshold
+    • precision/recall curve over all thresholds
+    • calibration (reliability) bins
+
+Usage:
+    python evaluation.py --model models/grounded_model.h5 --shards "data/test_*.npz"
+"""
+
+import argparse
+import glob
+import json
+import sys
+
+import numpy as np
+
+
+EPSILON = 1e-7  # keras.backend.epsilon(), used to clip scores in the loss
+
+
+class StreamingEvaluator:
+    """
+    Accumulates binary classification metrics over batches of scores.
+    """
+
+    def __init__(self, n_bins=10_000, n_calibration_bins=10):
+        self.n_bins = n_bins
+        self.n_calibration_bins = n_calibration_bins
+        self.pos = np.zeros(n_bins, dtype=np.int64)
+        self.neg = np.zeros(n_bins, dtype=np.int64)
+        self.loss_sum = 0.0
+        self.count = 0
+        self.cal_count = np.zeros(n_calibration_bins, dtype=np.int64)
+        self.cal_score = np.zeros(n_calibration_bins)
+        self.cal_label = np.zeros(n_calibration_bins)
+
+    def update(self, y_true, y_score):
+        """Add one batch of labels (0/1) and scores (0-1)."""
+        y_true = np.asarray(y_true).reshape(-1).astype(bool)
+        y_score = np.asarray(y_score, dtype=np.float64).reshape(-1)
+
+        bins = np.minimum((y_score * self.n_bins).astype(np.int64), self.n_bins - 1)
+        self.pos += np.bincount(bins[y_true], minlength=self.n_bins)
+        self.neg += np.bincount(bins[~y_true], minlength=self.n_bins)
+
+        clipped = np.clip(y_score, EPSILON, 1 - EPSILON)
+        self.loss_sum -= np.sum(np.where(y_true, np.log(clipped), np.log(1 - clipped)))
+        self.count += len(y_true)
+
+        cal = np.minimum((y_score * self.n_calibration_bins).astype(np.int64),
+                         self.n_calibration_bins - 1)
+        self.cal_count += np.bincount(cal, minlength=self.n_calibration_bins)
+        self.cal_score += np.bincount(cal, weights=y_score, minlength=self.n_calibration_bins)
+        self.cal_label += np.bincount(cal, weights=y_true.astype(float),
+                                      minlength=self.n_calibration_bins)
+
+    def confusion_at(self, threshold=0.5):
+        """
+        [[TN, FP], [FN, TP]] treating score > threshold as high risk.
+        Exact for thresholds on the bin grid (0.5 always is).
+        """
+        cut = int(np.floor(threshold * self.n_bins))
+        # A score exactly equal to the threshold lands on the high side here,
+        # which is negligible for float scores
+        tp = int(self.pos[cut:].sum())
+        fp = int(self.neg[cut:].sum())
+        fn = int(self.pos[:cut].sum())
+        tn = int(self.neg[:cut].sum())
+        return np.array([[tn, fp], [fn, tp]])
+
+    def threshold_curve(self):
+        """Precision, recall and FPR with the threshold at every bin edge."""
+        tp = np.cumsum(self.pos[::-1])[::-1]
+        fp = np.cumsum(self.neg[::-1])[::-1]
+        total_pos = max(self.pos.sum(), 1)
+        total_neg = max(self.neg.sum(), 1)
+        thresholds = np.arange(self.n_bins) / self.n_bins
+        with np.errstate(invalid='ignore', divide='ignore'):
+            precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+        return thresholds, precision, tp / total_pos, fp / total_neg
+
+    def roc_auc(self):
+        """Mann-Whitney AUC from the binned counts (ties within a bin count half)."""
+        n_pos, n_neg = self.pos.sum(), self.neg.sum()
+        if n_pos == 0 or n_neg == 0:
+            return float('nan')
+        neg_below = np.cumsum(self.neg) - self.neg
+        wins = np.sum(self.pos * neg_below) + 0.5 * np.sum(self.pos * self.neg)
+        return float(wins / (n_pos * n_neg))
+
+    def pr_auc(self):
+        """Area under the precision/recall curve (step interpolation)."""
+        _, precision, recall, _ = self.threshold_curve()
+        # Walk from the highest threshold down so recall increases
+        precision, recall = precision[::-1], recall[::-1]
+        return float(np.sum(np.diff(np.r_[0.0, recall]) * precision))
+
+    def calibration(self):
+        """Mean score vs observed high-risk rate per score bin."""
+        rows = []
+        for i in range(self.n_calibration_bins):
+            n = int(self.cal_count[i])
+            rows.append({
+                'bin': f"{i / self.n_calibration_bins:.1f}-{(i + 1) / self.n_calibration_bins:.1f}",
+                'count': n,
+                'mean_score': float(self.cal_score[i] / n) if n else None,
+                'observed_rate': float(self.cal_label[i] / n) if n else None,
+            })
+        return rows
+
+    def expected_calibration_error(self):
+        mask = self.cal_count > 0
+        gap = np.abs(self.cal_score[mask] - self.cal_label[mask])
+        return float(gap.sum() / max(self.count, 1))
+
+    def result(self, threshold=0.5, curve_points=101):
+        """All metrics as a plain dict."""
+        cm = self.confusion_at(threshold)
+        (tn, fp), (fn, tp) = cm
+        precision = tp / (tp + fp) if (tp + fp) > 0 else 0
+        recall = tp / (tp + fn) if (tp + fn) > 0 else 0
+        f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
+
+        thresholds, prec_curve, rec_curve, fpr_curve = self.threshold_curve()
+        picks = np.linspace(0, self.n_bins - 1, curve_points).astype(int)
+
+        return {
+            'n': self.count,
+            'loss': self.loss_sum / max(self.count, 1),
+            'accuracy': (tn + tp) / max(self.count, 1),
+            'auc': self.roc_auc(),
+            'pr_auc': self.pr_auc(),
+            'threshold': threshold,
+            'confusion_matrix': cm.tolist(),
+            'precision': precision,
+            'recall': recall,
+            'f1': f1,
+            'ece': self.expected_calibration_error(),
+            'calibration': self.calibration(),
+            'curve': {
+                'threshold': thresholds[picks].tolist(),
+                'precision': prec_curve[picks].tolist(),
+                'recall': rec_curve[picks].tolist(),
+                'fpr': fpr_curve[picks].tolist(),
+            },
+        }
+
+
+def score_batches(model, X, batch_size=4096):
+    """Yield model scores for X in chunks (one inference pass)."""
+    for start in range(0, len(X), batch_size):
+        yield model.predict(X[start:start + batch_size], batch_size=batch_size, verbose=0)[:, 0]
+
+
+def evaluate_arrays(model, X, y, batch_size=4096, evaluator=None):
+    """Single-pass evaluation of in-memory arrays."""
+    evaluator = evaluator or StreamingEvaluator()
+    for start, scores in zip(range(0, len(X), batch_size), score_batches(model, X, batch_size)):
+        evaluator.update(y[start:start + len(scores)], scores)
+    return evaluator
+
+
+def iter_npz_shards(pattern):
+    """Yield (X, y) from .npz shards one file at a time."""
+    for path in sorted(glob.glob(pattern)):
+        with np.load(path) as shard:
+            yield shard['X'], shard['y']
+
+
+def evaluate_stream(model, shards, batch_size=4096):
+    """
+    Evaluate an iterable of (X, y) shards. Only one shard is held in
+    memory; the evaluator's state is a few fixed-size arrays.
+    """
+    evaluator = StreamingEvaluator()
+    for X, y in shards:
+        evaluate_arrays(model, X, y, batch_size, evaluator)
+    return evaluator
+
+
+def print_evaluation(metrics):
+    """Console report in the same layout evaluate_model has always used."""
+
+    (tn, fp), (fn, tp) = metrics['confusion_matrix']
+
+    print(f"\nTest Accuracy: {metrics['accuracy']:.4f}")
+    print(f"Test AUC:      {metrics['auc']:.4f}")
+    print(f"Test Loss:     {metrics['loss']:.4f}")
+    print(f"PR AUC:        {metrics['pr_auc']:.4f}")
+
+    # Per-class report, computed from the confusion matrix
+    print("\nClassification Report:")
+    print(f"{'':>14} {'precision':>10} {'recall':>10} {'f1-score':>10} {'support':>10}")
+    for name, hit, false_alarm, miss in [('Low Risk', tn, fn, fp), ('High Risk', tp, fp, fn)]:
+        p = hit / (hit + false_alarm) if (hit + false_alarm) else 0
+        r = hit / (hit + miss) if (hit + miss) else 0
+        f = 2 * p * r / (p + r) if (p + r) else 0
+        print(f"{name:>14} {p:10.2f} {r:10.2f} {f:10.2f} {hit + miss:10d}")
+
+    print("\nConfusion Matrix:")
+    print(f"True Negatives (Low Risk correctly identified):  {tn}")
+    print(f"False Positives (False alarms):                  {fp}")
+    print(f"False Negatives (Missed high-risk moments):      {fn}")
+    print(f"True Positives (High Risk correctly identified): {tp}")
+
+    print(f"\nPrecision (how many alerts are real): {metrics['precision']:.4f}")
+    print(f"Recall (how many real risks we catch): {metrics['recall']:.4f}")
+
+    print("\nCalibration (mean score vs actual high-risk rate):")
+    for row in metrics['calibration']:
+        if row['count']:
+            print(f"   {row['bin']}: {row['mean_score']:.3f} vs {row['observed_rate']:.3f} (n={row['count']})")
+    print(f"   Expected calibration error: {metrics['ece']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-pass streaming evaluation")
+    parser.add_argument('--model', default='models/grounded_model.h5')
+    parser.add_argument('--shards', required=True, help="Glob of .npz files with X and y arrays")
+    parser.add_argument('--batch-size', type=int, default=4096)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--output', default=None, help="Write metrics as JSON")
+    args = parser.parse_args()
+
+    from tensorflow import keras
+
+    model = keras.models.load_model(args.model, compile=False)
+    metrics = evaluate_stream(model, iter_npz_shards(args.shards), args.batch_size).result(args.threshold)
+
+    print("="*60)
+    print("MODEL EVALUATION")
+    print("="*60)
+    print_evaluation(metrics)
+    print("="*60)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(metrics, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
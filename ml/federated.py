@@ -0,0 +1,327 @@
+"""
+Grounded App - Federated Averaging Simulator
+Trains the risk model the way it would be trained on-device: every
+synthetic user (or cohort of users) is a client that keeps its data, trains
+locally, and only sends a weight update to the server, which averages them
+(FedAvg, weighted by each client's number of windows).
+
+Each round the server samples clients, local training runs in a pool of
+worker processes (cross_validation.worker_pool, each worker with its own
+model and thread budget), and the global model is scored on users that never
+took part. Every worker builds and traces its model before the first round,
+so round times compare compression methods, not process start-up. Updates can be compressed before "upload":
+
+    none    float32 deltas                      4 bytes / weight
+    int8    per-tensor linear quantization      ~1 byte / weight
+    topk    largest |delta| only (--topk share), int32 index + float32 value,
+            with error feedback: what a client didn't send is added to its
+            next update, so small deltas aren't lost for good
+
+Reported per round: wall time, client training time, uplink bytes per
+client and global test AUC / loss. Downlink is the full float32 model.
+
+Test users are held out first and MinMax scaling is fitted on the client
+(training) users only, then applied to the test users. That equals aggregating
+each client's per-column min / max (18 numbers per client), so no raw data
+is needed for it.
+
+Usage:
+    python federated.py --rounds 20 --clients-per-round 10 --compression none,int8,topk
+    python federated.py --users-per-client 5 --local-epochs 2 --output reports/federated.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from cross_validation import pin_threads, worker_pool
+
+
+COMPRESSIONS = ['none', 'int8', 'topk']
+
+# Per-process client data and model, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(clients, input_shape, model_type, threads):
+    """Keep the clients and model settings in a fresh worker."""
+    pin_threads(threads)
+    _worker['clients'] = clients
+    _worker['input_shape'] = input_shape
+    _worker['model_type'] = model_type
+
+
+def _local_model():
+    """One compiled model per worker, reused for every client it trains."""
+    if 'model' not in _worker:
+        from tensorflow import keras
+        from traning_scriptv1 import build_model
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            model = build_model(*_worker['input_shape'], _worker['model_type'])
+        model.compile(optimizer=keras.optimizers.Adam(learning_rate=0.001), loss='binary_crossentropy')
+        _worker['model'] = model
+    return _worker['model']
+
+
+def _warm_up():
+    """Build the worker's model and trace its train step on a few windows."""
+    X, y = _worker['clients'][0]
+    _local_model().fit(X[:32], y[:32], epochs=1, batch_size=32, verbose=0)
+    return os.getpid()
+
+
+def compress(delta, method='none', topk=0.1):
+    """(payload, uplink bytes) for a list of delta arrays."""
+    if method == 'none':
+        payload = [d.astype(np.float32) for d in delta]
+        return payload, sum(d.nbytes for d in payload)
+
+    if method == 'int8':
+        payload = []
+        for d in delta:
+            scale = float(np.abs(d).max()) / 127 or 1.0
+            payload.append((np.round(d / scale).astype(np.int8), np.float32(scale)))
+        return payload, sum(q.nbytes + 4 for q, _ in payload)
+
+    if method == 'topk':
+        flat = np.concatenate([d.ravel() for d in delta])
+        k = max(1, int(len(flat) * topk))
+        index = np.argpartition(np.abs(flat), -k)[-k:].astype(np.int32)
+        values = flat[index].astype(np.float32)
+        return (index, values), index.nbytes + values.nbytes
+
+    raise ValueError(f"Unknown compression: {method}")
+
+
+def decompress(payload, shapes, method='none'):
+    """Inverse of compress (lossy for int8 / topk)."""
+    if method == 'none':
+        return payload
+    if method == 'int8':
+        return [q.astype(np.float32) * scale for q, scale in payload]
+    index, values = payload
+    flat = np.zeros(sum(int(np.prod(s)) for s in shapes), dtype=np.float32)
+    flat[index] = values
+    ends = np.cumsum([int(np.prod(s)) for s in shapes])[:-1]
+    return [part.reshape(s) for part, s in zip(np.split(flat, ends), shapes)]
+
+
+def train_client(client, global_weights, local_epochs=1, batch_size=32,
+                 compression='none', topk=0.1, residual=None, seed=0):
+    """
+    One client's local round (runs in a worker). Returns the compressed
+    update, its size and the client's new error-feedback residual.
+    """
+    import tensorflow as tf
+    from traning_scriptv1 import POSITIVE_WEIGHT
+
+    X, y = _worker['clients'][client]
+    model = _local_model()
+    model.set_weights(global_weights)
+    # Fresh optimizer state every round, without recompiling (keep the learning rate)
+    for variable in model.optimizer.variables:
+        if not variable.path.endswith('learning_rate'):
+            variable.assign(tf.zeros_like(variable))
+    tf.random.set_seed(seed)
+
+    start = time.perf_counter()
+    model.fit(X, y, epochs=local_epochs, batch_size=batch_size, verbose=0,
+              class_weight={0: 1.0, 1: POSITIVE_WEIGHT})
+    train_s = time.perf_counter() - start
+
+    delta = [new - old for new, old in zip(model.get_weights(), global_weights)]
+    if residual is not None:
+        delta = [d + r for d, r in zip(delta, residual)]
+    payload, n_bytes = compress(delta, compression, topk)
+    if compression == 'topk':
+        sent = decompress(payload, [d.shape for d in delta], compression)
+        residual = [d - s for d, s in zip(delta, sent)]
+    return {'client': client, 'n': len(y), 'payload': payload, 'bytes': n_bytes,
+            'train_s': train_s, 'residual': residual}
+
+
+def make_clients(X, y, user_ids, users_per_client=1):
+    """Group windows into clients of `users_per_client` consecutive users."""
+    users = np.unique(user_ids)
+    clients = []
+    for start in range(0, len(users), users_per_client):
+        rows = np.flatnonzero(np.isin(user_ids, users[start:start + users_per_client]))
+        clients.append((X[rows], y[rows]))
+    return clients
+
+
+def run_federated(pool, clients, model, X_test, y_test, rounds=20, clients_per_round=10,
+                  local_epochs=1, compression='none', topk=0.1, seed=42):
+    """
+    FedAvg from `model`'s current weights. Returns per-round records; the
+    model ends up holding the final global weights.
+    """
+    from evaluation import evaluate_arrays
+
+    rng = np.random.default_rng(seed)
+    global_weights = model.get_weights()
+    shapes = [w.shape for w in global_weights]
+    model_bytes = sum(w.nbytes for w in global_weights)
+    residuals = {}
+    history = []
+
+    for round_num in range(1, rounds + 1):
+        start = time.perf_counter()
+        chosen = rng.choice(len(clients), min(clients_per_round, len(clients)), replace=False)
+        futures = [pool.submit(train_client, int(c), global_weights, local_epochs, 32, compression, topk,
+                               residuals.get(int(c)) if compression == 'topk' else None,
+                               seed + round_num * 1000 + int(c))
+                   for c in chosen]
+        updates = [future.result() for future in futures]
+
+        # FedAvg: window-weighted mean of the (decompressed) client deltas
+        total = sum(u['n'] for u in updates)
+        mean_delta = [np.zeros(s, dtype=np.float32) for s in shapes]
+        for u in updates:
+            for acc, d in zip(mean_delta, decompress(u['payload'], shapes, compression)):
+                acc += d * (u['n'] / total)
+            if u['residual'] is not None:
+                residuals[u['client']] = u['residual']
+        global_weights = [w + d for w, d in zip(global_weights, mean_delta)]
+        round_s = time.perf_counter() - start
+
+        model.set_weights(global_weights)
+        metrics = evaluate_arrays(model, X_test, y_test).result(threshold=0.5)
+        history.append({
+            'round': round_num,
+            'wall_s': round_s,
+            'client_train_s_mean': float(np.mean([u['train_s'] for u in updates])),
+            'uplink_bytes_per_client': float(np.mean([u['bytes'] for u in updates])),
+            'downlink_bytes_per_client': model_bytes,
+            'auc': float(metrics['auc']),
+            'loss': float(metrics['loss']),
+        })
+        r = history[-1]
+        print(f"   • Round {round_num:3d}: AUC {r['auc']:.4f} | loss {r['loss']:.4f} | "
+              f"{r['wall_s']:5.2f} s | ↑ {r['uplink_bytes_per_client'] / 1024:6.1f} KB/client")
+    return history
+
+
+def summarize(history):
+    return {
+        'final_auc': history[-1]['auc'],
+        'best_auc': max(r['auc'] for r in history),
+        'final_loss': history[-1]['loss'],
+        'round_s_mean': float(np.mean([r['wall_s'] for r in history])),
+        'uplink_kb_per_client': history[-1]['uplink_bytes_per_client'] / 1024,
+        'downlink_kb_per_client': history[-1]['downlink_bytes_per_client'] / 1024,
+        'uplink_mb_total': sum(r['uplink_bytes_per_client'] for r in history) / (1024 * 1024),
+    }
+
+
+def print_comparison(results):
+    print(f"\n{'Compression':12} {'Final AUC':>10} {'Best AUC':>9} {'Round s':>8} "
+          f"{'↑ KB/client':>12} {'↓ KB/client':>12}")
+    print("─"*68)
+    for name, r in results.items():
+        s = r['summary']
+        print(f"{name:12} {s['final_auc']:10.4f} {s['best_auc']:9.4f} {s['round_s_mean']:8.2f} "
+              f"{s['uplink_kb_per_client']:12.1f} {s['downlink_kb_per_client']:12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Federated averaging simulator")
+    parser.add_argument('--n-users', type=int, default=100)
+    parser.add_argument('--days-per-user', type=int, default=90)
+    parser.add_argument('--test-fraction', type=float, default=0.2, help="Users held out for evaluation")
+    parser.add_argument('--users-per-client', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--clients-per-round', type=int, default=10)
+    parser.add_argument('--local-epochs', type=int, default=1)
+    parser.add_argument('--compression', default='none',
+                        help=f"Comma-separated, from {', '.join(COMPRESSIONS)}")
+    parser.add_argument('--topk', type=float, default=0.1, help="Share of weights sent with topk")
+    parser.add_argument('--model-type', default='hybrid', choices=['hybrid', 'lstm', 'gru'])
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Client worker processes (default: clients per round, up to the core count)")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="TF threads per worker (default: cores / workers)")
+    parser.add_argument('--output', default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    compressions = args.compression.split(',')
+    unknown = [c for c in compressions if c not in COMPRESSIONS]
+    if unknown:
+        parser.error(f"unknown compression: {', '.join(unknown)}")
+
+    import tensorflow as tf
+    from traning_scriptv1 import GroundedDataGenerator, DataPreprocessor, build_model
+
+    print("="*80)
+    print(" "*24 + "FEDERATED AVERAGING SIMULATOR")
+    print("="*80)
+
+    np.random.seed(42)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = GroundedDataGenerator().generate_multi_user_dataset(args.n_users, args.days_per_user)
+    # Hold out test users before scaling, so the scaler only sees client data
+    test_users = np.random.default_rng(42).choice(
+        data['user_id'].unique(), int(args.n_users * args.test_fraction), replace=False)
+    is_test_user = data['user_id'].isin(test_users).values
+
+    preprocessor = DataPreprocessor()
+
+    def windows(frame):
+        # The first call fits the scaler; later calls only transform
+        X, y = preprocessor.create_sequences(preprocessor.prepare_features(frame), frame['risk_label'].values,
+                                             sequence_length=14, user_ids=frame['user_id'].values,
+                                             day_nums=frame['day_num'].values)
+        return X.astype(np.float32), y, preprocessor.window_index['user_id'].values
+
+    X_train, y_train, train_users = windows(data[~is_test_user].copy())
+    X_test, y_test, _ = windows(data[is_test_user].copy())
+    clients = make_clients(X_train, y_train, train_users, args.users_per_client)
+    sizes = [len(c[1]) for c in clients]
+    print(f"\n✓ {len(clients)} clients ({args.users_per_client} user(s) each, "
+          f"{np.median(sizes):.0f} windows median) | {len(y_test):,} test windows from {len(test_users)} users")
+
+    workers = args.workers or min(args.clients_per_round, os.cpu_count() or 1)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+    print(f"🔀 {workers} workers × {threads} threads | {args.clients_per_round} clients per round | "
+          f"{args.local_epochs} local epoch(s)")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = build_model(14, X_train.shape[2], args.model_type)
+    initial_weights = model.get_weights()
+
+    results = {}
+    with worker_pool(workers, _init_worker, (clients, (14, X_train.shape[2]), args.model_type, threads)) as pool:
+        # Start-up (spawn, TensorFlow import, model build, tracing) stays out of round 1
+        start = time.perf_counter()
+        warmed = {future.result() for future in [pool.submit(_warm_up) for _ in range(workers)]}
+        print(f"✓ {len(warmed)} worker(s) warmed up in {time.perf_counter() - start:.1f} s")
+        for compression in compressions:
+            print(f"\n[{compression}] {args.rounds} rounds...")
+            tf.random.set_seed(42)
+            model.set_weights(initial_weights)
+            history = run_federated(pool, clients, model, X_test, y_test, args.rounds,
+                                    args.clients_per_round, args.local_epochs, compression, args.topk)
+            results[compression] = {'history': history, 'summary': summarize(history)}
+
+    print_comparison(results)
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'settings': vars(args), 'n_clients': len(clients), 'workers': workers,
+                       'threads_per_worker': threads, 'results': results}, f, indent=2)
+        print(f"\n✓ Report written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
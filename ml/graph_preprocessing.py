@@ -0,0 +1,126 @@
+"""
+Grounded App - Preprocessing Inside the Model Graph
+Wraps a trained model so raw daily values go in and a risk score comes out.
+
+Today every consumer has to load feature_scaler.pkl (joblib + sklearn) and
+rebuild the one-hot / rolling features exactly as training did - and the app
+has to reimplement all of it. These wrappers move that work into builtin
+Keras layers, so it is saved with the model and converted to TFLite with it:
+
+    fold_preprocessing(model, scaler)
+        input  features (days, 32) - one-hot + *unscaled* numericals
+        adds   MinMax scaling as a fixed Normalization layer
+
+    fold_preprocessing(model, scaler, include_features=True)
+        inputs context, time_of_day, method   int32 (days,) vocab codes
+               day_of_week                    int32 (days,) 0 = Monday
+               numerics                       (days, 7) raw NUMERICAL_COLS
+               frequency                      (days,) uses per day
+        adds   one-hot (fixed identity embeddings), 7/30-day rolling
+               frequency (fixed averaging matrix) and MinMax scaling
+
+Rolling frequencies are computed within the window, as ScenarioTester and
+batch_features.featurize_columns do. Training computes them over each user's
+full history, so frequency_30day can differ for the earliest window days.
+"""
+
+import numpy as np
+from tensorflow import keras
+from keras import layers
+
+from batch_features import CATEGORICAL_VOCABS, DAYS, NUMERICAL_COLS, N_FEATURES
+
+
+RAW_INPUT_NAMES = list(CATEGORICAL_VOCABS) + ['day_of_week', 'numerics', 'frequency']
+
+
+def _minmax_layer(scaler, n_onehot, name='minmax_scaling'):
+    """
+    Fixed Normalization layer equal to MinMaxScaler.transform on the numerical
+    columns and identity on the first n_onehot (one-hot) columns.
+    x·scale + min  ==  (x - mean) / sqrt(variance)  with
+    mean = -min/scale, variance = 1/scale².
+    """
+    scale = np.r_[np.ones(n_onehot), scaler.scale_]
+    offset = np.r_[np.zeros(n_onehot), scaler.min_]
+    return layers.Normalization(mean=-offset / scale, variance=1.0 / scale ** 2, name=name)
+
+
+def _rolling_mean_matrix(sequence_length, window):
+    """
+    (days, days) matrix M with (frequency @ M)[j] = mean of the last `window`
+    days up to j, min_periods=1 - the same as rolling_frequency.
+    """
+    matrix = np.zeros((sequence_length, sequence_length), dtype=np.float32)
+    for j in range(sequence_length):
+        first = max(0, j - window + 1)
+        matrix[first:j + 1, j] = 1.0 / (j + 1 - first)
+    return matrix
+
+
+def _fixed_dense(matrix, name):
+    layer = layers.Dense(matrix.shape[1], use_bias=False, trainable=False, name=name)
+    layer.build((None, matrix.shape[0]))
+    layer.set_weights([matrix])
+    return layer
+
+
+def _one_hot_layer(n_tokens, name):
+    """Embedding with a frozen identity table: code i → one-hot row i."""
+    layer = layers.Embedding(n_tokens, n_tokens, trainable=False, name=name)
+    layer.build((None,))
+    layer.set_weights([np.eye(n_tokens, dtype=np.float32)])
+    return layer
+
+
+def fold_preprocessing(model, scaler, include_features=False):
+    """
+    Model that takes unscaled (or fully raw, with include_features) inputs
+    and returns the same score as model(featurize(...)). Only for
+    single-input (one-hot) models; the embedding variant is rejected.
+    """
+    if len(model.inputs) != 1:
+        raise ValueError(f"fold_preprocessing needs a single-input (one-hot) model, "
+                         f"{model.name} has {len(model.inputs)} inputs")
+    sequence_length, n_features = model.input_shape[1:]
+    n_numerical = len(scaler.scale_)
+    n_onehot = n_features - n_numerical
+
+    if not include_features:
+        features = keras.Input(shape=(sequence_length, n_features), name='features')
+        scaled = _minmax_layer(scaler, n_onehot)(features)
+        return keras.Model(features, model(scaled), name=model.name + '_scaled_input')
+
+    if n_features != N_FEATURES:
+        raise ValueError(f"include_features needs the standard {N_FEATURES}-feature layout, "
+                         f"model expects {n_features}")
+
+    vocab_sizes = [len(vocab) for vocab in CATEGORICAL_VOCABS.values()] + [len(DAYS)]
+    code_inputs = [keras.Input(shape=(sequence_length,), dtype='int32', name=name)
+                   for name in RAW_INPUT_NAMES[:4]]
+    numerics = keras.Input(shape=(sequence_length, len(NUMERICAL_COLS)), name='numerics')
+    frequency = keras.Input(shape=(sequence_length,), name='frequency')
+
+    # Same column order as DataPreprocessor.prepare_features
+    one_hots = [_one_hot_layer(size, f'{name}_one_hot')(codes)
+                for name, size, codes in zip(RAW_INPUT_NAMES, vocab_sizes, code_inputs)]
+    rolling = [layers.Reshape((sequence_length, 1))(
+                   _fixed_dense(_rolling_mean_matrix(sequence_length, window), f'frequency_{window}day')(frequency))
+               for window in (7, 30)]
+    numerical = _minmax_layer(scaler, 0)(layers.Concatenate()([numerics] + rolling))
+    features = layers.Concatenate(name='features')(one_hots + [numerical])
+
+    return keras.Model(code_inputs + [numerics, frequency], model(features),
+                       name=model.name + '_raw_input')
+
+
+def raw_inputs_from_columns(columns):
+    """
+    Columnar windows (as from batch_features.histories_to_columns) → the
+    named inputs of a fold_preprocessing(..., include_features=True) model.
+    Works for Keras predict and for model_formats.load_tflite.
+    """
+    inputs = {name: np.asarray(columns[name], dtype=np.int32) for name in RAW_INPUT_NAMES[:4]}
+    inputs['numerics'] = np.stack([columns[name] for name in NUMERICAL_COLS], axis=-1).astype(np.float32)
+    inputs['frequency'] = np.asarray(columns['frequency'], dtype=np.float32)
+    return inputs
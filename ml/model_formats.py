@@ -0,0 +1,269 @@
+"""
+Grounded App - Model Serialization Formats
+Writers and loaders for every format the risk model ships in.
+
+    h5          legacy Keras HDF5 (what save_model_for_mobile has always written)
+    keras       native Keras v3 archive
+    savedmodel  TensorFlow SavedModel (inference-only export)
+    tflite      TensorFlow Lite flatbuffer for the app
+    npz         architecture config (JSON) + raw weights (NumPy .npz)
+
+Every loader returns a `predict(x) -> np.ndarray` callable so benchmarks and
+tools can treat the formats the same way.
+
+save_model_for_mobile writes every format, and load_keras_model picks the
+fastest one that can rebuild the Keras model - see KERAS_LOAD_ORDER. The
+sha256 of each copy is recorded in model_metadata.json, and a copy is only
+used when it still matches, so a directory holding files from two builds
+never mixes them.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+
+FORMAT_SUFFIXES = {
+    'h5': '.h5',
+    'keras': '.keras',
+    'savedmodel': '_savedmodel',
+    'tflite': '.tflite',
+    'npz': '.npz',
+}
+
+# Written next to the .h5 / .tflite by save_model_for_mobile
+EXPORT_FORMATS = ['keras', 'savedmodel', 'npz']
+
+# Formats that give back a Keras model, fastest load first. Median of 5
+# cold loads each of the exported hybrid model (benchmark_inference.py
+# --load-runs 5 --threads 1, TensorFlow already imported):
+#
+#     npz   (config + raw weights)   157 ms   +6.7 MB RSS    49 KB
+#     h5    (legacy HDF5)            216 ms   +8.2 MB RSS   183 KB
+#     keras (v3 archive)             260 ms   +7.8 MB RSS   180 KB
+#
+# savedmodel (144 ms) and tflite (1.3 ms) load faster still but only give a
+# predict function - and tflite weights are quantized - so they are not
+# candidates here.
+KERAS_LOAD_ORDER = ['npz', 'h5', 'keras']
+
+METADATA_NAME = 'model_metadata.json'
+
+
+def format_path(output_dir, fmt, base_name='grounded_model'):
+    """Where a given format lives inside a model directory."""
+    return os.path.join(output_dir, base_name + FORMAT_SUFFIXES[fmt])
+
+
+def artifact_sha256(path):
+    """Content hash of a model file, or of every file under a directory."""
+    digest = hashlib.sha256()
+    paths = [path] if os.path.isfile(path) else sorted(
+        os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    for p in paths:
+        with open(p, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def format_sha256(output_dir, fmt, base_name='grounded_model'):
+    """Content hash of one format's artifact; the npz includes its config JSON."""
+    path = format_path(output_dir, fmt, base_name)
+    if fmt != 'npz':
+        return artifact_sha256(path)
+    config_path = path[:-len('.npz')] + '.config.json'
+    return hashlib.sha256((artifact_sha256(path) + artifact_sha256(config_path)).encode()).hexdigest()
+
+
+def keras_bundle_sha256(output_dir, base_name='grounded_model'):
+    """{format: sha256} of the Keras-loadable copies present in output_dir."""
+    hashes = {}
+    for fmt in KERAS_LOAD_ORDER:
+        path = format_path(output_dir, fmt, base_name)
+        if fmt == 'npz' and not os.path.exists(path[:-len('.npz')] + '.config.json'):
+            continue
+        if os.path.exists(path):
+            hashes[fmt] = format_sha256(output_dir, fmt, base_name)
+    return hashes
+
+
+def convert_to_tflite(model, batch_size=1, optimize=True):
+    """
+    Convert a Keras model to TFLite.
+
+    The input is pinned to a fixed batch size: with a dynamic batch dimension
+    the LSTM lowers to TensorList ops that the builtin op set can't express
+    (the converter then asks for Flex ops, which the app doesn't bundle).
+    The app scores one window at a time, so batch_size=1 is the default.
+    Multi-input models (e.g. the embedding variant) keep their input
+    names and dtypes.
+    """
+    inputs = [keras.Input(shape=t.shape[1:], batch_size=batch_size, dtype=t.dtype, name=t.name)
+              for t in model.inputs]
+    if len(inputs) == 1:
+        inputs = inputs[0]
+    fixed = keras.Model(inputs, model(inputs), name=model.name)
+    converter = tf.lite.TFLiteConverter.from_keras_model(fixed)
+    if optimize:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    return converter.convert()
+
+
+def save_format(model, fmt, path):
+    """Write `model` in one format."""
+
+    if fmt in ('h5', 'keras'):
+        model.save(path)
+    elif fmt == 'savedmodel':
+        model.export(path, verbose=False)
+    elif fmt == 'tflite':
+        with open(path, 'wb') as f:
+            f.write(convert_to_tflite(model))
+    elif fmt == 'npz':
+        weights = {f'w{i:03d}': w for i, w in enumerate(model.get_weights())}
+        np.savez(path, **weights)
+        with open(path[:-len('.npz')] + '.config.json', 'w') as f:
+            json.dump({'class_name': model.__class__.__name__,
+                       'config': model.get_config()}, f)
+    else:
+        raise ValueError(f"Unknown model format: {fmt}")
+    return path
+
+
+def derive_formats(model, output_dir, formats=None, base_name='grounded_model'):
+    """Write `model` in several formats. Returns {format: path}."""
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for fmt in formats or FORMAT_SUFFIXES:
+        paths[fmt] = save_format(model, fmt, format_path(output_dir, fmt, base_name))
+    return paths
+
+
+def _as_tensors(x):
+    # Lists/dicts are multi-input batches; keep each part's dtype (int codes stay int)
+    if isinstance(x, dict):
+        return {name: tf.constant(part) for name, part in x.items()}
+    if isinstance(x, (list, tuple)):
+        return [tf.constant(part) for part in x]
+    return tf.constant(x, dtype=tf.float32)
+
+
+def _keras_predict(model):
+    # Compiled call - eager Keras calls are ~20x slower at small batch sizes
+    call = tf.function(lambda x: model(x, training=False), reduce_retracing=True)
+    return lambda x: call(_as_tensors(x)).numpy()
+
+
+def load_npz_model(path):
+    """Rebuild a model from its config JSON and load raw weights."""
+
+    with open(path[:-len('.npz')] + '.config.json') as f:
+        spec = json.load(f)
+    if spec['class_name'] == 'Sequential':
+        model = keras.Sequential.from_config(spec['config'])
+    else:
+        model = keras.Model.from_config(spec['config'])
+    with np.load(path) as data:
+        model.set_weights([data[key] for key in sorted(data.files)])
+    return model
+
+
+def load_keras_model(path, order=None):
+    """
+    Keras model from the fastest format available next to `path`.
+
+    `path` is any one artifact (e.g. models/grounded_model.h5) or a model
+    directory. Sibling formats with the same base name are tried in
+    KERAS_LOAD_ORDER, but only if their sha256 matches the one in
+    model_metadata.json - and, when a file was requested, only if that
+    metadata also matches the requested file. Otherwise the requested file
+    itself is loaded, so a published or overwritten .h5 is never shadowed by
+    a copy left over from another build.
+    Returns (model, format).
+    """
+    if os.path.isdir(path) and not path.rstrip('/').endswith(FORMAT_SUFFIXES['savedmodel']):
+        output_dir, base_name, requested = path, 'grounded_model', None
+    else:
+        output_dir, name = os.path.split(path)
+        requested = next((fmt for fmt, suffix in FORMAT_SUFFIXES.items() if name.endswith(suffix)), None)
+        if requested is None:
+            raise ValueError(f"Unknown model format: {path}")
+        base_name = name[:-len(FORMAT_SUFFIXES[requested])]
+
+    expected = {}
+    metadata_path = os.path.join(output_dir, METADATA_NAME)
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            expected = json.load(f).get('model_sha256', {})
+    if requested and expected.get(requested) != format_sha256(output_dir, requested, base_name):
+        expected = {}  # the metadata describes another build than the requested file
+
+    available = keras_bundle_sha256(output_dir, base_name)
+    for fmt in order or KERAS_LOAD_ORDER:
+        if fmt not in available:
+            continue
+        # Without metadata a directory can only be trusted as a whole
+        trusted = (fmt == requested or available[fmt] == expected.get(fmt)
+                   or (requested is None and not expected))
+        if trusted:
+            candidate = format_path(output_dir, fmt, base_name)
+            if fmt == 'npz':
+                return load_npz_model(candidate), fmt
+            return keras.models.load_model(candidate, compile=False), fmt
+    raise FileNotFoundError(f"No Keras-loadable model at {path}")
+
+
+def load_tflite(path, num_threads=None):
+    """
+    TFLite interpreter wrapped as predict(x); resizes for other batch sizes.
+
+    Multi-input models take a dict keyed by Keras input name. A list is
+    matched to the interpreter's input order, which the converter sorts by
+    name - not necessarily the Keras order.
+    """
+
+    interpreter = tf.lite.Interpreter(model_path=path, num_threads=num_threads)
+    interpreter.allocate_tensors()
+    inputs = sorted(interpreter.get_input_details(), key=lambda d: d['index'])
+    names = [d['name'].removeprefix('serving_default_').split(':')[0] for d in inputs]
+    output_index = interpreter.get_output_details()[0]['index']
+    current = {'shapes': [tuple(d['shape']) for d in inputs]}
+
+    def predict(x):
+        if isinstance(x, dict):
+            x = [x[name] for name in names]
+        parts = x if isinstance(x, (list, tuple)) else [x]
+        parts = [np.asarray(part, dtype=d['dtype']) for part, d in zip(parts, inputs)]
+        shapes = [part.shape for part in parts]
+        if shapes != current['shapes']:
+            for d, shape in zip(inputs, shapes):
+                interpreter.resize_tensor_input(d['index'], shape)
+            interpreter.allocate_tensors()
+            current['shapes'] = shapes
+        for d, part in zip(inputs, parts):
+            interpreter.set_tensor(d['index'], part)
+        interpreter.invoke()
+        return interpreter.get_tensor(output_index)
+
+    return predict
+
+
+def load_predict_fn(fmt, path, num_threads=None):
+    """Load one format and return predict(x) -> np.ndarray."""
+
+    if fmt in ('h5', 'keras'):
+        return _keras_predict(keras.models.load_model(path, compile=False))
+    if fmt == 'savedmodel':
+        loaded = tf.saved_model.load(path)
+        return lambda x: loaded.serve(_as_tensors(x)).numpy()
+    if fmt == 'tflite':
+        return load_tflite(path, num_threads)
+    if fmt == 'npz':
+        return _keras_predict(load_npz_model(path))
+    raise ValueError(f"Unknown model format: {fmt}")
@@ -0,0 +1,333 @@
+"""
+Grounded App - Model Artifact Registry
+Content-addressed store of trained models, so identical runs are never
+retrained and any earlier build can be reloaded by version.
+
+A build is keyed by the sha256 of everything that determines its weights:
+
+    data            n_users, days_per_user, seed + the generator's source
+    preprocessor    feature names, vocabularies, sequence length + source
+    architecture    model_type, categorical_input + the model builders' source
+    split           test / validation sizes and seed + split_dataset's source
+    hyperparameters epochs + train_model's source (LR, batch size, class
+                    weights and callbacks live there), TensorFlow version
+
+Hashing the source of the functions that hold the settings means an edit to
+any of them yields a new key without anyone having to remember to bump a
+config value.
+
+Layout:
+
+    registry/index.json                 one line per build, in build order
+    registry/<key[:16]>/manifest.json   spec, version, metrics, benchmarks,
+                                        sha256 of every artifact
+    registry/<key[:16]>/*               the files save_model_for_mobile wrote
+
+Versions are assigned in build order - 1.0.0, 1.0.1, ... - and written into
+model_metadata.json, so PredictionCache keys and benchmark file names change
+with every build. A key holds one build: registering it again (training with
+--retrain) replaces the earlier build's artifacts and index entry, and the
+new build gets a new version.
+
+Usage:
+    python model_registry.py list
+    python model_registry.py show 1.0.3
+    python model_registry.py publish 1.0.3 --output-dir models   # roll back
+    python model_registry.py compare 1.0.2 1.0.3
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import sys
+from datetime import datetime
+
+
+SCHEMA_VERSION = 1
+INDEX_NAME = 'index.json'
+MANIFEST_NAME = 'manifest.json'
+VERSION_PREFIX = '1.0.'
+
+# Shown by `list` and copied into the index so it can be read without the manifests
+INDEX_METRICS = ['auc', 'pr_auc', 'accuracy', 'recall', 'f1', 'ece']
+
+
+def source_sha256(*objects):
+    """Hash of the source code of functions/classes (order-sensitive)."""
+    digest = hashlib.sha256()
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode())
+    return digest.hexdigest()
+
+
+def spec_key(spec):
+    """sha256 of the canonical JSON of a build spec."""
+    canonical = json.dumps(spec, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def training_spec(n_users=100, days_per_user=90, seed=42, sequence_length=14,
+                  model_type='hybrid', categorical_input='onehot', epochs=100,
+                  test_size=0.2, val_size=0.2, split_seed=42):
+    """
+    Build spec for traning_scriptv1.main(). Everything that changes the
+    trained weights goes in here; output paths and logging flags do not.
+    """
+    import tensorflow as tf
+    from batch_features import CATEGORICAL_VOCABS, NUMERICAL_COLS
+    from traning_scriptv1 import (GroundedDataGenerator, DataPreprocessor, build_model,
+                                  _embedding_model, head_layers, split_dataset, train_model,
+                                  trunk_layers)
+
+    return {
+        'data': {
+            'n_users': n_users,
+            'days_per_user': days_per_user,
+            'seed': seed,
+            'generator_sha256': source_sha256(GroundedDataGenerator),
+        },
+        'preprocessor': {
+            'sequence_length': sequence_length,
+            'vocabularies': CATEGORICAL_VOCABS,
+            'numerical_columns': NUMERICAL_COLS,
+            'preprocessor_sha256': source_sha256(DataPreprocessor),
+        },
+        'split': {
+            'test_size': test_size,
+            'val_size': val_size,
+            'seed': split_seed,
+            'split_sha256': source_sha256(split_dataset),
+        },
+        'architecture': {
+            'model_type': model_type,
+            'categorical_input': categorical_input,
+            'build_model_sha256': source_sha256(build_model, trunk_layers, head_layers, _embedding_model),
+        },
+        'hyperparameters': {
+            'epochs': epochs,
+            'train_model_sha256': source_sha256(train_model),
+            'tensorflow': tf.__version__,
+        },
+    }
+
+
+def _scalars(metrics):
+    """Plain-number subset of an evaluation dict (drops curves and matrices)."""
+    return {name: float(value) for name, value in (metrics or {}).items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)}
+
+
+def _write_json(path, payload):
+    """Write via a temp file so readers never see half an index."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    """
+    Directory of trained builds keyed by spec_key().
+    """
+
+    def __init__(self, root='registry'):
+        self.root = root
+
+    def _index_path(self):
+        return os.path.join(self.root, INDEX_NAME)
+
+    def entries(self):
+        """Index entries in build order."""
+        if not os.path.exists(self._index_path()):
+            return []
+        with open(self._index_path()) as f:
+            return json.load(f)['entries']
+
+    def next_version(self):
+        builds = [int(entry['version'][len(VERSION_PREFIX):]) for entry in self.entries()
+                  if entry['version'].startswith(VERSION_PREFIX)]
+        return f"{VERSION_PREFIX}{max(builds) + 1 if builds else 0}"
+
+    def build_dir(self, key):
+        return os.path.join(self.root, key[:16])
+
+    def resolve(self, ref):
+        """
+        Index entry for a version ('1.0.3'), a key or key prefix, or
+        'latest'. Returns None if nothing matches.
+        """
+        entries = self.entries()
+        if ref == 'latest':
+            return entries[-1] if entries else None
+        for entry in reversed(entries):
+            if ref in (entry['version'], entry['key']):
+                return entry
+        matches = [entry for entry in entries if entry['key'].startswith(ref)]
+        if len(matches) > 1:
+            raise ValueError(f"Key prefix {ref!r} is ambiguous ({len(matches)} builds)")
+        return matches[0] if matches else None
+
+    def lookup(self, key):
+        """Manifest of the build with this key, if it is complete on disk."""
+        entry = self.resolve(key)
+        if entry is None:
+            return None
+        manifest = self.manifest(entry)
+        missing = [name for name in manifest['artifacts']
+                   if not os.path.exists(os.path.join(self.build_dir(entry['key']), name))]
+        return None if missing else manifest
+
+    def manifest(self, ref):
+        entry = ref if isinstance(ref, dict) else self.resolve(ref)
+        if entry is None:
+            raise KeyError(f"No registered build matches {ref!r}")
+        with open(os.path.join(self.build_dir(entry['key']), MANIFEST_NAME)) as f:
+            return json.load(f)
+
+    def register(self, key, spec, source_dir, version, metrics=None, benchmarks=None):
+        """
+        Copy the artifacts in source_dir into the registry under key and
+        record them. A build already registered under key is replaced -
+        its artifacts and index entry (and so its version) are gone.
+        Returns the manifest.
+        """
+        from model_formats import artifact_sha256
+
+        build_dir = self.build_dir(key)
+        if os.path.exists(build_dir):
+            shutil.rmtree(build_dir)  # incomplete earlier attempt
+        shutil.copytree(source_dir, build_dir)
+
+        artifacts = {}
+        for root, _, names in os.walk(build_dir):
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                artifacts[os.path.relpath(path, build_dir)] = {
+                    'sha256': artifact_sha256(path),
+                    'bytes': os.path.getsize(path),
+                }
+
+        manifest = {
+            'schema_version': SCHEMA_VERSION,
+            'key': key,
+            'version': version,
+            'created_at': datetime.now().isoformat(),
+            'spec': spec,
+            'metrics': _scalars(metrics),
+            'benchmarks': benchmarks or {},
+            'artifacts': artifacts,
+        }
+        _write_json(os.path.join(build_dir, MANIFEST_NAME), manifest)
+
+        entries = [entry for entry in self.entries() if entry['key'] != key]
+        entries.append({
+            'key': key,
+            'version': version,
+            'created_at': manifest['created_at'],
+            'model_type': spec.get('architecture', {}).get('model_type'),
+            **{name: manifest['metrics'][name] for name in INDEX_METRICS if name in manifest['metrics']},
+        })
+        os.makedirs(self.root, exist_ok=True)
+        _write_json(self._index_path(), {'schema_version': SCHEMA_VERSION, 'entries': entries})
+        return manifest
+
+    def attach_benchmarks(self, ref, name, results):
+        """Store benchmark numbers (e.g. from benchmark_inference) with a build."""
+        manifest = self.manifest(ref)
+        manifest['benchmarks'][name] = results
+        _write_json(os.path.join(self.build_dir(manifest['key']), MANIFEST_NAME), manifest)
+        return manifest
+
+    def path(self, ref, name='grounded_model.h5'):
+        manifest = self.manifest(ref)
+        return os.path.join(self.build_dir(manifest['key']), name)
+
+    def publish(self, ref, output_dir='models'):
+        """
+        Copy a build's artifacts to output_dir (where the app tools look).
+        Model files already there are removed first, so formats the build
+        doesn't have can't be picked up next to its scaler and metadata.
+        """
+        manifest = self.manifest(ref)
+        build_dir = self.build_dir(manifest['key'])
+        os.makedirs(output_dir, exist_ok=True)
+        for name in os.listdir(output_dir):
+            if name.startswith('grounded_model'):
+                path = os.path.join(output_dir, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+        for name in manifest['artifacts']:
+            target = os.path.join(output_dir, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(os.path.join(build_dir, name), target)
+        return manifest
+
+    def load_model(self, ref='latest', name='grounded_model.h5'):
+        """Keras model of a build, without recompiling it."""
+        from tensorflow import keras
+        return keras.models.load_model(self.path(ref, name), compile=False)
+
+
+def compare_builds(a, b):
+    """Metric deltas and changed spec sections between two manifests."""
+    changed = sorted(section for section in set(a['spec']) | set(b['spec'])
+                     if a['spec'].get(section) != b['spec'].get(section))
+    metrics = {name: {'a': a['metrics'].get(name), 'b': b['metrics'].get(name),
+                      'delta': b['metrics'][name] - a['metrics'][name]}
+               for name in INDEX_METRICS if name in a['metrics'] and name in b['metrics']}
+    return {'a': a['version'], 'b': b['version'], 'changed_spec': changed, 'metrics': metrics}
+
+
+def print_entries(entries):
+    if not entries:
+        print("   (registry is empty)")
+        return
+    print(f"\n{'Version':10} {'Key':14} {'Model':8} {'AUC':>7} {'Recall':>7} {'Created':20}")
+    print("─"*70)
+    for entry in entries:
+        auc = f"{entry['auc']:.4f}" if 'auc' in entry else '-'
+        recall = f"{entry['recall']:.4f}" if 'recall' in entry else '-'
+        print(f"{entry['version']:10} {entry['key'][:12]:14} {str(entry.get('model_type')):8} "
+              f"{auc:>7} {recall:>7} {entry['created_at'][:19]:20}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and publish registered model builds")
+    parser.add_argument('--root', default='registry')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="All builds in order")
+    show = commands.add_parser('show', help="Manifest of one build")
+    show.add_argument('ref', help="Version, key (prefix) or 'latest'")
+    publish = commands.add_parser('publish', help="Copy a build's artifacts to the model directory")
+    publish.add_argument('ref')
+    publish.add_argument('--output-dir', default='models')
+    compare = commands.add_parser('compare', help="Metric and spec differences between two builds")
+    compare.add_argument('a')
+    compare.add_argument('b')
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root)
+
+    if args.command == 'list':
+        print_entries(registry.entries())
+    elif args.command == 'show':
+        print(json.dumps(registry.manifest(args.ref), indent=2))
+    elif args.command == 'publish':
+        manifest = registry.publish(args.ref, args.output_dir)
+        print(f"✓ Published {manifest['version']} ({manifest['key'][:12]}) to {args.output_dir}/")
+    elif args.command == 'compare':
+        diff = compare_builds(registry.manifest(args.a), registry.manifest(args.b))
+        print(f"\n{diff['a']} → {diff['b']}")
+        print(f"   Spec changes: {', '.join(diff['changed_spec']) or 'none'}")
+        for name, values in diff['metrics'].items():
+            print(f"   • {name:9} {values['a']:.4f} → {values['b']:.4f} ({values['delta']:+.4f})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
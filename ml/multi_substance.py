@@ -0,0 +1,390 @@
+"""
+Grounded App - Multi-Substance Risk Model
+One shared temporal trunk with a risk head per substance, so every
+substance a user tracks is scored in a single inference call.
+
+    SubstanceDataGenerator   GroundedDataGenerator where each user tracks
+                             1-3 of the app's substances; per day it records
+                             which were used (used_<s>), whether the user
+                             tracks them (tracks_<s>) and a per-substance
+                             label (risk_<s>)
+    build_multitask_model    trunk_layers(model_type) + one head_layers()
+                             head per substance (outputs risk_<s>_risk)
+    scoring_model            same layers, heads concatenated into one
+                             (batch, n_substances) output - what ships
+
+Heads are only trained on windows of users who track that substance: the
+others get sample weight 0, so no head learns "never used → low risk" from
+people who simply don't take it.
+
+The comparison reports TFLite size and batch-1 latency of the multi-task
+model against one single-task build_model() per substance (scoring a window
+then takes one invoke per model). --train-separate also trains those models
+for an AUC comparison; without it they are only built, which is enough for
+size and latency.
+
+Usage:
+    python multi_substance.py --n-users 300 --epochs 20 --output reports/multi_substance.json
+    python multi_substance.py --train-separate --save-dir models/multi_substance
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from tensorflow import keras
+from keras import layers
+
+from traning_scriptv1 import (POSITIVE_WEIGHT, GroundedDataGenerator, DataPreprocessor, build_model,
+                              head_layers, trunk_layers)
+
+
+# name (as in assets/substances/): (share of users tracking it, dependence, usual method)
+SUBSTANCE_PROFILES = {
+    'alcohol': (0.14, 1.0, 'drinking'),
+    'caffeine': (0.12, 0.8, 'drinking'),
+    'cigarette': (0.10, 1.1, 'smoking'),
+    'vaping': (0.09, 1.0, 'vaping'),
+    'herb': (0.09, 0.9, 'smoking'),
+    'sugar': (0.07, 0.8, 'edibles'),
+    'prescription': (0.05, 1.0, 'edibles'),
+    'benzos': (0.04, 1.2, 'edibles'),
+    'opioids': (0.04, 1.3, 'edibles'),
+    'amphetamines': (0.03, 1.2, 'edibles'),
+    'cocaine': (0.03, 1.3, 'smoking'),
+    'mdma': (0.03, 0.9, 'edibles'),
+    'ketamine': (0.02, 1.0, 'smoking'),
+    'psilocybin': (0.02, 0.8, 'edibles'),
+    'lsd': (0.02, 0.8, 'edibles'),
+    'meth': (0.02, 1.4, 'smoking'),
+    'heroin': (0.02, 1.4, 'smoking'),
+    'fentanyl': (0.01, 1.4, 'smoking'),
+    'others': (0.02, 1.0, None),
+}
+SUBSTANCES = list(SUBSTANCE_PROFILES)
+
+
+class SubstanceDataGenerator(GroundedDataGenerator):
+    """
+    Substance-aware synthetic data. Day-level fields (context, mood, sleep,
+    cravings, ...) come from GroundedDataGenerator; this adds which tracked
+    substances were used and a risk label per substance.
+    """
+
+    def generate_user_profile(self):
+        profile = super().generate_user_profile()
+        shares = np.array([share for share, _, _ in SUBSTANCE_PROFILES.values()])
+        n_tracked = np.random.choice([1, 2, 3], p=[0.5, 0.35, 0.15])
+        profile['substances'] = list(np.random.choice(SUBSTANCES, n_tracked, replace=False,
+                                                      p=shares / shares.sum()))
+        profile['substance_frequency'] = {
+            s: np.random.choice([1, 2, 3, 4, 5, 6], p=[0.3, 0.25, 0.2, 0.15, 0.07, 0.03])
+            for s in profile['substances']}
+        return profile
+
+    def generate_day_data(self, profile, day_num, prev_days):
+        used_today = {}
+        for s in profile['substances']:
+            use_prob = profile['substance_frequency'][s] / 7.0
+            if prev_days and prev_days[-1][f'used_{s}']:
+                use_prob *= 1.3
+            used_today[s] = np.random.random() < use_prob
+        used = [s for s in profile['substances'] if used_today[s]]
+
+        # Frequency 7 / 0 forces the base generator's use decision, so its
+        # context, amount, mood and craving logic stays consistent with it
+        day = super().generate_day_data(dict(profile, baseline_frequency=7 if used else 0),
+                                        day_num, prev_days)
+        day['substance'] = np.random.choice(used) if used else 'none'
+        if used and SUBSTANCE_PROFILES[day['substance']][2]:
+            day['method'] = SUBSTANCE_PROFILES[day['substance']][2]
+
+        for s in SUBSTANCES:
+            tracked = s in profile['substances']
+            used_s = tracked and used_today[s]
+            risk = 0.0
+            if tracked:
+                history = [{'used': d[f'used_{s}']} for d in prev_days[-7:]]
+                risk = self._calculate_risk_score(
+                    used_s, day['context'] if used_s else 'none',
+                    day['time_of_day'] if used_s else 'none', day['amount'] if used_s else 0,
+                    day['mood'], day['sleep_quality'], day['craving_intensity'], history)
+                risk = float(np.clip(risk * SUBSTANCE_PROFILES[s][1], 0, 1))
+            day[f'used_{s}'] = used_s
+            day[f'tracks_{s}'] = tracked
+            day[f'risk_{s}'] = int(risk > 0.6)
+        return day
+
+
+def substance_features(data, preprocessor=None):
+    """
+    Day features for the multi-task model: the usual 32 columns from
+    DataPreprocessor plus one used_<substance> flag per substance.
+    """
+    preprocessor = preprocessor or DataPreprocessor()
+    base = preprocessor.prepare_features(data)
+    used = data[[f'used_{s}' for s in SUBSTANCES]].values.astype(np.float32)
+    return np.concatenate([base, used], axis=1).astype(np.float32), preprocessor
+
+
+def substance_sequences(data, features, sequence_length=14):
+    """(X, labels, tracked, user_ids) windows; labels/tracked are (n, n_substances)."""
+    targets = np.concatenate([data[[f'risk_{s}' for s in SUBSTANCES]].values,
+                              data[[f'tracks_{s}' for s in SUBSTANCES]].values], axis=1)
+    preprocessor = DataPreprocessor()
+    X, targets = preprocessor.create_sequences(features, targets.astype(np.float32), sequence_length,
+                                               user_ids=data['user_id'].values,
+                                               day_nums=data['day_num'].values)
+    n = len(SUBSTANCES)
+    return X, targets[:, :n], targets[:, n:], preprocessor.window_index['user_id'].values
+
+
+def build_multitask_model(sequence_length, n_features, substances=SUBSTANCES, model_type='hybrid'):
+    """Shared trunk, one risk head per substance (a list of (batch, 1) outputs)."""
+    name, trunk = trunk_layers(model_type)
+    features = layers.Input(shape=(sequence_length, n_features), name='features')
+    x = features
+    for layer in trunk:
+        x = layer(x)
+    heads = []
+    for substance in substances:
+        h = x
+        for layer in head_layers(prefix=substance):
+            h = layer(h)
+        heads.append(h)
+    return keras.Model(features, heads, name=name.replace('grounded_', 'grounded_multi_substance_'))
+
+
+def scoring_model(model):
+    """All heads in one (batch, n_substances) output, in SUBSTANCES order."""
+    risks = layers.Concatenate(name='substance_risks')(model.outputs)
+    return keras.Model(model.inputs, risks, name=model.name)
+
+
+def head_weights(labels, tracked, positive_weight=POSITIVE_WEIGHT):
+    """Per-head sample weights: 0 for untracked, class weight like train_model otherwise."""
+    weights = tracked * np.where(labels > 0, positive_weight, 1.0)
+    return [weights[:, i].astype(np.float32) for i in range(labels.shape[1])]
+
+
+def train_multitask(X_train, Y_train, T_train, X_val, Y_val, T_val, model_type='hybrid',
+                    epochs=20, batch_size=32):
+    """One training pass for every head. Returns (model, history)."""
+    model = build_multitask_model(X_train.shape[1], X_train.shape[2], model_type=model_type)
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate=0.001), loss='binary_crossentropy')
+    columns = lambda Y: [Y[:, i:i + 1] for i in range(Y.shape[1])]
+    history = model.fit(
+        X_train, columns(Y_train), sample_weight=head_weights(Y_train, T_train),
+        validation_data=(X_val, columns(Y_val), head_weights(Y_val, T_val)),
+        epochs=epochs, batch_size=batch_size, verbose=0,
+        callbacks=[keras.callbacks.EarlyStopping(monitor='val_loss', patience=15,
+                                                 restore_best_weights=True),
+                   keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.5,
+                                                     patience=7, min_lr=1e-6)])
+    return model, history
+
+
+def per_substance_auc(scores, labels, tracked):
+    """AUC of each head on the windows of users who track that substance."""
+    from evaluation import StreamingEvaluator
+
+    results = {}
+    for i, substance in enumerate(SUBSTANCES):
+        rows = tracked[:, i] > 0
+        positives = int(labels[rows, i].sum())
+        auc = None
+        if 0 < positives < rows.sum():
+            evaluator = StreamingEvaluator()
+            evaluator.update(labels[rows, i], scores[rows, i])
+            auc = evaluator.roc_auc()
+        results[substance] = {'windows': int(rows.sum()), 'positives': positives, 'auc': auc}
+    return results
+
+
+def weighted_auc(per_substance):
+    """Window-weighted mean AUC over heads that could be scored."""
+    scored = [r for r in per_substance.values() if r['auc'] is not None]
+    if not scored:
+        return None
+    return float(np.average([r['auc'] for r in scored], weights=[r['windows'] for r in scored]))
+
+
+def tflite_footprint(models, x1, workdir, threads=1):
+    """Total TFLite size and batch-1 latency of scoring one window with all `models`."""
+    from benchmark_inference import time_calls
+    from model_formats import load_tflite, save_format
+
+    predicts, total_kb = [], 0.0
+    for i, model in enumerate(models):
+        path = save_format(model, 'tflite', os.path.join(workdir, f'{model.name}_{i}.tflite'))
+        total_kb += os.path.getsize(path) / 1024
+        predicts.append(load_tflite(path, num_threads=threads))
+    times = time_calls(lambda x: [predict(x) for predict in predicts], x1, min_iters=200, max_iters=2000)
+    return {
+        'models': len(models),
+        'tflite_kb': total_kb,
+        'params': int(sum(m.count_params() for m in models)),
+        'b1_p50_ms': float(np.percentile(times, 50)),
+        'b1_p99_ms': float(np.percentile(times, 99)),
+    }
+
+
+def train_separate(X_train, Y_train, T_train, X_val, Y_val, T_val, X_test, epochs, model_type='hybrid'):
+    """One build_model() per substance, each on its trackers' windows. Returns (models, test scores)."""
+    from traning_scriptv1 import train_model
+
+    models, scores = [], np.zeros((len(X_test), len(SUBSTANCES)), dtype=np.float32)
+    for i, substance in enumerate(SUBSTANCES):
+        train_rows, val_rows = T_train[:, i] > 0, T_val[:, i] > 0
+        if train_rows.sum() == 0 or val_rows.sum() == 0:
+            models.append(build_model(X_train.shape[1], X_train.shape[2], model_type))
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            model, _ = train_model(X_train[train_rows], Y_train[train_rows, i],
+                                   X_val[val_rows], Y_val[val_rows, i],
+                                   model_type=model_type, epochs=epochs)
+        models.append(model)
+        scores[:, i] = model.predict(X_test, batch_size=4096, verbose=0)[:, 0]
+        print(f"   • {substance:13} trained on {int(train_rows.sum()):,} windows")
+    return models, scores
+
+
+def save_multitask(model, preprocessor, output_dir):
+    """Write the scoring model (.h5 + .tflite), scaler and substance order."""
+    import joblib
+    from model_formats import save_format
+
+    os.makedirs(output_dir, exist_ok=True)
+    scorer = scoring_model(model)
+    save_format(scorer, 'h5', os.path.join(output_dir, 'grounded_multi_substance.h5'))
+    save_format(scorer, 'tflite', os.path.join(output_dir, 'grounded_multi_substance.tflite'))
+    joblib.dump(preprocessor.scaler, os.path.join(output_dir, 'feature_scaler.pkl'))
+    with open(os.path.join(output_dir, 'multi_substance_metadata.json'), 'w') as f:
+        json.dump({
+            'sequence_length': scorer.input_shape[1],
+            'n_features': scorer.input_shape[2],
+            'output': 'substance_risks',
+            'substances': SUBSTANCES,
+            'extra_features': [f'used_{s}' for s in SUBSTANCES],
+        }, f, indent=2)
+
+
+def print_comparison(report):
+    multi, separate = report['multitask'], report['separate']
+    separate_label = f"{separate['models']} separate"
+    print(f"\n{'':24} {'multi-task':>12} {separate_label:>12} {'ratio':>8}")
+    print("─"*60)
+    for key, label in [('models', 'Models'), ('params', 'Parameters'), ('tflite_kb', 'TFLite size (KB)'),
+                       ('b1_p50_ms', 'p50 all heads @1 (ms)'), ('b1_p99_ms', 'p99 all heads @1 (ms)'),
+                       ('weighted_auc', 'Weighted AUC')]:
+        a, b = multi.get(key), separate.get(key)
+        if a is None or b is None:
+            continue
+        fmt = '{:12.4f}' if isinstance(a, float) else '{:12,}'
+        print(f"{label:24} {fmt.format(a)} {fmt.format(b)} {b / a if a else 0:8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and compare the multi-substance risk model")
+    parser.add_argument('--n-users', type=int, default=300)
+    parser.add_argument('--days-per-user', type=int, default=90)
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--model-type', default='hybrid', choices=['hybrid', 'lstm', 'gru'])
+    parser.add_argument('--train-separate', action='store_true',
+                        help="Also train one model per substance for an accuracy comparison")
+    parser.add_argument('--threads', type=int, default=1, help="TFLite interpreter threads")
+    parser.add_argument('--save-dir', default=None, help="Write the multi-task model here")
+    parser.add_argument('--output', default=None, help="Write the comparison as JSON")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    from sklearn.model_selection import GroupShuffleSplit
+
+    print("="*80)
+    print(" "*22 + "MULTI-SUBSTANCE RISK MODEL")
+    print("="*80)
+
+    np.random.seed(42)
+    tf.random.set_seed(42)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = SubstanceDataGenerator().generate_multi_user_dataset(args.n_users, args.days_per_user)
+    # Split by user: a user's overlapping windows stay on one side. Test users
+    # are held out before scaling, so the scaler is fitted on the others only
+    split = lambda idx, groups, seed: next(GroupShuffleSplit(n_splits=1, test_size=0.2, random_state=seed)
+                                           .split(idx, groups=groups))
+    fit_rows, _ = split(np.arange(len(data)), data['user_id'].values, 42)
+    preprocessor = DataPreprocessor()
+    preprocessor.prepare_features(data.iloc[fit_rows].copy())
+    features, preprocessor = substance_features(data, preprocessor)
+    X, Y, T, user_ids = substance_sequences(data, features)
+    print(f"\n✓ {len(X):,} windows × {features.shape[1]} features | {len(SUBSTANCES)} substances | "
+          f"{T.sum(axis=1).mean():.1f} tracked per user")
+
+    is_fit_user = np.isin(user_ids, data['user_id'].values[fit_rows])
+    fit_idx, test_idx = np.flatnonzero(is_fit_user), np.flatnonzero(~is_fit_user)
+    train_part, val_part = split(fit_idx, user_ids[fit_idx], 43)
+    train_idx, val_idx = fit_idx[train_part], fit_idx[val_part]
+    parts = lambda idx: (X[idx], Y[idx], T[idx])
+
+    print(f"\n[1/3] Training the multi-task model ({args.epochs} epochs, one pass for all heads)...")
+    start = time.perf_counter()
+    model, history = train_multitask(*parts(train_idx), *parts(val_idx), args.model_type, args.epochs)
+    train_s = time.perf_counter() - start
+    scores = scoring_model(model).predict(X[test_idx], batch_size=4096, verbose=0)
+    per_substance = per_substance_auc(scores, Y[test_idx], T[test_idx])
+    print(f"   ✓ {len(history.history['loss'])} epochs in {train_s:.1f} s | "
+          f"weighted AUC {weighted_auc(per_substance) or float('nan'):.4f}")
+
+    print("\n[2/3] Building one model per substance...")
+    if args.train_separate:
+        start = time.perf_counter()
+        separate_models, separate_scores = train_separate(*parts(train_idx), *parts(val_idx), X[test_idx],
+                                                          args.epochs, args.model_type)
+        separate_train_s = time.perf_counter() - start
+    else:
+        separate_models = [build_model(X.shape[1], X.shape[2], args.model_type) for _ in SUBSTANCES]
+        print("   (untrained - size and latency only; --train-separate for accuracy)")
+
+    print("\n[3/3] TFLite size and latency...")
+    x1 = X[test_idx][:1]
+    with tempfile.TemporaryDirectory(prefix='multi_substance_') as workdir:
+        report = {
+            'settings': vars(args),
+            'n_windows': int(len(X)),
+            'multitask': {**tflite_footprint([scoring_model(model)], x1, workdir, args.threads),
+                          'train_s': train_s, 'weighted_auc': weighted_auc(per_substance),
+                          'per_substance': per_substance},
+            'separate': tflite_footprint(separate_models, x1, workdir, args.threads),
+        }
+    if args.train_separate:
+        separate_auc = per_substance_auc(separate_scores, Y[test_idx], T[test_idx])
+        report['separate'].update(train_s=separate_train_s, weighted_auc=weighted_auc(separate_auc),
+                                  per_substance=separate_auc)
+
+    print_comparison(report)
+    print("\n📊 Per-substance test AUC (multi-task):")
+    for substance, r in per_substance.items():
+        auc = f"{r['auc']:.4f}" if r['auc'] is not None else '  -   '
+        print(f"   • {substance:13} {auc} ({r['windows']:,} windows, {r['positives']:,} high risk)")
+
+    if args.save_dir:
+        save_multitask(model, preprocessor, args.save_dir)
+        print(f"\n✓ Multi-task model written to {args.save_dir}/")
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Comparison written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,356 @@
+"""
+Grounded App - Performance Regression Suite
+Fixed-size, fixed-seed timings for every stage of the ML pipeline.
+
+    generator       GroundedDataGenerator.generate_multi_user_dataset
+    preprocess      DataPreprocessor.prepare_features + create_sequences
+    build_model     build_model + compile
+    train           train_model for a fixed number of epochs
+    keras_b1/b256   Keras inference (compiled call), batch 1 and 256
+    tflite_b1       TFLite interpreter inference, batch 1
+
+Each benchmark is run a few times after its (untimed) setup and the median is
+kept. Results are compared with a stored baseline and the run fails (exit 1)
+when any benchmark is slower than the baseline by more than the threshold.
+
+Everything runs offline on CPU: GPUs are hidden and thread counts are pinned
+so numbers are comparable between runs on the same machine. Baselines are
+machine-specific - record one per CI runner type.
+
+Usage:
+    python perf_suite.py --save-baseline            # record benchmarks/perf_baseline.json
+    python perf_suite.py                            # compare against it
+    python perf_suite.py --only generator,train --threshold 0.3
+"""
+
+import os
+
+# Must be set before TensorFlow is imported
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '')
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+
+SCHEMA_VERSION = 1
+SEED = 1234
+
+# Fixed workload sizes - changing these invalidates stored baselines
+N_USERS = 40
+DAYS_PER_USER = 90
+TRAIN_WINDOWS = 2048
+TRAIN_EPOCHS = 3
+
+
+class Benchmark:
+    """
+    One timed operation. setup(ctx) prepares inputs (untimed) and returns
+    the zero-argument function to time. `threshold` overrides the suite-wide
+    regression threshold for noisy benchmarks.
+    """
+
+    def __init__(self, name, setup, repeats=5, threshold=None, description=''):
+        self.name = name
+        self.setup = setup
+        self.repeats = repeats
+        self.threshold = threshold
+        self.description = description
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the pipeline's progress prints."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def seeded(fn):
+    """Reseed NumPy/TF before every call so each repeat does identical work."""
+    import tensorflow as tf
+
+    def run():
+        np.random.seed(SEED)
+        tf.random.set_seed(SEED)
+        return fn()
+    return run
+
+
+def shared_data(ctx):
+    """Generated dataset and windows, built once and reused by later benchmarks."""
+    if 'X' not in ctx:
+        from traning_scriptv1 import GroundedDataGenerator, DataPreprocessor
+        np.random.seed(SEED)
+        with quiet():
+            data = GroundedDataGenerator().generate_multi_user_dataset(N_USERS, DAYS_PER_USER)
+        preprocessor = DataPreprocessor()
+        features = preprocessor.prepare_features(data)
+        X, y = preprocessor.create_sequences(features, data['risk_label'].values, sequence_length=14,
+                                             user_ids=data['user_id'].values,
+                                             day_nums=data['day_num'].values)
+        ctx.update(data=data, preprocessor=preprocessor, X=X.astype(np.float32), y=y)
+    return ctx
+
+
+def shared_model(ctx):
+    """A small trained model for the inference benchmarks."""
+    if 'model' not in ctx:
+        from traning_scriptv1 import build_model
+        import tensorflow as tf
+        shared_data(ctx)
+        np.random.seed(SEED)
+        tf.random.set_seed(SEED)
+        model = build_model(ctx['X'].shape[1], ctx['X'].shape[2])
+        model.compile(optimizer='adam', loss='binary_crossentropy')
+        model.fit(ctx['X'][:512], ctx['y'][:512], epochs=1, batch_size=64, verbose=0)
+        ctx['model'] = model
+    return ctx['model']
+
+
+def setup_generator(ctx):
+    from traning_scriptv1 import GroundedDataGenerator
+
+    def run():
+        with quiet():
+            GroundedDataGenerator().generate_multi_user_dataset(N_USERS, DAYS_PER_USER)
+    return seeded(run)
+
+
+def setup_preprocess(ctx):
+    from traning_scriptv1 import DataPreprocessor
+    data = shared_data(ctx)['data']
+
+    def run():
+        preprocessor = DataPreprocessor()
+        features = preprocessor.prepare_features(data)
+        preprocessor.create_sequences(features, data['risk_label'].values, sequence_length=14,
+                                      user_ids=data['user_id'].values, day_nums=data['day_num'].values)
+    return run
+
+
+def setup_build_model(ctx):
+    from traning_scriptv1 import build_model, keras
+    shape = shared_data(ctx)['X'].shape
+
+    def run():
+        model = build_model(shape[1], shape[2])
+        model.compile(optimizer=keras.optimizers.Adam(learning_rate=0.001),
+                      loss='binary_crossentropy',
+                      metrics=['accuracy', keras.metrics.AUC(name='auc')])
+    return seeded(run)
+
+
+def setup_train(ctx):
+    from traning_scriptv1 import train_model
+    shared_data(ctx)
+    X, y = ctx['X'], ctx['y']
+    rng = np.random.default_rng(SEED)
+    picks = rng.choice(len(X), min(TRAIN_WINDOWS, len(X)), replace=False)
+    X_train, y_train = X[picks], y[picks]
+    split = len(X_train) * 4 // 5
+
+    def run():
+        with quiet():
+            train_model(X_train[:split], y_train[:split], X_train[split:], y_train[split:],
+                        epochs=TRAIN_EPOCHS)
+    return seeded(run)
+
+
+def setup_keras(batch_size):
+    def setup(ctx):
+        from model_formats import _keras_predict
+        predict = _keras_predict(shared_model(ctx))
+        x = ctx['X'][:batch_size]
+        predict(x)  # trace once outside the timing
+        return lambda: predict(x)
+    return setup
+
+
+def setup_tflite(ctx):
+    from model_formats import convert_to_tflite, load_tflite
+    path = os.path.join(ctx['workdir'], 'model.tflite')
+    with open(path, 'wb') as f:
+        f.write(convert_to_tflite(shared_model(ctx)))
+    predict = load_tflite(path, num_threads=1)
+    x = ctx['X'][:1]
+    predict(x)
+    return lambda: predict(x)
+
+
+def calls(fn, n):
+    """Time n back-to-back calls as one sample (for sub-millisecond operations)."""
+    def run():
+        for _ in range(n):
+            fn()
+    return run
+
+
+BENCHMARKS = [
+    Benchmark('generator', setup_generator, repeats=3,
+              description=f"{N_USERS} users × {DAYS_PER_USER} days"),
+    Benchmark('preprocess', setup_preprocess, repeats=5,
+              description="prepare_features + create_sequences"),
+    Benchmark('build_model', setup_build_model, repeats=5, threshold=0.5,
+              description="build_model + compile"),
+    Benchmark('train', setup_train, repeats=3,
+              description=f"train_model, {TRAIN_WINDOWS} windows × {TRAIN_EPOCHS} epochs"),
+    Benchmark('keras_b1', lambda ctx: calls(setup_keras(1)(ctx), 100), repeats=5,
+              description="100 × Keras predict, batch 1"),
+    Benchmark('keras_b256', lambda ctx: calls(setup_keras(256)(ctx), 20), repeats=5,
+              description="20 × Keras predict, batch 256"),
+    Benchmark('tflite_b1', lambda ctx: calls(setup_tflite(ctx), 1000), repeats=5,
+              description="1000 × TFLite invoke, batch 1"),
+]
+
+
+def run_suite(benchmarks, threads):
+    """Run each benchmark's setup, then time it `repeats` times."""
+    import tensorflow as tf
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+    results = {}
+    # Files written by setups (e.g. the TFLite model) are removed afterwards
+    with tempfile.TemporaryDirectory(prefix='perf_suite_') as workdir:
+        ctx = {'workdir': workdir}
+        for bench in benchmarks:
+            with quiet():
+                run = bench.setup(ctx)
+                run()  # warm-up, not timed
+            times = []
+            for _ in range(bench.repeats):
+                start = time.perf_counter()
+                with quiet():
+                    run()
+                times.append(time.perf_counter() - start)
+            results[bench.name] = {
+                'description': bench.description,
+                'median_s': float(np.median(times)),
+                'min_s': float(min(times)),
+                'max_s': float(max(times)),
+                'repeats': bench.repeats,
+            }
+            print(f"   • {bench.name:12} {results[bench.name]['median_s']*1000:10.1f} ms "
+                  f"(min {results[bench.name]['min_s']*1000:.1f}) | {bench.description}")
+    return results
+
+
+def host_info(threads):
+    import tensorflow as tf
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'tensorflow': tf.__version__,
+        'numpy': np.__version__,
+        'threads': threads or 'default',
+    }
+
+
+def check_regressions(results, baseline, threshold, benchmarks):
+    """Compare medians with the baseline. Returns the names that regressed."""
+    overrides = {b.name: b.threshold for b in benchmarks if b.threshold is not None}
+    regressed = []
+    print(f"\n📉 Compared with baseline from {baseline.get('created_at', '?')}:")
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f"     {name:12} (no baseline)")
+            continue
+        limit = overrides.get(name, threshold)
+        change = result['median_s'] / before['median_s'] - 1
+        failed = change > limit
+        regressed += [name] if failed else []
+        print(f"   {'✗' if failed else '✓'} {name:12} {before['median_s']*1000:10.1f} → "
+              f"{result['median_s']*1000:10.1f} ms ({change:+.0%}, limit +{limit:.0%})")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ML pipeline performance regression suite")
+    parser.add_argument('--baseline', default='benchmarks/perf_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="Store this run as the new baseline instead of comparing")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Allowed slowdown of the median before a benchmark fails")
+    parser.add_argument('--only', default=None, help="Comma-separated benchmark names")
+    parser.add_argument('--threads', type=int, default=1, help="0 = TensorFlow default")
+    parser.add_argument('--output', default=None, help="Also write this run's results here")
+    args = parser.parse_args()
+
+    benchmarks = BENCHMARKS
+    if args.only:
+        names = args.only.split(',')
+        unknown = set(names) - {b.name for b in BENCHMARKS}
+        if unknown:
+            print(f"❌ Unknown benchmark(s): {', '.join(sorted(unknown))}")
+            return 2
+        benchmarks = [b for b in BENCHMARKS if b.name in names]
+
+    print("="*80)
+    print(" "*24 + "PERFORMANCE REGRESSION SUITE")
+    print("="*80)
+
+    results = run_suite(benchmarks, args.threads)
+    report = {
+        'schema_version': SCHEMA_VERSION,
+        'created_at': datetime.now().isoformat(),
+        'seed': SEED,
+        'host': host_info(args.threads),
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        baseline = report
+        if os.path.exists(args.baseline):
+            # Keep entries for benchmarks not run this time (--only)
+            with open(args.baseline) as f:
+                baseline['results'] = {**json.load(f)['results'], **results}
+        directory = os.path.dirname(args.baseline)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\n✓ Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n⚠ No baseline at {args.baseline} - run with --save-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('schema_version') != SCHEMA_VERSION:
+        print(f"❌ Baseline schema {baseline.get('schema_version')} != {SCHEMA_VERSION}; re-record it")
+        return 2
+    changed = {k: (baseline['host'].get(k), v) for k, v in report['host'].items()
+               if baseline['host'].get(k) != v}
+    if changed:
+        print("\n⚠ Host differs from the baseline's: " +
+              ', '.join(f"{k} {a} → {b}" for k, (a, b) in changed.items()))
+
+    regressed = check_regressions(results, baseline, args.threshold, benchmarks)
+    if regressed:
+        print(f"\n✗ {len(regressed)} benchmark(s) regressed: {', '.join(regressed)}")
+        return 1
+    print("\n✓ No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,298 @@
+"""
+Grounded App - Per-User Head Personalization
+Adapts the general model to one user by fine-tuning only its dense head.
+
+The Conv1D/LSTM trunk (trunk_layers in traning_scriptv1) stays frozen and
+shared. For a user's history it runs once, turning every window into a
+32-number summary; fine-tuning then only touches the head (545 weights),
+so it is a few hundred full-batch steps on a (n_windows, 32) matrix inside
+one compiled tf.function - no Keras fit, no per-user retracing.
+
+A user's personalization is stored as the *difference* to the base head
+weights (float16, about 1.3 KB per user) plus a fingerprint of the base head, so a
+delta is never applied to a model it wasn't trained against. At inference
+the trunk runs once for the whole batch and each user's head is applied on
+top:
+
+    personalizer = HeadPersonalizer(model)
+    delta = personalizer.fit_user(X_user, y_user)
+    save_delta('personal/user_42.npz', delta)
+    scores = personalizer.predict(X, load_delta('personal/user_42.npz'))
+
+The fine-tuning loss is the usual class-weighted cross-entropy plus an L2
+pull towards the base weights, so a short or one-sided history can't drag
+the head far from the general model.
+
+Usage:
+    python personalization.py --model-dir models --n-users 30 --output reports/personalization.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from keras import layers
+
+from traning_scriptv1 import POSITIVE_WEIGHT
+
+
+class HeadPersonalizer:
+    """
+    Frozen trunk + trainable copy of the dense head of a build_model() model
+    (one-hot or embedding input, any model_type).
+    """
+
+    def __init__(self, model):
+        recurrent = [i for i, layer in enumerate(model.layers)
+                     if isinstance(layer, (layers.LSTM, layers.GRU))]
+        if not recurrent:
+            raise ValueError(f"{model.name} has no LSTM/GRU layer to split the trunk at")
+
+        self.head = [layer for layer in model.layers[recurrent[-1] + 1:] if isinstance(layer, layers.Dense)]
+        if not self.head or self.head[-1].activation is not keras.activations.sigmoid:
+            raise ValueError(f"{model.name} does not end in a sigmoid Dense head")
+
+        # Dropout between trunk and head is a no-op at inference, so the
+        # head's input is the trunk's output
+        self.trunk = keras.Model(model.inputs, self.head[0].input, name=model.name + '_trunk')
+        self.base = [tf.constant(w, dtype=tf.float32) for layer in self.head for w in layer.get_weights()]
+        self.fingerprint = hashlib.sha256(
+            b''.join(w.numpy().tobytes() for w in self.base)).hexdigest()[:16]
+        self._trunk_call = tf.function(lambda x: self.trunk(x, training=False), reduce_retracing=True)
+
+    @property
+    def head_params(self):
+        return int(sum(np.prod(w.shape) for w in self.base))
+
+    def embed(self, X):
+        """Trunk output for each window - the only part that touches the big layers."""
+        from model_formats import _as_tensors
+        return self._trunk_call(_as_tensors(X))
+
+    def _logits(self, embeddings, weights):
+        x = embeddings
+        for i, layer in enumerate(self.head):
+            x = tf.matmul(x, weights[2 * i]) + weights[2 * i + 1]
+            if i < len(self.head) - 1:
+                x = layer.activation(x)
+        return x[:, 0]
+
+    @tf.function(reduce_retracing=True)
+    def _fine_tune(self, embeddings, labels, sample_weight, steps, learning_rate, l2):
+        """Full-batch Adam on the head deltas; returns the deltas."""
+        deltas = [tf.zeros_like(w) for w in self.base]
+        first = [tf.zeros_like(w) for w in self.base]
+        second = [tf.zeros_like(w) for w in self.base]
+        total_weight = tf.reduce_sum(sample_weight)
+        for step in tf.range(1, steps + 1):
+            with tf.GradientTape() as tape:
+                tape.watch(deltas)
+                logits = self._logits(embeddings, [w + d for w, d in zip(self.base, deltas)])
+                loss = tf.reduce_sum(sample_weight * tf.nn.sigmoid_cross_entropy_with_logits(
+                    labels=labels, logits=logits)) / total_weight
+                loss += l2 * tf.add_n([tf.reduce_sum(d * d) for d in deltas])
+            grads = tape.gradient(loss, deltas)
+            t = tf.cast(step, tf.float32)
+            first = [0.9 * m + 0.1 * g for m, g in zip(first, grads)]
+            second = [0.999 * v + 0.001 * g * g for v, g in zip(second, grads)]
+            deltas = [d - learning_rate * (m / (1 - 0.9 ** t)) / (tf.sqrt(v / (1 - 0.999 ** t)) + 1e-7)
+                      for d, m, v in zip(deltas, first, second)]
+        return deltas
+
+    def fit_user(self, X, y, steps=200, learning_rate=0.01, l2=0.1):
+        """
+        Head delta for one user's windows. Returns a dict ready for
+        save_delta / predict.
+        """
+        if len(y) == 0:
+            raise ValueError("fit_user needs at least one labelled window")
+        labels = tf.constant(np.asarray(y, dtype=np.float32).reshape(-1))
+        sample_weight = tf.where(labels > 0, POSITIVE_WEIGHT, 1.0)
+        deltas = self._fine_tune(self.embed(X), labels, sample_weight, tf.constant(steps),
+                                 tf.constant(learning_rate, tf.float32), tf.constant(l2, tf.float32))
+        return {
+            'fingerprint': self.fingerprint,
+            'n_windows': int(len(labels)),
+            'deltas': [d.numpy() for d in deltas],
+        }
+
+    def predict(self, X, delta=None, embeddings=None):
+        """Scores with the base head, or with a user's delta applied."""
+        embeddings = self.embed(X) if embeddings is None else embeddings
+        weights = self.base
+        if delta is not None:
+            if delta['fingerprint'] != self.fingerprint:
+                raise ValueError("Delta was trained against a different base model")
+            weights = [w + d.astype(np.float32) for w, d in zip(self.base, delta['deltas'])]
+        return tf.sigmoid(self._logits(embeddings, weights)).numpy()
+
+    def predict_users(self, X, user_ids, deltas):
+        """
+        Mixed batch of several users: one trunk pass, then each user's head
+        (users without a delta get the base head).
+        """
+        embeddings = self.embed(X)
+        user_ids = np.asarray(user_ids)
+        scores = np.empty(len(user_ids), dtype=np.float32)
+        for user in np.unique(user_ids):
+            rows = np.flatnonzero(user_ids == user)
+            scores[rows] = self.predict(None, deltas.get(user), tf.gather(embeddings, rows))
+        return scores
+
+
+def save_delta(path, delta):
+    """Store a head delta as one flat float16 array (2 bytes per head weight)."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    flat = np.concatenate([d.ravel() for d in delta['deltas']]).astype(np.float16)
+    meta = {'fingerprint': delta['fingerprint'], 'n_windows': delta['n_windows'],
+            'shapes': [list(d.shape) for d in delta['deltas']]}
+    np.savez_compressed(path, delta=flat, meta=np.array(json.dumps(meta)))
+    return os.path.getsize(path)
+
+
+def load_delta(path):
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        flat = data['delta'].astype(np.float32)
+    shapes = meta.pop('shapes')
+    ends = np.cumsum([int(np.prod(shape)) for shape in shapes])
+    return {**meta, 'deltas': [part.reshape(shape) for part, shape in zip(np.split(flat, ends[:-1]), shapes)]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate per-user head-only personalization")
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--n-users', type=int, default=30, help="Held-out synthetic users to adapt to")
+    parser.add_argument('--days-per-user', type=int, default=90)
+    parser.add_argument('--adapt-fraction', type=float, default=0.6,
+                        help="Earliest share of each user's windows used for fine-tuning")
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--learning-rate', type=float, default=0.01)
+    parser.add_argument('--l2', type=float, default=0.1)
+    parser.add_argument('--delta-dir', default=None, help="Write each user's delta here")
+    parser.add_argument('--output', default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    import contextlib
+    import io
+    import joblib
+    from evaluation import StreamingEvaluator
+    from model_formats import load_keras_model
+    from traning_scriptv1 import GroundedDataGenerator, DataPreprocessor
+
+    print("="*80)
+    print(" "*22 + "PER-USER HEAD PERSONALIZATION")
+    print("="*80)
+
+    model, model_format = load_keras_model(os.path.join(args.model_dir, 'grounded_model.h5'))
+    personalizer = HeadPersonalizer(model)
+    print(f"\n✓ {model.name} ({model_format}) | trunk {personalizer.trunk.count_params():,} params frozen, "
+          f"head {personalizer.head_params:,} trainable")
+
+    # Users the base model never saw
+    np.random.seed(1234)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = GroundedDataGenerator().generate_multi_user_dataset(args.n_users, args.days_per_user)
+    preprocessor = DataPreprocessor()
+    preprocessor.scaler = joblib.load(os.path.join(args.model_dir, 'feature_scaler.pkl'))
+    X, y = preprocessor.create_sequences(preprocessor.prepare_features(data), data['risk_label'].values,
+                                         model.input_shape[1], user_ids=data['user_id'].values,
+                                         day_nums=data['day_num'].values)
+    X = X.astype(np.float32)
+    user_ids = preprocessor.window_index['user_id'].values
+
+    # First call traces the trunk and the fine-tuning loop
+    start = time.perf_counter()
+    personalizer.fit_user(X[:8], y[:8], steps=args.steps)
+    trace_ms = (time.perf_counter() - start) * 1000
+
+    base_eval, personal_eval = StreamingEvaluator(), StreamingEvaluator()
+    fit_ms, delta_bytes, deltas, held_out_rows, skipped = [], [], {}, [], 0
+    for user in np.unique(user_ids):
+        rows = np.flatnonzero(user_ids == user)  # already in day order
+        split = int(len(rows) * args.adapt_fraction)
+        adapt, held_out = rows[:split], rows[split:]
+        if len(adapt) == 0 or len(held_out) == 0:
+            skipped += 1  # too few windows to both adapt and evaluate
+            continue
+        held_out_rows.append(held_out)
+
+        start = time.perf_counter()
+        delta = personalizer.fit_user(X[adapt], y[adapt], args.steps, args.learning_rate, args.l2)
+        fit_ms.append((time.perf_counter() - start) * 1000)
+        deltas[user] = delta
+
+        base_eval.update(y[held_out], personalizer.predict(X[held_out]))
+        personal_eval.update(y[held_out], personalizer.predict(X[held_out], delta))
+        if args.delta_dir:
+            delta_bytes.append(save_delta(os.path.join(args.delta_dir, f'user_{user}.npz'), delta))
+
+    if not deltas:
+        print(f"\n❌ No user has enough windows to split {args.adapt_fraction:.0%} / "
+              f"{1 - args.adapt_fraction:.0%} - raise --days-per-user")
+        return 1
+    if skipped:
+        print(f"⚠ Skipped {skipped} user(s) with too few windows to adapt and evaluate")
+
+    if not delta_bytes:
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            delta_bytes.append(save_delta(os.path.join(tmp, 'delta.npz'), next(iter(deltas.values()))))
+
+    # Mixed batch: every user's held-out windows in one call
+    held_out_rows = np.concatenate(held_out_rows)
+    start = time.perf_counter()
+    personalizer.predict_users(X[held_out_rows], user_ids[held_out_rows], deltas)
+    mixed_ms = (time.perf_counter() - start) * 1000
+
+    base, personal = base_eval.result(), personal_eval.result()
+    report = {
+        'settings': vars(args),
+        'model': model.name,
+        'trunk_params': int(personalizer.trunk.count_params()),
+        'head_params': personalizer.head_params,
+        'users': len(deltas),
+        'skipped_users': skipped,
+        'trace_ms': trace_ms,
+        'fit_ms': {'median': float(np.median(fit_ms)), 'p95': float(np.percentile(fit_ms, 95)),
+                   'max': float(np.max(fit_ms))},
+        'delta_bytes': {'mean': float(np.mean(delta_bytes)), 'max': int(np.max(delta_bytes))},
+        'full_model_bytes': int(model.count_params() * 4),
+        'mixed_batch': {'windows': int(len(held_out_rows)), 'ms': mixed_ms},
+        'held_out': {name: {'auc': r['auc'], 'loss': r['loss'], 'f1': r['f1'], 'windows': r['n']}
+                     for name, r in [('base', base), ('personalized', personal)]},
+    }
+
+    print(f"\n⏱  Fine-tuning ({args.steps} steps, {len(deltas)} users): "
+          f"median {report['fit_ms']['median']:.0f} ms | p95 {report['fit_ms']['p95']:.0f} ms "
+          f"(first call incl. tracing {trace_ms:.0f} ms)")
+    print(f"💾 Delta size: {report['delta_bytes']['mean'] / 1024:.2f} KB per user "
+          f"(full model weights {report['full_model_bytes'] / 1024:.1f} KB)")
+    print(f"⚡ Mixed batch of {len(held_out_rows):,} windows, {len(deltas)} users: {mixed_ms:.1f} ms (one trunk pass)")
+    print(f"\n📊 Later windows of each user ({base['n']:,}):")
+    print(f"   {'':14} {'AUC':>8} {'Log loss':>9} {'F1':>7}")
+    for name, r in report['held_out'].items():
+        print(f"   {name:14} {r['auc']:8.4f} {r['loss']:9.4f} {r['f1']:7.4f}")
+
+    if args.delta_dir:
+        print(f"\n✓ {len(deltas)} deltas written to {args.delta_dir}/")
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Report written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Grounded App - Pipeline Stage Profiler
+Records where time and memory go in the training pipeline.
+
+Wrap each stage in `profiler.stage(name)` (or decorate a function with
+`profiler.track(name)`) and the profiler records, per stage:
+
+    • wall time and CPU time (user + system, all threads)
+    • process RSS before/after and the process peak RSS
+    • tracemalloc peak and the top allocation sites (Python heap only -
+      TensorFlow's C++ allocations show up in RSS, not here)
+
+The run is written as a JSON trace, and optionally in Chrome trace format
+(open in chrome://tracing or https://ui.perfetto.dev).
+
+    profiler = StageProfiler()
+    with profiler.stage('generation'):
+        data = generator.generate_multi_user_dataset()
+    profiler.write('reports/train_trace.json', chrome_path='reports/train_trace.chrome.json')
+"""
+
+import functools
+import json
+import os
+import platform
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+
+def current_rss_mb():
+    """Resident set size right now (Linux /proc; falls back to peak RSS)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (Linux reports KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageProfiler:
+    """
+    Collects one record per pipeline stage.
+
+    With trace_malloc=False only time and RSS are recorded; tracemalloc
+    slows allocation-heavy Python code down noticeably.
+    """
+
+    def __init__(self, trace_malloc=True, top_n=10, enabled=True):
+        self.trace_malloc = trace_malloc
+        self.top_n = top_n
+        self.enabled = enabled
+        self.stages = []
+        self.origin = time.perf_counter()
+        self.started_at = datetime.now().isoformat()
+
+    @contextmanager
+    def stage(self, name, **attributes):
+        """Profile the enclosed block as one stage."""
+        if not self.enabled:
+            yield
+            return
+
+        owns_tracing = self.trace_malloc and not tracemalloc.is_tracing()
+        if owns_tracing:
+            tracemalloc.start()
+        if self.trace_malloc:
+            tracemalloc.reset_peak()
+            before_snapshot = tracemalloc.take_snapshot() if self.top_n else None
+
+        rss_before = current_rss_mb()
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall_s = time.perf_counter() - start
+            cpu_s = time.process_time() - cpu_start
+            record = {
+                'name': name,
+                'start_s': start - self.origin,
+                'wall_s': wall_s,
+                'cpu_s': cpu_s,
+                # > 1 means the stage kept several cores busy
+                'cpu_utilization': cpu_s / wall_s if wall_s > 0 else None,
+                'rss_before_mb': rss_before,
+                'rss_after_mb': current_rss_mb(),
+                'peak_rss_mb': peak_rss_mb(),
+                **attributes,
+            }
+            if self.trace_malloc:
+                _, peak = tracemalloc.get_traced_memory()
+                record['tracemalloc_peak_mb'] = peak / (1024 * 1024)
+                if self.top_n:
+                    record['top_allocations'] = self._top_allocations(before_snapshot)
+                if owns_tracing:
+                    tracemalloc.stop()
+            self.stages.append(record)
+
+    def track(self, name=None):
+        """Decorator form of stage()."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or func.__name__):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _top_allocations(self, before):
+        """Allocation sites that grew the most during the stage."""
+        after = tracemalloc.take_snapshot()
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                   tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')]
+        stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+        return [{
+            'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            'size_diff_kb': stat.size_diff / 1024,
+            'count_diff': stat.count_diff,
+        } for stat in stats[:self.top_n]]
+
+    def report(self):
+        """Whole run as a plain dict."""
+        return {
+            'started_at': self.started_at,
+            'host': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+            },
+            'total_wall_s': sum(s['wall_s'] for s in self.stages),
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': self.stages,
+        }
+
+    def chrome_trace(self):
+        """Stages as complete ('X') events in Chrome trace event format."""
+        pid = os.getpid()
+        events = []
+        for s in self.stages:
+            events.append({
+                'name': s['name'], 'ph': 'X', 'pid': pid, 'tid': 1,
+                'ts': s['start_s'] * 1e6, 'dur': s['wall_s'] * 1e6,
+                'args': {k: v for k, v in s.items()
+                         if k not in ('name', 'start_s', 'top_allocations')},
+            })
+            # Counter track so RSS shows as a graph under the stages
+            events.append({'name': 'rss_mb', 'ph': 'C', 'pid': pid,
+                           'ts': (s['start_s'] + s['wall_s']) * 1e6,
+                           'args': {'rss_mb': s['rss_after_mb']}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path, chrome_path=None):
+        """Write the JSON trace (and the Chrome trace if a path is given)."""
+        for target, payload in [(path, self.report()),
+                                (chrome_path, self.chrome_trace() if chrome_path else None)]:
+            if not target:
+                continue
+            directory = os.path.dirname(target)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(target, 'w') as f:
+                json.dump(payload, f, indent=2)
+
+    def print_summary(self):
+        """One line per stage, slowest first."""
+        if not self.stages:
+            return
+        total = sum(s['wall_s'] for s in self.stages) or 1.0
+        print("\n⏱  Stage timings:")
+        for s in sorted(self.stages, key=lambda s: s['wall_s'], reverse=True):
+            heap = f" | heap peak {s['tracemalloc_peak_mb']:7.1f} MB" if 'tracemalloc_peak_mb' in s else ''
+            print(f"   • {s['name']:14} {s['wall_s']:8.2f} s ({s['wall_s']/total*100:5.1f}%) | "
+                  f"CPU {s['cpu_s']:8.2f} s | RSS {s['rss_after_mb']:7.1f} MB{heap}")
+        print(f"   Peak RSS: {peak_rss_mb():.1f} MB")
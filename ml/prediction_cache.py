@@ -0,0 +1,109 @@
+"""
+Grounded App - Window Prediction Cache
+Skips inference for feature windows that have already been scored.
+
+Scenario runs, sweeps and what-if tools keep rescoring the same 14-day
+windows. The cache key is a hash of the window after quantizing it (so
+float noise from featurizing doesn't cause misses) plus the model version,
+so scores from one model build are never served for another. Entries are
+evicted least-recently-used once `max_entries` is reached.
+
+    cache = PredictionCache(model_version=model_version_for('models/grounded_model.h5'))
+    scores = cache.predict(windows, lambda X: model.predict(X, verbose=0)[:, 0])
+    print(cache.stats())
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+
+def model_version_for(model_path):
+    """
+    Version tag for a model file: metadata version (if any) plus a content
+    hash, so retraining without bumping the version still changes the key.
+    """
+    from model_formats import artifact_sha256
+
+    version = 'unversioned'
+    metadata_path = os.path.join(os.path.dirname(model_path), 'model_metadata.json')
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            version = json.load(f).get('model_version', version)
+    return f"{version}+{artifact_sha256(model_path)[:12]}"
+
+
+class PredictionCache:
+    """
+    Bounded LRU map from quantized window hash → risk score.
+    """
+
+    def __init__(self, max_entries=100_000, decimals=4, model_version=''):
+        self.max_entries = max_entries
+        self.scale = 10 ** decimals
+        self.prefix = model_version.encode()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def keys_for(self, windows):
+        """One 16-byte key per window in a (n, days, features) array."""
+        quantized = np.ascontiguousarray(np.rint(np.asarray(windows) * self.scale).astype(np.int32))
+        keys = []
+        for window in quantized:
+            h = hashlib.blake2b(self.prefix, digest_size=16)
+            h.update(window.tobytes())
+            keys.append(h.digest())
+        return keys
+
+    def _store(self, key, score):
+        self.entries[key] = score
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def predict(self, windows, predict_fn):
+        """
+        Scores for `windows`, calling `predict_fn` only on windows that
+        aren't cached. Duplicates within the batch are scored once.
+        """
+        keys = self.keys_for(windows)
+        scores = np.empty(len(keys), dtype=np.float32)
+
+        missing = OrderedDict()  # key -> positions needing that score
+        for i, key in enumerate(keys):
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                scores[i] = self.entries[key]
+                self.hits += 1
+            else:
+                missing.setdefault(key, []).append(i)
+                self.misses += 1
+
+        if missing:
+            first = [positions[0] for positions in missing.values()]
+            fresh = np.asarray(predict_fn(np.asarray(windows)[first])).reshape(-1)
+            for (key, positions), score in zip(missing.items(), fresh):
+                scores[positions] = score
+                self._store(key, float(score))
+
+        return scores
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
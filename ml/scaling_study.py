@@ -0,0 +1,347 @@
+"""
+Grounded App - Dataset Scaling Study
+How each training-pipeline stage scales with cohort size and history length.
+
+For every (n_users, days_per_user) point a fresh Python process runs:
+
+    generation    GroundedDataGenerator.generate_multi_user_dataset
+    features      DataPreprocessor.prepare_features
+    sequences     DataPreprocessor.create_sequences
+    train_epoch   build_model + one training epoch over all sequences
+
+and records wall time, CPU time and memory per stage (see pipeline_profiler).
+A fresh process per point keeps peak-RSS numbers independent of earlier points.
+
+After each point, time and memory are fitted as a power law in the number of
+rows (time ≈ c · rows^k) per stage, pooled over history lengths. Points whose projected
+time or memory would exceed the budget are skipped rather than run, so the
+sweep from 100 to 100k users finishes - and the skipped entries show which
+stage breaks first.
+
+Outputs a JSON report, a CSV table and a log-log plot.
+
+Usage:
+    python scaling_study.py --users 100,1000,10000,100000 --days 30,90
+    python scaling_study.py --max-stage-seconds 120 --max-rss-gb 8 --output-dir reports/scaling
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+
+STAGES = ['generation', 'features', 'sequences', 'train_epoch']
+DEFAULT_USERS = [100, 300, 1000, 3000, 10000, 30000, 100000]
+DEFAULT_DAYS = [30, 90]
+
+
+def probe(n_users, days_per_user, stages, seed=42):
+    """
+    Runs inside a fresh process: one pipeline pass at one scale.
+    Returns {stage: record} for the stages that ran.
+    """
+
+    import contextlib
+    import io
+
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    from pipeline_profiler import StageProfiler, peak_rss_mb
+    from traning_scriptv1 import GroundedDataGenerator, DataPreprocessor, build_model, keras, tf
+
+    np.random.seed(seed)
+    tf.random.set_seed(seed)
+    profiler = StageProfiler(trace_malloc=False)
+    result = {'n_users': n_users, 'days_per_user': days_per_user, 'stages': {}}
+
+    def run(name, fn):
+        peak_before = peak_rss_mb()
+        # The pipeline prints progress; keep stdout for the JSON result
+        with contextlib.redirect_stdout(io.StringIO()), profiler.stage(name):
+            value = fn()
+        record = profiler.stages[-1]
+        result['stages'][name] = {
+            'wall_s': record['wall_s'],
+            'cpu_s': record['cpu_s'],
+            'rss_after_mb': record['rss_after_mb'],
+            'peak_rss_mb': record['peak_rss_mb'],
+            # How much this stage pushed the process high-water mark
+            'peak_growth_mb': record['peak_rss_mb'] - peak_before,
+        }
+        return value
+
+    data = run('generation', lambda: GroundedDataGenerator().generate_multi_user_dataset(
+        n_users=n_users, days_per_user=days_per_user))
+    result['rows'] = len(data)
+    if 'features' not in stages:
+        return result
+
+    preprocessor = DataPreprocessor()
+    features = run('features', lambda: preprocessor.prepare_features(data))
+    if 'sequences' not in stages:
+        return result
+
+    X, y = run('sequences', lambda: preprocessor.create_sequences(
+        features, data['risk_label'].values, sequence_length=14,
+        user_ids=data['user_id'].values, day_nums=data['day_num'].values))
+    result['sequences'] = len(X)
+    if 'train_epoch' not in stages or len(X) == 0:
+        return result
+
+    def train_epoch():
+        model = build_model(X.shape[1], X.shape[2])
+        model.compile(optimizer=keras.optimizers.Adam(learning_rate=0.001),
+                      loss='binary_crossentropy',
+                      metrics=['accuracy', keras.metrics.AUC(name='auc')])
+        model.fit(X, y, epochs=1, batch_size=32, verbose=0)
+
+    run('train_epoch', train_epoch)
+    result['stages']['train_epoch']['samples_per_sec'] = (
+        len(X) / result['stages']['train_epoch']['wall_s'])
+    return result
+
+
+def run_probe(n_users, days_per_user, stages, seed):
+    """Run one point in a fresh interpreter and parse its JSON result."""
+    cmd = [sys.executable, os.path.abspath(__file__), '--probe', str(n_users), str(days_per_user),
+           '--stages', ','.join(stages), '--seed', str(seed)]
+    result = subprocess.run(cmd, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        return {'n_users': n_users, 'days_per_user': days_per_user, 'stages': {},
+                'error': lines[-1] if lines else f'exit code {result.returncode}'}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def fit_power_law(rows, values):
+    """
+    Least-squares fit of log(value) = log(c) + k·log(rows).
+    Returns (c, k), or None with fewer than two usable points.
+    """
+    rows, values = np.asarray(rows, dtype=float), np.asarray(values, dtype=float)
+    mask = (rows > 0) & (values > 0)
+    if mask.sum() < 2:
+        return None
+    k, log_c = np.polyfit(np.log(rows[mask]), np.log(values[mask]), 1)
+    return float(np.exp(log_c)), float(k)
+
+
+def complexity_label(k):
+    """Readable name for a fitted exponent."""
+    if k < 0.3:
+        return 'O(1)'
+    if k < 1.3:
+        return 'O(n)'
+    if k < 1.7:
+        return 'O(n^1.5)'
+    return 'O(n^2)'
+
+
+def fit_stages(points):
+    """
+    Power-law fits of wall time and memory growth per stage (pooled over days).
+
+    Only the larger half of the points is used: small runs are dominated by
+    fixed costs (model build, graph tracing) that would flatten the exponent.
+    """
+    fits = {}
+    for stage in STAGES:
+        done = sorted((p for p in points if stage in p['stages']), key=lambda p: p['rows'])
+        done = done[-max(2, len(done) // 2 + 1):]
+        rows = [p['rows'] for p in done]
+        time_fit = fit_power_law(rows, [p['stages'][stage]['wall_s'] for p in done])
+        mem_fit = fit_power_law(rows, [p['stages'][stage]['peak_growth_mb'] for p in done])
+        if time_fit is None:
+            continue
+        fits[stage] = {
+            'points': len(done),
+            'time_coeff': time_fit[0],
+            'time_exponent': time_fit[1],
+            'complexity': complexity_label(time_fit[1]),
+            'mem_coeff': mem_fit[0] if mem_fit else None,
+            'mem_exponent': mem_fit[1] if mem_fit else None,
+        }
+    return fits
+
+
+def project(points, stages, rows, max_stage_s, max_rss_mb):
+    """
+    Which stages fit the budget at `rows`, based on the points so far.
+    A stage that won't fit also rules out every later stage (they need its output).
+    Returns (stages_to_run, {stage: reason} for skipped ones).
+    """
+    fits = fit_stages(points)
+    baseline_mb = min((p['stages']['generation']['rss_after_mb'] - p['stages']['generation']['peak_growth_mb']
+                       for p in points if 'generation' in p['stages']), default=0.0)
+    planned, skipped = [], {}
+    projected_rss = baseline_mb
+    for stage in stages:
+        fit = fits.get(stage)
+        if fit:
+            wall = fit['time_coeff'] * rows ** fit['time_exponent']
+            if fit['mem_coeff']:
+                projected_rss += fit['mem_coeff'] * rows ** fit['mem_exponent']
+            reason = None
+            if max_stage_s and wall > max_stage_s:
+                reason = f"projected {wall:,.0f} s > {max_stage_s:,.0f} s"
+            elif max_rss_mb and projected_rss > max_rss_mb:
+                reason = f"projected peak {projected_rss/1024:,.1f} GB > {max_rss_mb/1024:,.1f} GB"
+            if reason:
+                skipped[stage] = reason
+                for later in stages[stages.index(stage) + 1:]:
+                    skipped[later] = f"needs {stage}"
+                break
+        planned.append(stage)
+    return planned, skipped
+
+
+def write_table(points, path):
+    """CSV with one row per (point, stage)."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['n_users', 'days_per_user', 'rows', 'stage', 'status',
+                         'wall_s', 'cpu_s', 'peak_growth_mb', 'peak_rss_mb'])
+        for p in points:
+            for stage in STAGES:
+                s = p['stages'].get(stage)
+                status = 'ok' if s else p.get('skipped', {}).get(stage, p.get('error', 'not run'))
+                writer.writerow([p['n_users'], p['days_per_user'], p.get('rows', ''), stage, status,
+                                 *(f"{s[k]:.4f}" if s else '' for k in
+                                   ('wall_s', 'cpu_s', 'peak_growth_mb', 'peak_rss_mb'))])
+
+
+def plot_study(points, fits, path):
+    """Log-log time and memory per stage against rows."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(1, 2, figsize=(13, 4.5))
+    for stage in STAGES:
+        done = sorted((p for p in points if stage in p['stages']), key=lambda p: p['rows'])
+        if not done:
+            continue
+        rows = [p['rows'] for p in done]
+        line, = axes[0].loglog(rows, [p['stages'][stage]['wall_s'] for p in done], 'o',
+                               label=f"{stage} ({fits[stage]['complexity']})" if stage in fits else stage)
+        axes[1].loglog(rows, [max(p['stages'][stage]['peak_growth_mb'], 1e-2) for p in done], 'o',
+                       color=line.get_color(), label=stage)
+        if stage in fits:
+            grid = np.geomspace(min(rows), max(rows), 50)
+            axes[0].loglog(grid, fits[stage]['time_coeff'] * grid ** fits[stage]['time_exponent'],
+                           '--', color=line.get_color(), alpha=0.6)
+
+    axes[0].set_title('Wall time per stage')
+    axes[0].set_ylabel('seconds')
+    axes[1].set_title('Peak RSS growth per stage')
+    axes[1].set_ylabel('MB')
+    for ax in axes:
+        ax.set_xlabel('rows (users × days)')
+        ax.grid(True, which='both', alpha=0.3)
+        ax.legend(fontsize=8)
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+
+
+def print_table(points, fits):
+    print(f"\n{'users':>8} {'days':>5} {'rows':>10} | " +
+          ' | '.join(f"{stage:>14}" for stage in STAGES))
+    print("─"*80)
+    for p in points:
+        cells = []
+        for stage in STAGES:
+            s = p['stages'].get(stage)
+            cells.append(f"{s['wall_s']:8.2f}s {s['peak_growth_mb']:4.0f}M" if s else f"{'skipped':>14}")
+        print(f"{p['n_users']:8,} {p['days_per_user']:5} {p.get('rows', 0):10,} | " + ' | '.join(cells))
+
+    print("\n📐 Fitted scaling (time ≈ c · rows^k):")
+    for stage, fit in fits.items():
+        mem = f" | memory k={fit['mem_exponent']:.2f}" if fit['mem_exponent'] is not None else ''
+        print(f"   • {stage:12} k={fit['time_exponent']:.2f} {fit['complexity']:9}{mem} ({fit['points']} points)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline scaling study")
+    parser.add_argument('--users', default=','.join(map(str, DEFAULT_USERS)))
+    parser.add_argument('--days', default=','.join(map(str, DEFAULT_DAYS)))
+    parser.add_argument('--stages', default=','.join(STAGES))
+    parser.add_argument('--max-stage-seconds', type=float, default=600,
+                        help="Skip stages projected to take longer than this (0 = no limit)")
+    parser.add_argument('--max-rss-gb', type=float, default=8,
+                        help="Skip stages projected to push peak RSS past this (0 = no limit)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output-dir', default='reports/scaling')
+    # Internal: one point in a fresh process
+    parser.add_argument('--probe', nargs=2, type=int, metavar=('N_USERS', 'DAYS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    stages = [s for s in STAGES if s in args.stages.split(',')]
+
+    if args.probe:
+        print(json.dumps(probe(args.probe[0], args.probe[1], stages, args.seed)))
+        return 0
+
+    print("="*80)
+    print(" "*27 + "PIPELINE SCALING STUDY")
+    print("="*80)
+
+    users = sorted(int(u) for u in args.users.split(','))
+    days = sorted(int(d) for d in args.days.split(','))
+    points = []
+    for days_per_user in days:
+        for n_users in users:
+            rows = n_users * days_per_user
+            planned, skipped = project(points, stages, rows, args.max_stage_seconds,
+                                       args.max_rss_gb * 1024)
+            if not planned:
+                print(f"   ⚠ {n_users:>7,} users × {days_per_user} days: skipped ({skipped['generation']})")
+                points.append({'n_users': n_users, 'days_per_user': days_per_user, 'rows': rows,
+                               'stages': {}, 'skipped': skipped})
+                continue
+
+            start = time.perf_counter()
+            point = run_probe(n_users, days_per_user, planned, args.seed)
+            point['skipped'] = skipped
+            points.append(point)
+            if 'error' in point:
+                print(f"   ✗ {n_users:>7,} users × {days_per_user} days: {point['error']}")
+                continue
+            notes = f" | skipped {', '.join(skipped)}" if skipped else ''
+            print(f"   • {n_users:>7,} users × {days_per_user} days: "
+                  f"{time.perf_counter() - start:7.1f} s total{notes}")
+
+    fits = fit_stages(points)
+    print_table(points, fits)
+
+    # The stage with the steepest time curve is the one that breaks first
+    if fits:
+        worst = max(fits, key=lambda s: fits[s]['time_coeff'] * max(p['rows'] for p in points) ** fits[s]['time_exponent'])
+        print(f"\n⚠ Slowest stage at {max(p['rows'] for p in points):,} rows: {worst}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    base = os.path.join(args.output_dir, f"scaling_{stamp}")
+    with open(base + '.json', 'w') as f:
+        json.dump({'created_at': datetime.now().isoformat(), 'seed': args.seed,
+                   'budget': {'max_stage_seconds': args.max_stage_seconds, 'max_rss_gb': args.max_rss_gb},
+                   'points': points, 'fits': fits}, f, indent=2)
+    write_table(points, base + '.csv')
+    try:
+        plot_study(points, fits, base + '.png')
+        print(f"✓ Plot saved to {base}.png")
+    except Exception as e:
+        print(f"⚠ Could not save plot: {e}")
+    print(f"✓ Results written to {base}.json and {base}.csv")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,406 @@
+"""
+Grounded App - Declarative Scenario Generator
+Expands a scenario spec into thousands of randomized histories per archetype
+and scores them all in batches.
+
+The hand-written scenarios in test_mlv1.py each produce exactly one history.
+Here an archetype is described once in JSON (or YAML, if PyYAML is
+installed) and expanded into as many variants as needed, stored as columnar
+arrays (one (n, days) array per field) so featurizing stays vectorized.
+
+Spec format (see scenarios/archetypes.json):
+
+    {
+      "seed": 42, "days": 14, "variants": 1000, "noise": 0.3,
+      "archetypes": {
+        "<name>": {
+          "expected_level": "low" | "moderate" | "high",
+          "start_day": 0-6 or omitted for random,
+          "use_probability": <prob spec>,
+          "used":     {<field>: <value spec>, ...},
+          "not_used": {<field>: <value spec>, ...}
+        }
+      }
+    }
+
+Value specs:
+    5                    constant
+    [lo, hi]             drawn once per variant, uniform
+    {"start": s, "end": e, "shape": "linear"|"step", "at": 0.5}
+                         trend across the window; s/e are constants or ranges
+    "night"              categorical constant
+    {"night": 0.7, ...}  categorical weights (drawn per day)
+
+Probability specs are a number, a 7-item list by weekday, or a trend dict
+whose start/end are either of those. Numeric fields get Gaussian noise
+(`noise`, per archetype or global) per day and are clipped to valid ranges.
+
+Usage:
+    python scenario_generator.py scenarios/archetypes.json --variants 5000
+    python scenario_generator.py spec.json --baseline reports/archetypes_v1.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from batch_features import CATEGORICAL_VOCABS, NUMERICAL_COLS, featurize_columns
+
+
+# Defaults match ScenarioTester.create_day
+FIELD_DEFAULTS = {
+    'amount': 0, 'cost': 0, 'mood': 5, 'sleep_quality': 7,
+    'craving_intensity': 3, 'reminder_opens': 0, 'messages_read': 0,
+}
+
+# Valid ranges after noise is added
+FIELD_BOUNDS = {
+    'amount': (0, None), 'cost': (0, None),
+    'mood': (1, 10), 'sleep_quality': (1, 10), 'craving_intensity': (1, 10),
+    'reminder_opens': (0, None), 'messages_read': (0, None),
+}
+
+COUNT_FIELDS = ['reminder_opens', 'messages_read']
+
+LEVELS = ['low', 'moderate', 'high']
+
+
+def load_spec(path):
+    """Load a scenario spec from JSON or YAML."""
+
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is needed for YAML specs: pip install pyyaml")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+class ScenarioGenerator:
+    """
+    Expands archetype specs into columnar histories.
+    """
+
+    def __init__(self, spec, seed=None):
+        self.spec = spec
+        self.n_days = spec.get('days', 14)
+        self.default_variants = spec.get('variants', 1000)
+        self.default_noise = spec.get('noise', 0.0)
+        self.rng = np.random.default_rng(spec.get('seed', 42) if seed is None else seed)
+        self.archetype_names = list(spec['archetypes'])
+
+    def _progress(self, shape, at):
+        """Position of each day in the window, 0 → 1."""
+        t = np.linspace(0.0, 1.0, self.n_days)
+        if shape == 'step':
+            t = (t >= at).astype(float)
+        return t
+
+    def _draw(self, value, n):
+        """Constant or [lo, hi] range → (n, 1) per-variant values."""
+        if isinstance(value, (list, tuple)):
+            return self.rng.uniform(value[0], value[1], size=(n, 1))
+        return np.full((n, 1), float(value))
+
+    def _numeric(self, spec, n):
+        """Resolve a numeric value spec into an (n, days) array."""
+        if isinstance(spec, dict):
+            t = self._progress(spec.get('shape', 'linear'), spec.get('at', 0.5))
+            start = self._draw(spec['start'], n)
+            end = self._draw(spec['end'], n)
+            return start + (end - start) * t
+        return np.broadcast_to(self._draw(spec, n), (n, self.n_days))
+
+    def _probability(self, spec, dow):
+        """Resolve a probability spec into an (n, days) array."""
+        if isinstance(spec, dict):
+            t = self._progress(spec.get('shape', 'linear'), spec.get('at', 0.5))
+            start = self._probability(spec['start'], dow)
+            end = self._probability(spec['end'], dow)
+            return start + (end - start) * t
+        if isinstance(spec, (list, tuple)):
+            return np.asarray(spec, dtype=float)[dow]
+        return np.full(dow.shape, float(spec))
+
+    def _categorical(self, spec, field, n):
+        """Resolve a categorical spec into (n, days) integer codes."""
+        vocab = CATEGORICAL_VOCABS[field]
+        if isinstance(spec, str):
+            return np.full((n, self.n_days), vocab.index(spec), dtype=np.int8)
+        codes = np.array([vocab.index(name) for name in spec], dtype=np.int8)
+        weights = np.array(list(spec.values()), dtype=float)
+        return self.rng.choice(codes, size=(n, self.n_days), p=weights / weights.sum())
+
+    def expand_archetype(self, name, n_variants=None):
+        """Generate `n_variants` histories for one archetype as columns."""
+
+        arch = self.spec['archetypes'][name]
+        n = n_variants or arch.get('variants', self.default_variants)
+        noise = arch.get('noise', self.default_noise)
+        used_spec = arch.get('used', {})
+        off_spec = arch.get('not_used', {})
+
+        # Day of week - fixed start or random per variant
+        start_day = arch.get('start_day')
+        if start_day is None:
+            start = self.rng.integers(0, 7, size=(n, 1))
+        else:
+            start = np.full((n, 1), start_day)
+        dow = ((start + np.arange(self.n_days)) % 7).astype(np.int8)
+
+        # Which days had use
+        p_use = np.clip(self._probability(arch.get('use_probability', 0.0), dow), 0, 1)
+        used = self.rng.random((n, self.n_days)) < p_use
+
+        columns = {'day_of_week': dow, 'frequency': used.astype(np.float64)}
+
+        # Categoricals only apply on use days
+        none_code = {field: len(vocab) - 1 for field, vocab in CATEGORICAL_VOCABS.items()}
+        for field in CATEGORICAL_VOCABS:
+            codes = self._categorical(used_spec.get(field, 'none'), field, n)
+            columns[field] = np.where(used, codes, none_code[field]).astype(np.int8)
+
+        for field in NUMERICAL_COLS:
+            on = self._numeric(used_spec.get(field, FIELD_DEFAULTS[field]), n)
+            if field in ('amount', 'cost'):
+                off = np.zeros((n, self.n_days))  # nothing used, nothing spent
+            else:
+                off = self._numeric(off_spec.get(field, FIELD_DEFAULTS[field]), n)
+            values = np.where(used, on, off)
+
+            if noise > 0:
+                values = values + self.rng.normal(0, noise, size=values.shape)
+            # Zero amount/cost stay zero on non-use days
+            if field in ('amount', 'cost'):
+                values = np.where(used, values, 0.0)
+
+            low, high = FIELD_BOUNDS[field]
+            values = np.clip(values, low, high)
+            if field in COUNT_FIELDS:
+                values = np.rint(values)
+            columns[field] = values
+
+        return columns
+
+    def expand(self, n_variants=None):
+        """
+        Expand every archetype and concatenate.
+        Adds an 'archetype' column (n,) with indices into archetype_names.
+        """
+
+        parts = []
+        for i, name in enumerate(self.archetype_names):
+            cols = self.expand_archetype(name, n_variants)
+            cols['archetype'] = np.full(len(cols['day_of_week']), i, dtype=np.int16)
+            parts.append(cols)
+
+        return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+
+def slice_columns(columns, start, stop):
+    """Row slice of a columnar batch."""
+    return {key: values[start:stop] for key, values in columns.items()}
+
+
+def score_columns(model, scaler, columns, batch_size=4096, cache=None):
+    """
+    Featurize and score columnar histories chunk by chunk.
+    Only one chunk of features is ever held in memory. With a
+    PredictionCache, windows already scored skip inference.
+
+    Returns (scores, featurize_s, predict_s).
+    """
+
+    n = len(columns['day_of_week'])
+    scores = np.empty(n, dtype=np.float32)
+    featurize_s = predict_s = 0.0
+
+    def predict(X):
+        return model.predict(X, batch_size=batch_size, verbose=0)[:, 0]
+
+    for start in range(0, n, batch_size):
+        chunk = slice_columns(columns, start, start + batch_size)
+
+        t0 = time.perf_counter()
+        X = featurize_columns(chunk, scaler)
+        t1 = time.perf_counter()
+        if cache is None:
+            scores[start:start + len(X)] = predict(X)
+        else:
+            scores[start:start + len(X)] = cache.predict(X, predict)
+        t2 = time.perf_counter()
+
+        featurize_s += t1 - t0
+        predict_s += t2 - t1
+
+    return scores, featurize_s, predict_s
+
+
+def score_levels(scores):
+    """Vectorized ScenarioTester thresholds: 0 low, 1 moderate, 2 high."""
+    return (scores > 0.4).astype(int) + (scores > 0.6).astype(int)
+
+
+def summarize_archetypes(spec, archetype_names, archetype_idx, scores, bins=20):
+    """Per-archetype score distribution."""
+
+    levels = score_levels(scores)
+    edges = np.linspace(0, 1, bins + 1)
+    summary = {}
+
+    for i, name in enumerate(archetype_names):
+        mask = archetype_idx == i
+        s = scores[mask]
+        lv = levels[mask]
+        expected = spec['archetypes'][name].get('expected_level')
+        q = np.percentile(s, [5, 25, 50, 75, 95])
+
+        summary[name] = {
+            'n': int(mask.sum()),
+            'mean': float(s.mean()),
+            'std': float(s.std()),
+            'min': float(s.min()),
+            'p05': float(q[0]), 'p25': float(q[1]), 'p50': float(q[2]),
+            'p75': float(q[3]), 'p95': float(q[4]),
+            'max': float(s.max()),
+            'level_fractions': {lvl: float((lv == j).mean()) for j, lvl in enumerate(LEVELS)},
+            'expected_level': expected,
+            'expected_match_rate': (float((lv == LEVELS.index(expected)).mean())
+                                    if expected in LEVELS else None),
+            'histogram': np.histogram(s, bins=edges)[0].tolist(),
+        }
+
+    return summary
+
+
+def population_stability_index(expected_counts, actual_counts, eps=1e-4):
+    """PSI between two histograms - above ~0.2 usually means real drift."""
+    e = np.asarray(expected_counts, dtype=float)
+    a = np.asarray(actual_counts, dtype=float)
+    e = np.clip(e / max(e.sum(), 1), eps, None)
+    a = np.clip(a / max(a.sum(), 1), eps, None)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def compare_to_baseline(summary, baseline, mean_tolerance=0.05, psi_threshold=0.2):
+    """Flag archetypes whose score distribution moved against a baseline report."""
+
+    drift = {}
+    for name, current in summary.items():
+        old = baseline.get('archetypes', {}).get(name)
+        if old is None:
+            continue
+        delta_mean = current['mean'] - old['mean']
+        psi = population_stability_index(old['histogram'], current['histogram'])
+        drift[name] = {
+            'delta_mean': delta_mean,
+            'delta_p50': current['p50'] - old['p50'],
+            'psi': psi,
+            'drifted': abs(delta_mean) > mean_tolerance or psi > psi_threshold,
+        }
+    return drift
+
+
+def print_report(report):
+    """Console table of per-archetype distributions."""
+
+    print("\n" + "="*80)
+    print(" "*22 + "ARCHETYPE SCORE DISTRIBUTIONS")
+    print("="*80)
+    print(f"{'Archetype':28} {'n':>6} {'mean':>6} {'p05':>6} {'p50':>6} {'p95':>6} {'match':>6}")
+    for name, s in report['archetypes'].items():
+        match = f"{s['expected_match_rate']*100:5.1f}%" if s['expected_match_rate'] is not None else '   - '
+        print(f"{name:28} {s['n']:6d} {s['mean']:6.3f} {s['p05']:6.3f} "
+              f"{s['p50']:6.3f} {s['p95']:6.3f} {match:>6}")
+
+    t = report['timings']
+    print(f"\n⏱  Generate: {t['generate_s']:.2f}s | Featurize: {t['featurize_s']:.2f}s | "
+          f"Predict: {t['predict_s']:.2f}s | {t['windows_per_sec']:,.0f} windows/sec")
+
+    if report.get('drift'):
+        drifted = [name for name, d in report['drift'].items() if d['drifted']]
+        print(f"📉 Drift vs baseline: {len(drifted)} archetype(s) moved"
+              + (f" → {', '.join(drifted)}" if drifted else ""))
+    print("="*80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expand and score a scenario spec")
+    parser.add_argument('spec', nargs='?', default='scenarios/archetypes.json')
+    parser.add_argument('--model', default='models/grounded_model.h5')
+    parser.add_argument('--scaler', default='models/feature_scaler.pkl')
+    parser.add_argument('--variants', type=int, default=None,
+                        help="Override variants per archetype")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=4096)
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help="Cache scores for up to N distinct windows")
+    parser.add_argument('--output', default='reports/archetypes.json')
+    parser.add_argument('--baseline', default=None,
+                        help="Earlier report to check for score drift")
+    parser.add_argument('--mean-tolerance', type=float, default=0.05)
+    parser.add_argument('--psi-threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    from test_mlv1 import ScenarioTester
+
+    spec = load_spec(args.spec)
+    generator = ScenarioGenerator(spec, seed=args.seed)
+
+    start = time.perf_counter()
+    columns = generator.expand(args.variants)
+    generate_s = time.perf_counter() - start
+    n = len(columns['archetype'])
+    print(f"✓ Expanded {len(generator.archetype_names)} archetypes into {n:,} histories")
+
+    tester = ScenarioTester(args.model, args.scaler, cache_size=args.cache_size)
+    scores, featurize_s, predict_s = score_columns(
+        tester.model, tester.scaler, columns, batch_size=args.batch_size, cache=tester.cache)
+
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'spec': args.spec,
+        'model_path': args.model,
+        'n_windows': n,
+        'timings': {
+            'generate_s': generate_s,
+            'featurize_s': featurize_s,
+            'predict_s': predict_s,
+            'windows_per_sec': n / (featurize_s + predict_s) if featurize_s + predict_s > 0 else None,
+        },
+        'archetypes': summarize_archetypes(spec, generator.archetype_names,
+                                           columns['archetype'], scores),
+    }
+
+    if tester.cache is not None:
+        report['cache'] = tester.cache.stats()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report['drift'] = compare_to_baseline(report['archetypes'], baseline,
+                                              args.mean_tolerance, args.psi_threshold)
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print_report(report)
+    print(f"✓ Report written to {args.output}")
+
+    if report.get('drift') and any(d['drifted'] for d in report['drift'].values()):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+Grounded App - Headless Scenario Runner
+Runs every ScenarioTester scenario without prompts and writes a report.
+
+All scenario windows are stacked into one batch so the model is called once,
+which keeps the run fast enough for automation. The report (JSON or CSV)
+holds the per-scenario scores plus timings, so both accuracy and throughput
+can be tracked between model builds.
+
+Usage:
+    python scenario_runner.py --output reports/scenarios.json
+    python scenario_runner.py --format csv --output reports/scenarios.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from test_mlv1 import ScenarioTester
+
+
+# What each scenario is meant to look like to the model.
+# Keyed by builder name so renaming a scenario doesn't break the mapping.
+EXPECTED_LEVELS = {
+    'build_scenario_1': 'low',       # Weekend social drinker
+    'build_scenario_2': 'high',      # Heavy regular user
+    'build_scenario_3': 'high',      # Escalating stress drinker
+    'build_scenario_4': 'low',       # Cutting back
+    'build_scenario_5': 'high',      # Cannabis for emotional escape
+    'build_scenario_6': 'moderate',  # Party drug user
+    'build_scenario_7': 'high',      # Escalating stimulant user
+    'build_scenario_8': 'high',      # Polydrug user
+    'build_scenario_9': 'low',       # Medical cannabis user
+    'build_scenario_10': 'high',     # Recovery relapse
+}
+
+
+def risk_level(score):
+    """Same thresholds as ScenarioTester.print_scenario_result."""
+    if score > 0.6:
+        return 'high'
+    if score > 0.4:
+        return 'moderate'
+    return 'low'
+
+
+def run_scenarios(tester):
+    """
+    Build every scenario, featurize, and score them all in one predict call.
+
+    Returns a report dict with one entry per scenario and batch timings.
+    """
+
+    builders = tester.scenario_builders()
+    total_start = time.perf_counter()
+
+    # Build histories
+    start = time.perf_counter()
+    built = [(builder.__name__, *builder()) for builder in builders]
+    build_s = time.perf_counter() - start
+
+    # Featurize each history (timed individually so slow scenarios stand out)
+    windows, featurize_ms = [], []
+    for _, _, history in built:
+        start = time.perf_counter()
+        windows.append(tester.history_to_window(history))
+        featurize_ms.append((time.perf_counter() - start) * 1000)
+
+    # One inference call for the whole batch
+    batch = np.stack(windows)
+    start = time.perf_counter()
+    scores = tester.score_windows(batch)
+    predict_s = time.perf_counter() - start
+
+    total_s = time.perf_counter() - total_start
+
+    scenarios = []
+    for (builder_name, name, history), score, feat_ms in zip(built, scores, featurize_ms):
+        level = risk_level(float(score))
+        expected = EXPECTED_LEVELS.get(builder_name)
+        scenarios.append({
+            'builder': builder_name,
+            'name': name,
+            'days': len(history),
+            'score': round(float(score), 6),
+            'level': level,
+            'expected_level': expected,
+            'matched': None if expected is None else level == expected,
+            'featurize_ms': round(feat_ms, 3),
+        })
+
+    judged = [s['matched'] for s in scenarios if s['matched'] is not None]
+
+    return {
+        'generated_at': datetime.now().isoformat(),
+        'n_scenarios': len(scenarios),
+        'accuracy': float(np.mean(judged)) if judged else None,
+        'timings': {
+            'build_s': round(build_s, 6),
+            'featurize_s': round(sum(featurize_ms) / 1000, 6),
+            'predict_s': round(predict_s, 6),
+            'total_s': round(total_s, 6),
+            'windows_per_sec': round(len(batch) / predict_s, 2) if predict_s > 0 else None,
+        },
+        'scenarios': scenarios,
+    }
+
+
+def write_report(report, output_path, fmt='json'):
+    """Write the report as JSON (everything) or CSV (one row per scenario)."""
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    if fmt == 'json':
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        return
+
+    # CSV: batch timings are repeated on every row so each row stands alone
+    fields = list(report['scenarios'][0].keys()) + ['predict_s', 'total_s']
+    with open(output_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for row in report['scenarios']:
+            writer.writerow({**row,
+                             'predict_s': report['timings']['predict_s'],
+                             'total_s': report['timings']['total_s']})
+
+
+def print_summary(report):
+    """Short console summary - the file is the real output."""
+
+    print("\n" + "="*80)
+    print(" "*25 + "HEADLESS SCENARIO RUN")
+    print("="*80)
+    for s in report['scenarios']:
+        mark = '' if s['matched'] is None else ('✓' if s['matched'] else '✗')
+        print(f"{s['name']:36} | {s['score']:.3f} {s['level']:8} {mark}")
+
+    t = report['timings']
+    print(f"\n⏱  Featurize: {t['featurize_s']*1000:.1f} ms | "
+          f"Predict: {t['predict_s']*1000:.1f} ms | Total: {t['total_s']*1000:.1f} ms")
+    if report['accuracy'] is not None:
+        print(f"🎯 Level accuracy: {report['accuracy']*100:.1f}%")
+    print("="*80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run all scenarios headlessly")
+    parser.add_argument('--model', default='models/grounded_model.h5')
+    parser.add_argument('--scaler', default='models/feature_scaler.pkl')
+    parser.add_argument('--format', choices=['json', 'csv'], default='json')
+    parser.add_argument('--output', default='reports/scenarios.json')
+    parser.add_argument('--min-accuracy', type=float, default=None,
+                        help="Exit non-zero if level accuracy falls below this")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print("❌ Error: Model not found!")
+        print("Please run the training script first: python traning_scriptv1.py")
+        return 1
+
+    tester = ScenarioTester(args.model, args.scaler)
+    report = run_scenarios(tester)
+    write_report(report, args.output, args.format)
+    print_summary(report)
+    print(f"✓ Report written to {args.output}")
+
+    if args.min_accuracy is not None and (report['accuracy'] or 0) < args.min_accuracy:
+        print(f"✗ Accuracy below threshold {args.min_accuracy:.2f}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
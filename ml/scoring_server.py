@@ -0,0 +1,445 @@
+"""
+Grounded App - Local Scoring Service
+A small asyncio HTTP server around ScenarioTester's model, for QA and as a
+local stand-in for the app backend.
+
+Calling model.predict once per request spends most of its time in per-call
+overhead, so requests are collected into micro-batches: the batcher waits
+for the first request, then keeps collecting until either `max_batch`
+requests are queued or `max_wait_ms` has passed, and runs one inference for
+the whole batch. Featurizing uses the vectorized batch_features path, which
+matches ScenarioTester.prepare_features.
+
+Each history is validated and featurized when its request arrives, so a
+malformed one gets its own 400 and the batcher only stacks ready windows -
+one bad request can't fail the others batched with it.
+
+Endpoints:
+    POST /predict   {"history": [day, ...]}  → {"risk_score": 0.42, ...}
+                    (days as produced by ScenarioTester.create_day, ≥14)
+    GET  /metrics   latency histograms and batch-size stats
+    GET  /health
+
+A load generator is bundled to benchmark latency against offered QPS:
+
+Usage:
+    python scoring_server.py serve --port 8765 --max-batch 64 --max-wait-ms 5
+    python scoring_server.py loadgen --port 8765 --qps 50,200,800 --duration 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from batch_features import CATEGORICAL_VOCABS, NUMERICAL_COLS, featurize_columns, histories_to_columns
+
+
+SEQUENCE_LENGTH = 14
+
+
+def validate_history(history):
+    """
+    Error message for a request history that can't be featurized, or None.
+    Days need the create_day fields with the right types.
+    """
+    if not isinstance(history, list):
+        return "'history' must be a list of days"
+    if len(history) < SEQUENCE_LENGTH:
+        return f"need {SEQUENCE_LENGTH} days of history, got {len(history)}"
+    first = len(history) - SEQUENCE_LENGTH
+    for i, day in enumerate(history[first:], start=first):
+        if not isinstance(day, dict):
+            return f"day {i} is not an object"
+        for field in CATEGORICAL_VOCABS:
+            if not isinstance(day.get(field), str):
+                return f"day {i}: '{field}' must be a string"
+        for field in NUMERICAL_COLS + ['frequency']:
+            value = day.get(field)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not np.isfinite(value):
+                return f"day {i}: '{field}' must be a number"
+        day_of_week = day.get('day_of_week')
+        if isinstance(day_of_week, bool) or not isinstance(day_of_week, int) or not 0 <= day_of_week <= 6:
+            return f"day {i}: 'day_of_week' must be an integer 0-6"
+    return None
+
+
+class LatencyHistogram:
+    """
+    Fixed log-spaced buckets (ms) plus a window of recent samples
+    for percentiles.
+    """
+
+    BOUNDS_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+    def __init__(self, window=10_000):
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.recent = deque(maxlen=window)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[int(np.searchsorted(self.BOUNDS_MS, ms))] += 1
+        self.recent.append(ms)
+        self.total += 1
+        self.sum_ms += ms
+
+    def snapshot(self):
+        samples = np.array(self.recent) if self.recent else np.zeros(1)
+        labels = [f"le_{b}" for b in self.BOUNDS_MS] + ['inf']
+        return {
+            'count': self.total,
+            'mean_ms': self.sum_ms / self.total if self.total else 0.0,
+            'p50_ms': float(np.percentile(samples, 50)),
+            'p90_ms': float(np.percentile(samples, 90)),
+            'p99_ms': float(np.percentile(samples, 99)),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class MicroBatcher:
+    """
+    Queues single-history requests and scores them in batches.
+    """
+
+    def __init__(self, model, scaler, max_batch=64, max_wait_ms=5.0, cache=None):
+        self.model = model
+        self.scaler = scaler
+        self.cache = cache
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.batch_sizes = deque(maxlen=10_000)
+        self.queue_wait = LatencyHistogram()
+        self.inference = LatencyHistogram()
+        self.end_to_end = LatencyHistogram()
+
+    def featurize(self, history):
+        """(SEQUENCE_LENGTH, n_features) window of one history; ValueError if malformed."""
+        error = validate_history(history)
+        if error:
+            raise ValueError(error)
+        return featurize_columns(histories_to_columns([history], SEQUENCE_LENGTH), self.scaler)[0]
+
+    async def predict(self, window):
+        """Enqueue one featurized window and wait for its score."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((window, time.perf_counter(), future))
+        return await future
+
+    def _infer(self, windows):
+        X = np.stack(windows)
+        if self.cache is None:
+            return self._run_model(X)
+        return self.cache.predict(X, self._run_model)
+
+    def _run_model(self, X):
+        # Calling the model directly skips predict()'s per-call setup,
+        # which dominates at micro-batch sizes
+        return self.model(X, training=False).numpy()[:, 0]
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            start = time.perf_counter()
+            for _, enqueued, _ in batch:
+                self.queue_wait.observe((start - enqueued) * 1000)
+
+            try:
+                # Run in a thread so the event loop keeps accepting requests
+                scores = await loop.run_in_executor(None, self._infer, [w for w, _, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            self.inference.observe((done - start) * 1000)
+            self.batch_sizes.append(len(batch))
+            for (_, enqueued, future), score in zip(batch, scores):
+                self.end_to_end.observe((done - enqueued) * 1000)
+                if not future.done():
+                    future.set_result((float(score), len(batch)))
+
+    def metrics(self):
+        sizes = np.array(self.batch_sizes) if self.batch_sizes else np.zeros(1)
+        return {
+            'cache': self.cache.stats() if self.cache is not None else None,
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'batches': len(self.batch_sizes),
+            'mean_batch_size': float(sizes.mean()),
+            'max_batch_size_seen': int(sizes.max()),
+            'queue_wait': self.queue_wait.snapshot(),
+            'inference': self.inference.snapshot(),
+            'end_to_end': self.end_to_end.snapshot(),
+        }
+
+
+# ---------------------------------------------------------------------------
+# Minimal HTTP/1.1 handling (stdlib only)
+# ---------------------------------------------------------------------------
+
+async def read_request(reader):
+    """Parse one request into (method, path, headers, body)."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    method, path, _ = lines[0].split(' ', 2)
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+def http_response(status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}[status]
+    head = (f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+
+class ScoringServer:
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    method, path, headers, body = await read_request(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except (ValueError, asyncio.LimitOverrunError):
+                    # Bad request line, Content-Length or oversized head: the stream
+                    # position is unknown, so answer once and close
+                    writer.write(http_response(400, {'error': "malformed HTTP request"}, keep_alive=False))
+                    await writer.drain()
+                    break
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                status, payload = await self.route(method, path, body)
+                writer.write(http_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok'}
+        if method == 'GET' and path == '/metrics':
+            return 200, self.batcher.metrics()
+        if method == 'POST' and path == '/predict':
+            try:
+                history = json.loads(body)['history']
+            except (ValueError, KeyError, TypeError):
+                return 400, {'error': "expected JSON body with a 'history' list"}
+            try:
+                window = self.batcher.featurize(history)
+            except ValueError as e:
+                return 400, {'error': str(e)}
+            try:
+                score, batch_size = await self.batcher.predict(window)
+            except Exception as e:
+                return 500, {'error': str(e)}
+            return 200, {'risk_score': score, 'batch_size': batch_size}
+        return 404, {'error': f"no route for {method} {path}"}
+
+
+async def serve(args):
+    from test_mlv1 import ScenarioTester
+
+    tester = ScenarioTester(args.model, args.scaler, cache_size=args.cache_size)
+    batcher = MicroBatcher(tester.model, tester.scaler, args.max_batch, args.max_wait_ms,
+                           cache=tester.cache)
+
+    # Warm up so the first request doesn't pay for graph tracing
+    # (straight to the model so the dummy window doesn't land in the cache)
+    dummy = [tester.create_day(day_of_week=d % 7) for d in range(SEQUENCE_LENGTH)]
+    window = featurize_columns(histories_to_columns([dummy]), tester.scaler)
+    for size in (1, args.max_batch):
+        batcher._run_model(np.repeat(window, size, axis=0))
+
+    server = await asyncio.start_server(ScoringServer(batcher).handle, args.host, args.port)
+    # Keep a reference: the loop only holds tasks weakly
+    batcher_task = asyncio.create_task(batcher.run())
+    batcher_task.add_done_callback(_report_batcher_exit)
+
+    print(f"\n✓ Serving on http://{args.host}:{args.port} "
+          f"(max batch {args.max_batch}, max wait {args.max_wait_ms} ms)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batcher_task.cancel()
+        try:
+            await batcher_task
+        except asyncio.CancelledError:
+            pass
+
+
+def _report_batcher_exit(task):
+    """The batcher loop never returns on its own - make a crash visible."""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"❌ Batcher stopped: {task.exception()!r}", file=sys.stderr)
+
+
+# ---------------------------------------------------------------------------
+# Load generator
+# ---------------------------------------------------------------------------
+
+def sample_payloads(n, seed=0):
+    """Random request bodies built from the archetype spec."""
+    from batch_features import columns_to_histories
+    from scenario_generator import ScenarioGenerator, load_spec
+
+    spec = load_spec(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'scenarios', 'archetypes.json'))
+    generator = ScenarioGenerator(spec, seed=seed)
+    per_archetype = max(1, n // len(generator.archetype_names))
+    histories = columns_to_histories(generator.expand(per_archetype))
+    return [json.dumps({'history': h}).encode() for h in histories]
+
+
+async def send_one(host, port, body):
+    """One POST /predict on a fresh connection. Returns latency in ms."""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write((f"POST /predict HTTP/1.1\r\nHost: {host}\r\n"
+                      f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                      f"Connection: close\r\n\r\n").encode() + body)
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        if b' 200 ' not in status_line:
+            raise RuntimeError(status_line.decode().strip())
+    finally:
+        writer.close()
+    return (time.perf_counter() - start) * 1000
+
+
+async def run_load(host, port, qps, duration, payloads):
+    """Open-loop load at a fixed arrival rate (requests don't wait on each other)."""
+    interval = 1.0 / qps
+    n_requests = int(qps * duration)
+    latencies, errors = [], 0
+    tasks = []
+
+    start = time.perf_counter()
+    for i in range(n_requests):
+        delay = start + i * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send_one(host, port, payloads[i % len(payloads)])))
+
+    for result in await asyncio.gather(*tasks, return_exceptions=True):
+        if isinstance(result, Exception):
+            errors += 1
+        else:
+            latencies.append(result)
+    elapsed = time.perf_counter() - start
+
+    lat = np.array(latencies) if latencies else np.full(1, np.nan)
+    return {
+        'target_qps': qps,
+        'achieved_qps': len(latencies) / elapsed,
+        'requests': n_requests,
+        'errors': errors,
+        'p50_ms': float(np.percentile(lat, 50)),
+        'p90_ms': float(np.percentile(lat, 90)),
+        'p99_ms': float(np.percentile(lat, 99)),
+        'max_ms': float(np.max(lat)),
+    }
+
+
+async def loadgen(args):
+    payloads = sample_payloads(args.payloads)
+    results = []
+
+    print("\n" + "="*80)
+    print(" "*28 + "SCORING LOAD TEST")
+    print("="*80)
+    print(f"{'target qps':>10} {'achieved':>10} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'errors':>7}")
+
+    for qps in args.qps:
+        r = await run_load(args.host, args.port, qps, args.duration, payloads)
+        results.append(r)
+        print(f"{r['target_qps']:10.0f} {r['achieved_qps']:10.1f} {r['p50_ms']:9.2f} "
+              f"{r['p90_ms']:9.2f} {r['p99_ms']:9.2f} {r['errors']:7d}")
+
+    # Server-side view of the same run
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    writer.write(f"GET /metrics HTTP/1.1\r\nHost: {args.host}\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    server_metrics = json.loads(raw.split(b'\r\n\r\n', 1)[1])
+    print(f"\nServer: {server_metrics['batches']:,} batches, "
+          f"mean batch size {server_metrics['mean_batch_size']:.1f}")
+    print("="*80)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'load': results, 'server': server_metrics}, f, indent=2)
+        print(f"✓ Results written to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grounded local scoring service")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    srv = commands.add_parser('serve', help="Run the scoring server")
+    srv.add_argument('--host', default='127.0.0.1')
+    srv.add_argument('--port', type=int, default=8765)
+    srv.add_argument('--model', default='models/grounded_model.h5')
+    srv.add_argument('--scaler', default='models/feature_scaler.pkl')
+    srv.add_argument('--max-batch', type=int, default=64)
+    srv.add_argument('--max-wait-ms', type=float, default=5.0)
+    srv.add_argument('--cache-size', type=int, default=0,
+                     help="Cache scores for up to N distinct windows")
+
+    gen = commands.add_parser('loadgen', help="Benchmark a running server")
+    gen.add_argument('--host', default='127.0.0.1')
+    gen.add_argument('--port', type=int, default=8765)
+    gen.add_argument('--qps', type=lambda s: [float(q) for q in s.split(',')],
+                     default=[50, 200, 800])
+    gen.add_argument('--duration', type=float, default=10.0, help="Seconds per QPS level")
+    gen.add_argument('--payloads', type=int, default=500, help="Distinct histories to send")
+    gen.add_argument('--output', default=None)
+
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args) if args.command == 'serve' else loadgen(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
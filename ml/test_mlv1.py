@@ -6,10 +6,15 @@ Tests the trained risk prediction model with realistic user scenarios
 import numpy as np
 import pandas as pd
 import tensorflow as tf
-from tensorflow import keras
 import joblib
 import json
 import os
+import time
+
+from batch_features import featurize_columns, histories_to_columns
+from model_formats import load_keras_model
+from prediction_cache import PredictionCache, model_version_for
+from variable_length import MAX_HISTORY_DAYS
 
 
 class ScenarioTester:
@@ -18,20 +23,35 @@ class ScenarioTester:
     """
     
     def __init__(self, model_path='models/grounded_model.h5', 
-                 scaler_path='models/feature_scaler.pkl'):
-        """Load the trained model and preprocessor."""
+                 scaler_path='models/feature_scaler.pkl', cache_size=0):
+        """
+        Load the trained model and preprocessor.
+        
+        With cache_size > 0, scores are cached per window (see
+        prediction_cache.py) so repeated windows skip inference.
+        """
         
         print("="*80)
         print(" "*25 + "LOADING MODEL")
         print("="*80)
         
-        self.model = keras.models.load_model(model_path)
+        start = time.perf_counter()
+        self.model, model_format = load_keras_model(model_path)
+        load_ms = (time.perf_counter() - start) * 1000
         self.scaler = joblib.load(scaler_path)
         
-        print(f"✓ Model loaded from {model_path}")
+        print(f"✓ Model loaded from {model_path} ({model_format}, {load_ms:.0f} ms)")
         print(f"✓ Scaler loaded from {scaler_path}")
         print(f"✓ Input shape: {self.model.input_shape}")
         
+        # None for variable-length models (variable_length.py), which take 1-90 days
+        self.window_length = self.model.input_shape[1]
+        
+        self.cache = None
+        if cache_size:
+            self.cache = PredictionCache(cache_size, model_version=model_version_for(model_path))
+            print(f"✓ Prediction cache: up to {cache_size:,} windows")
+        
         # Categories matching training
         self.contexts = ['alone', 'friends', 'family', 'work', 'party', 'none']
         self.times = ['morning', 'afternoon', 'evening', 'night', 'none']
@@ -108,29 +128,89 @@ class ScenarioTester:
     
     def predict_from_history(self, days_history):
         """
-        Predict risk for the next day given 14 days of history.
+        Predict risk for the next day given 14 days of history
+        (1-90 days with a variable-length model).
         """
         
-        if len(days_history) < 14:
-            print(f"⚠ Warning: Need 14 days of history, got {len(days_history)}")
+        length = self.history_length(days_history)
+        if length is None:
             return None
         
-        # Take last 14 days
-        recent_days = days_history[-14:]
+        # Reshape for model input (1 sequence, length days, n_features)
+        sequence = self.history_to_window(days_history, length)[np.newaxis]
+        
+        # Predict
+        prediction = self.score_windows(sequence)[0]
+        
+        return prediction
+    
+    
+    def history_length(self, days_history):
+        """Days of the history the model will see, or None (with a warning) if too short."""
+        
+        if self.window_length is None:
+            if not days_history:
+                print("⚠ Warning: Need at least 1 day of history")
+                return None
+            return min(len(days_history), MAX_HISTORY_DAYS)
+        
+        if len(days_history) < self.window_length:
+            print(f"⚠ Warning: Need {self.window_length} days of history, got {len(days_history)}")
+            return None
+        return self.window_length
+    
+    
+    def history_to_window(self, days_history, length=14):
+        """Featurize the last `length` days of a history into a (length, n_features) window."""
+        
+        # Take last `length` days
+        recent_days = days_history[-length:]
         
         # Convert to DataFrame
         df = pd.DataFrame(recent_days)
         
         # Prepare features
-        features = self.prepare_features(df)
+        return self.prepare_features(df)
+    
+    
+    def predict_batch(self, histories):
+        """
+        Predict risk for many histories with a single model call.
         
-        # Reshape for model input (1 sequence, 14 days, n_features)
-        sequence = features.reshape(1, 14, -1)
+        A fixed-window model needs at least window_length (14) days per
+        history and scores its last 14. A variable-length model takes 1-90
+        days; histories are grouped by length and each group is scored
+        unpadded in one call. Returns a 1-D array of scores in the same
+        order as the input.
+        """
         
-        # Predict
-        prediction = self.model.predict(sequence, verbose=0)[0][0]
+        min_days = self.window_length or 1
+        short = [i for i, h in enumerate(histories) if len(h) < min_days]
+        if short:
+            raise ValueError(f"Histories {short} have fewer than {min_days} days")
         
-        return prediction
+        if self.window_length is not None:
+            windows = featurize_columns(histories_to_columns(histories, self.window_length), self.scaler)
+            return self.score_windows(windows)
+        
+        lengths = np.array([min(len(h), MAX_HISTORY_DAYS) for h in histories])
+        scores = np.empty(len(histories), dtype=np.float32)
+        for length in np.unique(lengths):
+            group = np.flatnonzero(lengths == length)
+            windows = featurize_columns(histories_to_columns([histories[i] for i in group], length), self.scaler)
+            scores[group] = self.score_windows(windows)
+        return scores
+    
+    
+    def score_windows(self, windows):
+        """Score featurized windows in one call, going through the cache if enabled."""
+        
+        def predict(X):
+            return self.model.predict(X, batch_size=len(X), verbose=0)[:, 0]
+        
+        if self.cache is None:
+            return predict(windows)
+        return self.cache.predict(windows, predict)
     
     
     def print_scenario_result(self, scenario_name, prediction, history):
@@ -186,7 +266,7 @@ class ScenarioTester:
         print(f"{'='*80}\n")
     
     
-    def test_scenario_1(self):
+    def build_scenario_1(self):
         """
         SCENARIO 1: Weekend Social Drinker
         User drinks mostly on weekends with friends at parties.
@@ -221,13 +301,10 @@ class ScenarioTester:
                     day_of_week=day_of_week
                 ))
         
-        prediction = self.predict_from_history(history)
-        self.print_scenario_result("Weekend Social Drinker", prediction, history)
-        
-        return prediction
+        return "Weekend Social Drinker", history
     
     
-    def test_scenario_2(self):
+    def build_scenario_2(self):
         """
         SCENARIO 2: Heavy Regular User  
         User drinks 6 pegs + beers almost every night at 8pm.
@@ -263,13 +340,10 @@ class ScenarioTester:
                     day_of_week=day_of_week
                 ))
         
-        prediction = self.predict_from_history(history)
-        self.print_scenario_result("Heavy Regular User (High Risk)", prediction, history)
-        
-        return prediction
+        return "Heavy Regular User (High Risk)", history
     
     
-    def test_scenario_3(self):
+    def build_scenario_3(self):
         """
         SCENARIO 3: Stress Drinker
         Occasional user, but recent stress leading to more frequent alone drinking.
@@ -327,13 +401,10 @@ class ScenarioTester:
                     day_of_week=day_of_week
                 ))
         
-        prediction = self.predict_from_history(history)
-        self.print_scenario_result("Escalating Stress Drinker", prediction, history)
-        
-        return prediction
+        return "Escalating Stress Drinker", history
     
     
-    def test_scenario_4(self):
+    def build_scenario_4(self):
         """
         SCENARIO 4: Cutting Back Successfully
         Was drinking daily, now tapering down with app support.
@@ -387,13 +458,10 @@ class ScenarioTester:
                     day_of_week=day_of_week
                 ))
         
-        prediction = self.predict_from_history(history)
-        self.print_scenario_result("User Cutting Back (Improvement)", prediction, history)
-        
-        return prediction
+        return "User Cutting Back (Improvement)", history
     
     
-    def test_scenario_5(self):
+    def build_scenario_5(self):
         """
         SCENARIO 5: Cannabis User for Escapism
         Uses weed daily, mostly alone at night to cope with stress/anxiety.
@@ -444,13 +512,10 @@ class ScenarioTester:
                     day_of_week=day_of_week
                 ))
         
-        prediction = self.predict_from_history(history)
-        self.print_scenario_result("Cannabis User (Emotional Escape)", prediction, history)
-        
-        return prediction
+        return "Cannabis User (Emotional Escape)", history
     
     
-    def test_scenario_6(self):
+    def build_scenario_6(self):
         """
         SCENARIO 6: Party Drug User (MDMA/LSD)
         Recreational psychedelic/party drug use on weekends.
@@ -488,13 +553,10 @@ class ScenarioTester:
                     day_of_week=day_of_week
                 ))
         
-        prediction = self.predict_from_history(history)
-        self.print_scenario_result("Psychedelic/Party Drug User", prediction, history)
-        
-        return prediction
+        return "Psychedelic/Party Drug User", history
     
     
-    def test_scenario_7(self):
+    def build_scenario_7(self):
         """
         SCENARIO 7: Stimulant User (Meth/Cocaine Pattern)
         Started recreational, now showing concerning frequency.
@@ -554,13 +616,10 @@ class ScenarioTester:
                         day_of_week=day_of_week
                     ))
         
-        prediction = self.predict_from_history(history)
-        self.print_scenario_result("Stimulant User (Escalating)", prediction, history)
-        
-        return prediction
+        return "Stimulant User (Escalating)", history
     
     
-    def test_scenario_8(self):
+    def build_scenario_8(self):
         """
         SCENARIO 8: Polydrug User
         Mixing different substances - cannabis, alcohol, occasionally harder drugs.
@@ -599,13 +658,10 @@ class ScenarioTester:
                     day_of_week=day_of_week
                 ))
         
-        prediction = self.predict_from_history(history)
-        self.print_scenario_result("Polydrug User (Multiple Substances)", prediction, history)
-        
-        return prediction
+        return "Polydrug User (Multiple Substances)", history
     
     
-    def test_scenario_9(self):
+    def build_scenario_9(self):
         """
         SCENARIO 9: Medical Cannabis User (Low Risk)
         Uses cannabis therapeutically, consistent dosing, good mental health.
@@ -634,13 +690,10 @@ class ScenarioTester:
                 day_of_week=day_of_week
             ))
         
-        prediction = self.predict_from_history(history)
-        self.print_scenario_result("Medical Cannabis User (Therapeutic)", prediction, history)
-        
-        return prediction
+        return "Medical Cannabis User (Therapeutic)", history
     
     
-    def test_scenario_10(self):
+    def build_scenario_10(self):
         """
         SCENARIO 10: Recovery Relapse Pattern
         User had clean period, now relapsing with binge pattern.
@@ -679,13 +732,33 @@ class ScenarioTester:
                 day_of_week=day_of_week
             ))
         
+        return "Recovery Relapse (Critical)", history
+    
+    
+    def scenario_builders(self):
+        """
+        Discover every build_scenario_N method, ordered by N.
+        
+        Each builder returns (scenario_name, history), so new scenarios are
+        picked up by the runners without touching any list.
+        """
+        
+        builders = [name for name in dir(self) if name.startswith('build_scenario_')]
+        builders.sort(key=lambda name: int(name.rsplit('_', 1)[1]))
+        return [getattr(self, name) for name in builders]
+    
+    
+    def run_scenario(self, builder):
+        """Build one scenario, predict and print the result."""
+        
+        name, history = builder()
         prediction = self.predict_from_history(history)
-        self.print_scenario_result("Recovery Relapse (Critical)", prediction, history)
+        self.print_scenario_result(name, prediction, history)
         
-        return prediction
+        return name, prediction
     
     
-    def run_all_scenarios(self):
+    def run_all_scenarios(self, interactive=True):
         """Run all test scenarios and show summary."""
         
         print("\n" + "="*80)
@@ -693,39 +766,23 @@ class ScenarioTester:
         print(" "*20 + "Realistic User Scenarios")
         print("="*80 + "\n")
         
-        scenarios = [
-            self.test_scenario_1,
-            self.test_scenario_2,
-            self.test_scenario_3,
-            self.test_scenario_4,
-            self.test_scenario_5
-        ]
-        
-        predictions = []
-        for scenario_func in scenarios:
-            pred = scenario_func()
-            predictions.append(pred)
-            input("Press Enter to continue to next scenario...")
+        results = []
+        for builder in self.scenario_builders():
+            results.append(self.run_scenario(builder))
+            if interactive:
+                input("Press Enter to continue to next scenario...")
         
         # Summary
         print("\n" + "="*80)
         print(" "*30 + "SUMMARY")
         print("="*80)
         
-        scenario_names = [
-            "Weekend Social Drinker",
-            "Heavy Regular User",
-            "Escalating Stress Drinker",
-            "User Cutting Back",
-            "Occasional Binge Drinker"
-        ]
-        
         print("\n📊 Risk Predictions Across Scenarios:\n")
-        for name, pred in zip(scenario_names, predictions):
+        for name, pred in results:
             risk = "🔴 HIGH" if pred > 0.6 else "🟡 MOD" if pred > 0.4 else "🟢 LOW"
             bar_length = int(pred * 40)
             bar = "█" * bar_length + "░" * (40 - bar_length)
-            print(f"{name:30} | {bar} | {pred:.3f} {risk}")
+            print(f"{name:36} | {bar} | {pred:.3f} {risk}")
         
         print("\n" + "="*80)
         print("\n✓ All scenarios tested successfully!")
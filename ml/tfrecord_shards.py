@@ -0,0 +1,306 @@
+"""
+Grounded App - TFRecord Training Shards
+Writes per-user feature sequences to compressed TFRecord shards once, and
+streams training windows back with a parallel tf.data pipeline.
+
+Export (once):
+    users are generated and featurized in chunks (batch_features.featurize_frame,
+    same semantics as DataPreprocessor.prepare_features), and every user becomes
+    one tf.train.Example holding its day-level features and labels. Shards are
+    GZIP-compressed and hold `users_per_shard` users each.
+
+    Numericals are stored unscaled while the MinMax scaler is fitted
+    incrementally over all chunks; the fitted scaler goes into manifest.json
+    (and feature_scaler.pkl) and is applied in the reader. That way the
+    scaler sees the whole cohort, not just the first chunk.
+
+Read (every run):
+    shard files → interleave(TFRecordDataset, parallel) → parse + scale →
+    14-day windows per user (tf.signal.frame) → shuffle → batch → prefetch
+
+Storing days instead of windows keeps the shards ~14× smaller; windows are
+cut on the fly.
+
+Usage:
+    python tfrecord_shards.py export --n-users 100000 --output-dir data/shards
+    python tfrecord_shards.py bench --manifest data/shards/manifest.json
+    python tfrecord_shards.py train --manifest data/shards/manifest.json --epochs 20
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from batch_features import FEATURE_NAMES, N_CATEGORY_CODES, featurize_frame
+
+
+COMPRESSION = 'GZIP'
+
+
+class _IdentityScaler:
+    """featurize_frame with this leaves numericals unscaled."""
+    def __init__(self, n):
+        self.scale_ = np.ones(n)
+        self.min_ = np.zeros(n)
+
+
+def user_example(features, labels, user_id):
+    """One user's (n_days, n_features) features and (n_days,) labels as a tf.train.Example."""
+    import tensorflow as tf
+
+    return tf.train.Example(features=tf.train.Features(feature={
+        'features': tf.train.Feature(float_list=tf.train.FloatList(value=features.ravel())),
+        'labels': tf.train.Feature(int64_list=tf.train.Int64List(value=labels)),
+        'n_days': tf.train.Feature(int64_list=tf.train.Int64List(value=[len(labels)])),
+        'user_id': tf.train.Feature(int64_list=tf.train.Int64List(value=[user_id])),
+    })).SerializeToString()
+
+
+def export_shards(output_dir, n_users=1000, days_per_user=90, users_per_shard=100, seed=42):
+    """
+    Generate, featurize and write the cohort shard by shard.
+    Returns the manifest dict (also written to output_dir/manifest.json).
+    """
+    import joblib
+    import tensorflow as tf
+    from sklearn.preprocessing import MinMaxScaler
+    from traning_scriptv1 import GroundedDataGenerator
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.random.seed(seed)
+    generator = GroundedDataGenerator()
+    n_numerical = len(FEATURE_NAMES) - N_CATEGORY_CODES
+    identity = _IdentityScaler(n_numerical)
+    scaler = MinMaxScaler()
+    options = tf.io.TFRecordOptions(compression_type=COMPRESSION)
+
+    shards, positives, total_days = [], 0, 0
+    n_shards = (n_users + users_per_shard - 1) // users_per_shard
+    start = time.perf_counter()
+    for shard in range(n_shards):
+        first = shard * users_per_shard
+        count = min(users_per_shard, n_users - first)
+        with contextlib.redirect_stdout(io.StringIO()):
+            data = generator.generate_multi_user_dataset(count, days_per_user)
+        data['user_id'] += first
+
+        features = featurize_frame(data, identity).astype(np.float32)
+        scaler.partial_fit(features[:, N_CATEGORY_CODES:])
+        labels = data['risk_label'].values.astype(np.int64)
+
+        path = os.path.join(output_dir, f"users-{shard:05d}-of-{n_shards:05d}.tfrecord.gz")
+        # Rows are sorted by user, then day
+        bounds = np.flatnonzero(np.r_[True, np.diff(data['user_id'].values) != 0, True])
+        with tf.io.TFRecordWriter(path, options) as writer:
+            for a, b in zip(bounds[:-1], bounds[1:]):
+                writer.write(user_example(features[a:b], labels[a:b], int(data['user_id'].values[a])))
+
+        shards.append(os.path.basename(path))
+        positives += int(labels.sum())
+        total_days += len(labels)
+        elapsed = time.perf_counter() - start
+        print(f"   • Shard {shard + 1}/{n_shards}: {first + count:,} users "
+              f"({(first + count) / elapsed:,.0f} users/s)")
+
+    manifest = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'compression': COMPRESSION,
+        'shards': shards,
+        'n_users': n_users,
+        'days_per_user': days_per_user,
+        'users_per_shard': users_per_shard,
+        'n_days': total_days,
+        'positive_rate': positives / max(total_days, 1),
+        'feature_names': FEATURE_NAMES,
+        'n_onehot': N_CATEGORY_CODES,
+        # Applied by the reader to columns n_onehot: (x * scale + min)
+        'scaler': {'scale': scaler.scale_.tolist(), 'min': scaler.min_.tolist(),
+                   'data_min': scaler.data_min_.tolist(), 'data_max': scaler.data_max_.tolist()},
+        'seed': seed,
+    }
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    joblib.dump(scaler, os.path.join(output_dir, 'feature_scaler.pkl'))
+    return manifest
+
+
+def load_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    manifest['dir'] = os.path.dirname(os.path.abspath(path))
+    return manifest
+
+
+def split_shards(manifest, val_fraction=0.2, test_fraction=0.2):
+    """
+    Train/validation/test file lists, split by shard (so also by user).
+    Validation drives early stopping and checkpoints, so the test shards are
+    the only unbiased held-out set. A non-zero fraction gets at least one
+    shard as long as one is left for training.
+    """
+    paths = [os.path.join(manifest['dir'], name) for name in manifest['shards']]
+
+    def n_held_out(fraction, available):
+        return max(1, int(round(len(paths) * fraction))) if fraction > 0 and available > 1 else 0
+
+    n_test = n_held_out(test_fraction, len(paths))
+    n_val = n_held_out(val_fraction, len(paths) - n_test)
+    n_train = len(paths) - n_val - n_test
+    return paths[:n_train], paths[n_train:n_train + n_val], paths[n_train + n_val:]
+
+
+def make_dataset(manifest, files, sequence_length=14, batch_size=32, shuffle_buffer=10_000,
+                 cycle_length=None, training=True, seed=42):
+    """
+    tf.data pipeline of (windows, labels) batches from shard files.
+
+    Shards are read concurrently with interleave; parsing, scaling and
+    windowing run with num_parallel_calls=AUTOTUNE. For evaluation pass
+    training=False (no shuffling, deterministic order).
+    """
+    import tensorflow as tf
+
+    autotune = tf.data.AUTOTUNE
+    n_features = len(manifest['feature_names'])
+    n_onehot = manifest['n_onehot']
+    scale = tf.constant(np.r_[np.ones(n_onehot), manifest['scaler']['scale']], tf.float32)
+    offset = tf.constant(np.r_[np.zeros(n_onehot), manifest['scaler']['min']], tf.float32)
+    spec = {
+        'features': tf.io.VarLenFeature(tf.float32),
+        'labels': tf.io.VarLenFeature(tf.int64),
+        'n_days': tf.io.FixedLenFeature([], tf.int64),
+        'user_id': tf.io.FixedLenFeature([], tf.int64),
+    }
+
+    def parse(record):
+        example = tf.io.parse_single_example(record, spec)
+        features = tf.reshape(tf.sparse.to_dense(example['features']), [-1, n_features])
+        labels = tf.sparse.to_dense(example['labels'])
+        return features * scale + offset, labels
+
+    def windows(features, labels):
+        # Window i covers days i … i+L-1 and predicts day i+L
+        frames = tf.signal.frame(features, sequence_length, 1, axis=0)[:-1]
+        return tf.data.Dataset.from_tensor_slices((frames, labels[sequence_length:]))
+
+    ds = tf.data.Dataset.from_tensor_slices(files)
+    if training:
+        ds = ds.shuffle(len(files), seed=seed)
+    ds = ds.interleave(lambda path: tf.data.TFRecordDataset(path, compression_type=manifest['compression']),
+                       cycle_length=cycle_length or autotune, num_parallel_calls=autotune,
+                       deterministic=not training)
+    ds = ds.map(parse, num_parallel_calls=autotune, deterministic=not training)
+    ds = ds.interleave(windows, cycle_length=16, num_parallel_calls=autotune,
+                       deterministic=not training)
+    if training:
+        ds = ds.shuffle(shuffle_buffer, seed=seed)
+    return ds.batch(batch_size).prefetch(autotune)
+
+
+def windows_per_epoch(manifest, files, sequence_length=14):
+    """Number of training windows in `files` (every user has days_per_user days)."""
+    users = sum(min(manifest['users_per_shard'],
+                    manifest['n_users'] - manifest['shards'].index(os.path.basename(f)) * manifest['users_per_shard'])
+                for f in files)
+    return users * max(manifest['days_per_user'] - sequence_length, 0)
+
+
+def bench_reader(manifest, batch_size=256, max_batches=2000, cycle_lengths=(1, 4, None)):
+    """Windows/sec read from disk for several interleave widths (None = AUTOTUNE)."""
+    files, _, _ = split_shards(manifest, val_fraction=0.0, test_fraction=0.0)
+    results = []
+    for cycle in cycle_lengths:
+        ds = make_dataset(manifest, files, batch_size=batch_size, cycle_length=cycle)
+        n, start = 0, time.perf_counter()
+        for i, (x, _) in enumerate(ds):
+            n += int(x.shape[0])
+            if i + 1 >= max_batches:
+                break
+        elapsed = time.perf_counter() - start
+        results.append({'cycle_length': cycle or 'autotune', 'windows': n,
+                        'seconds': elapsed, 'windows_per_sec': n / elapsed})
+        print(f"   • cycle_length={str(cycle or 'autotune'):9} {n / elapsed:12,.0f} windows/s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TFRecord shard export and streaming reader")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export = sub.add_parser('export', help="Generate the cohort and write shards")
+    export.add_argument('--n-users', type=int, default=1000)
+    export.add_argument('--days-per-user', type=int, default=90)
+    export.add_argument('--users-per-shard', type=int, default=100)
+    export.add_argument('--seed', type=int, default=42)
+    export.add_argument('--output-dir', default='data/shards')
+
+    bench = sub.add_parser('bench', help="Measure read throughput")
+    bench.add_argument('--manifest', default='data/shards/manifest.json')
+    bench.add_argument('--batch-size', type=int, default=256)
+    bench.add_argument('--max-batches', type=int, default=2000)
+
+    train = sub.add_parser('train', help="Train the model streaming from shards")
+    train.add_argument('--manifest', default='data/shards/manifest.json')
+    train.add_argument('--epochs', type=int, default=20)
+    train.add_argument('--model-type', default='hybrid', choices=['hybrid', 'lstm', 'gru'])
+    train.add_argument('--val-fraction', type=float, default=0.2)
+    train.add_argument('--test-fraction', type=float, default=0.2)
+    train.add_argument('--output-dir', default='models')
+
+    args = parser.parse_args()
+
+    print("="*80)
+    print(" "*27 + "TFRECORD TRAINING SHARDS")
+    print("="*80)
+
+    if args.command == 'export':
+        manifest = export_shards(args.output_dir, args.n_users, args.days_per_user,
+                                 args.users_per_shard, args.seed)
+        size_mb = sum(os.path.getsize(os.path.join(args.output_dir, s)) for s in manifest['shards']) / 1e6
+        print(f"\n✓ {len(manifest['shards'])} shards ({size_mb:.1f} MB) written to {args.output_dir}")
+        return 0
+
+    manifest = load_manifest(args.manifest)
+
+    if args.command == 'bench':
+        bench_reader(manifest, args.batch_size, args.max_batches)
+        return 0
+
+    import joblib
+    from traning_scriptv1 import DataPreprocessor, evaluate_model, save_model_for_mobile, train_model
+
+    train_files, val_files, test_files = split_shards(manifest, args.val_fraction, args.test_fraction)
+    if not val_files or not test_files:
+        print(f"\n❌ Need at least 3 shards to hold out validation and test data, "
+              f"found {len(manifest['shards'])}.")
+        print("   Re-export with a smaller --users-per-shard (and keep --val-fraction / --test-fraction > 0).")
+        return 1
+    train_ds = make_dataset(manifest, train_files)
+    val_ds = make_dataset(manifest, val_files, training=False)
+    print(f"\n📦 {len(train_files)} training / {len(val_files)} validation / {len(test_files)} test shards | "
+          f"{windows_per_epoch(manifest, train_files):,} windows per epoch")
+
+    model, history = train_model(train_ds, None, val_ds, None,
+                                 model_type=args.model_type, epochs=args.epochs)
+
+    # Test shards were never seen by early stopping or the checkpoint
+    batches = [(x.numpy(), y.numpy()) for x, y in make_dataset(manifest, test_files, batch_size=4096, training=False)]
+    if batches:
+        evaluate_model(model, np.concatenate([x for x, _ in batches]), np.concatenate([y for _, y in batches]))
+    else:
+        print("\n⚠ Test shards hold no complete windows - skipping evaluation")
+
+    preprocessor = DataPreprocessor()
+    preprocessor.scaler = joblib.load(os.path.join(manifest['dir'], 'feature_scaler.pkl'))
+    save_model_for_mobile(model, preprocessor, output_dir=args.output_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Grounded App - Training Telemetry
+Streams structured training progress as JSON lines while a run is going.
+
+TelemetryLogger is a Keras callback that appends one record per epoch (and
+optionally one every N batches) to a JSONL file, flushed immediately so the
+file can be tailed or plotted mid-run:
+
+    {"event": "epoch", "epoch": 3, "loss": 0.41, "val_auc": 0.87, "lr": 0.001,
+     "epoch_s": 2.1, "step_ms_mean": 3.9, "input_wait_ms_mean": 0.6,
+     "samples_per_sec": 2410.5, "rss_mb": 812.3, ...}
+
+step time is measured from on_train_batch_begin to on_train_batch_end
+(forward, backward, optimizer update). input wait is the gap from the end
+of one batch to the start of the next: data fetching plus callback overhead,
+so a growing input wait points at the input pipeline, not the model.
+
+Usage:
+    python traning_scriptv1.py --telemetry reports/train_telemetry.jsonl --telemetry-every 50
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+from tensorflow import keras
+
+from pipeline_profiler import current_rss_mb
+
+
+def _plain(value):
+    """JSON-safe scalar from a Keras log value."""
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class TelemetryLogger(keras.callbacks.Callback):
+    """
+    Writes training telemetry to `path` as JSON lines.
+
+    every_n_batches=0 logs epochs only. n_samples/batch_size are used for
+    samples/sec (Keras doesn't report batch sizes to callbacks).
+    """
+
+    def __init__(self, path, every_n_batches=0, batch_size=32, n_samples=None, run_info=None):
+        super().__init__()
+        self.path = path
+        self.every_n_batches = every_n_batches
+        self.batch_size = batch_size
+        self.n_samples = n_samples
+        self.run_info = run_info or {}
+        self.file = None
+
+    def _write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def _learning_rate(self):
+        try:
+            return float(keras.ops.convert_to_numpy(self.model.optimizer.learning_rate))
+        except (AttributeError, TypeError, ValueError):
+            return None
+
+    def _batch_samples(self, batch):
+        if self.n_samples is None:
+            return self.batch_size
+        return max(min(self.batch_size, self.n_samples - batch * self.batch_size), 0)
+
+    def on_train_begin(self, logs=None):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, 'w')
+        self.train_start = time.perf_counter()
+        self._write({'event': 'start', 'time': time.time(),
+                     'params': {k: _plain(v) for k, v in (self.params or {}).items()},
+                     'batch_size': self.batch_size, 'n_samples': self.n_samples,
+                     'lr': self._learning_rate(), 'rss_mb': current_rss_mb(),
+                     **self.run_info})
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.current_epoch = epoch + 1
+        self.epoch_start = time.perf_counter()
+        self.last_batch_end = self.epoch_start
+        self.step_ms = []
+        self.wait_ms = []
+        self.samples = 0
+        self.window_start = self.epoch_start
+        self.window_samples = 0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.batch_start = time.perf_counter()
+        self.wait_ms.append((self.batch_start - self.last_batch_end) * 1000)
+
+    def on_train_batch_end(self, batch, logs=None):
+        now = time.perf_counter()
+        self.step_ms.append((now - self.batch_start) * 1000)
+        self.last_batch_end = now
+        n = self._batch_samples(batch)
+        self.samples += n
+        self.window_samples += n
+
+        if self.every_n_batches and (batch + 1) % self.every_n_batches == 0:
+            recent = slice(-self.every_n_batches, None)
+            elapsed = now - self.window_start
+            self._write({
+                'event': 'batch',
+                'epoch': self.current_epoch,
+                'batch': batch + 1,
+                **{k: _plain(v) for k, v in (logs or {}).items()},
+                'lr': self._learning_rate(),
+                'step_ms_mean': float(np.mean(self.step_ms[recent])),
+                'input_wait_ms_mean': float(np.mean(self.wait_ms[recent])),
+                'samples_per_sec': self.window_samples / elapsed if elapsed > 0 else None,
+                'rss_mb': current_rss_mb(),
+            })
+            self.window_start = now
+            self.window_samples = 0
+
+    def on_epoch_end(self, epoch, logs=None):
+        epoch_s = time.perf_counter() - self.epoch_start
+        steps = np.array(self.step_ms) if self.step_ms else np.zeros(1)
+        waits = np.array(self.wait_ms) if self.wait_ms else np.zeros(1)
+        self._write({
+            'event': 'epoch',
+            'epoch': epoch + 1,
+            **{k: _plain(v) for k, v in (logs or {}).items()},
+            'lr': self._learning_rate(),
+            'epoch_s': epoch_s,
+            'steps': len(self.step_ms),
+            'step_ms_mean': float(steps.mean()),
+            'step_ms_p95': float(np.percentile(steps, 95)),
+            'input_wait_ms_mean': float(waits.mean()),
+            'input_wait_s_total': float(waits.sum() / 1000),
+            # Epoch time also covers validation, so this is end-to-end throughput
+            'samples_per_sec': self.samples / epoch_s if epoch_s > 0 else None,
+            'train_samples_per_sec': self.samples / (steps.sum() / 1000) if steps.sum() > 0 else None,
+            'rss_mb': current_rss_mb(),
+        })
+
+    def on_train_end(self, logs=None):
+        self._write({'event': 'end', 'train_s': time.perf_counter() - self.train_start,
+                     'rss_mb': current_rss_mb()})
+        self.file.close()
+        self.file = None
+
+
+def read_telemetry(path, event='epoch'):
+    """Load the records of one event type from a telemetry file."""
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [r for r in records if r.get('event') == event]
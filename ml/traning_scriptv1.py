@@ -18,6 +18,7 @@ Note: This is for harm reduction, not treatment. We aim to help users make
 more informed choices, not judge them.
 """
 
+import argparse
 import warnings
 import numpy as np
 import pandas as pd
@@ -30,6 +31,16 @@ from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
 import json
 import os
+import shutil
+import tempfile
+
+from batch_features import CATEGORICAL_VOCABS, CATEGORY_FIELDS, NUMERICAL_COLS, N_CATEGORY_CODES
+from evaluation import evaluate_arrays, print_evaluation
+from graph_preprocessing import fold_preprocessing
+from model_formats import EXPORT_FORMATS, convert_to_tflite, derive_formats, keras_bundle_sha256
+from model_registry import ModelRegistry, spec_key, training_spec
+from pipeline_profiler import StageProfiler, peak_rss_mb
+from training_telemetry import TelemetryLogger
 
 # Set random seeds for reproducibility
 # (makes debugging way easier when results are consistent)
@@ -43,6 +54,11 @@ os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'  # Disable oneDNN warnings
 # Suppress protobuf warnings
 warnings.filterwarnings('ignore', category=UserWarning, module='google.protobuf')
 
+# Loss weight of a high-risk day (label 1) relative to a low-risk one. Every
+# trainer (train_model, federated clients, personal heads, substance heads)
+# uses this one value.
+POSITIVE_WEIGHT = 2.5
+
 class GroundedDataGenerator:
     """
     Generates realistic synthetic user data for training.
@@ -339,85 +355,214 @@ class DataPreprocessor:
         
         return feature_matrix
     
-    def create_sequences(self, features, labels, sequence_length=14):
+    def create_sequences(self, features, labels, sequence_length=14,
+                         user_ids=None, day_nums=None):
         """
         Create sequences for time series prediction.
         
         We look at the last 14 days to predict risk for day 15.
         This is like giving the model a 2-week window into someone's patterns.
+        
+        If user_ids is given (rows sorted by user, then day), windows never
+        span two users. The source of every window is kept in
+        self.window_index: the row of the predicted day plus its user_id and
+        day_num, so results can be traced back to the data.
         """
         
-        X, y = [], []
+        n_rows = len(features)
+        starts = np.arange(max(n_rows - sequence_length, 0))
+        targets = starts + sequence_length
         
-        for i in range(len(features) - sequence_length):
-            X.append(features[i:i + sequence_length])
-            y.append(labels[i + sequence_length])
+        if user_ids is not None:
+            user_ids = np.asarray(user_ids)
+            # Rows are grouped by user, so same user at both ends = same user throughout
+            same_user = user_ids[starts] == user_ids[targets]
+            starts, targets = starts[same_user], targets[same_user]
         
-        return np.array(X), np.array(y)
+        if n_rows < sequence_length:
+            # Too short for a single window (the view below would raise)
+            features = np.asarray(features)
+            X = np.empty((0, sequence_length) + features.shape[1:], dtype=features.dtype)
+            y = np.asarray(labels)[targets]
+        else:
+            # (n_rows - L + 1, n_features, L) view - no copying until we index it
+            windows = np.lib.stride_tricks.sliding_window_view(features, sequence_length, axis=0)
+            X = windows[starts].transpose(0, 2, 1)
+            y = np.asarray(labels)[targets]
+        
+        self.window_index = pd.DataFrame({
+            'row': targets,
+            'user_id': user_ids[targets] if user_ids is not None else -1,
+            'day_num': np.asarray(day_nums)[targets] if day_nums is not None else targets,
+        })
+        
+        return X, y
 
 
-def build_model(sequence_length, n_features, model_type='hybrid'):
+def trunk_layers(model_type='hybrid'):
     """
-    Build the neural network model.
-    
-    We've tried a few architectures and the hybrid CNN+LSTM works best.
-    The CNN catches local patterns (like "always uses on Friday nights")
-    and the LSTM catches longer-term trends.
+    Temporal feature extractor shared by every head: (model name, layers).
+    Ends with a (batch, 32) summary of the window.
     """
     
     if model_type == 'lstm':
         # Simple LSTM model - good baseline
-        model = keras.Sequential([
-            layers.Input(shape=(sequence_length, n_features)),
+        return 'grounded_lstm_model', [
             layers.LSTM(32, return_sequences=False),
             layers.Dropout(0.3),
-            layers.Dense(16, activation='relu'),
-            layers.Dropout(0.2),
-            layers.Dense(1, activation='sigmoid')
-        ], name='grounded_lstm_model')
+        ]
     
-    elif model_type == 'gru':
+    if model_type == 'gru':
         # GRU is faster than LSTM, fewer parameters
-        model = keras.Sequential([
-            layers.Input(shape=(sequence_length, n_features)),
+        return 'grounded_gru_model', [
             layers.GRU(32, return_sequences=False),
             layers.Dropout(0.3),
-            layers.Dense(16, activation='relu'),
-            layers.Dropout(0.2),
-            layers.Dense(1, activation='sigmoid')
-        ], name='grounded_gru_model')
+        ]
     
-    elif model_type == 'hybrid':
+    if model_type == 'hybrid':
         # Best performer - CNN for local patterns, LSTM for temporal
-        model = keras.Sequential([
-            layers.Input(shape=(sequence_length, n_features)),
+        return 'grounded_hybrid_model', [
             layers.Conv1D(32, kernel_size=3, activation='relu', padding='same'),
             layers.MaxPooling1D(pool_size=2),
             layers.LSTM(32, return_sequences=False),
             layers.Dropout(0.3),
-            layers.Dense(16, activation='relu'),
-            layers.Dropout(0.2),
-            layers.Dense(1, activation='sigmoid')
-        ], name='grounded_hybrid_model')
+        ]
+    
+    raise ValueError(f"Unknown model type: {model_type}")
+
+
+def head_layers(prefix=None, units=16):
+    """
+    Dense risk head on top of the trunk. With a prefix the layers are named
+    <prefix>_hidden / _dropout / _risk, so several heads can share a model.
+    """
+    
+    names = [f'{prefix}_hidden', f'{prefix}_dropout', f'{prefix}_risk'] if prefix else [None] * 3
+    return [
+        layers.Dense(units, activation='relu', name=names[0]),
+        layers.Dropout(0.2, name=names[1]),
+        layers.Dense(1, activation='sigmoid', name=names[2]),
+    ]
+
+
+def build_model(sequence_length, n_features, model_type='hybrid',
+                categorical_input='onehot', embedding_dim=3):
+    """
+    Build the neural network model.
+    
+    We've tried a few architectures and the hybrid CNN+LSTM works best.
+    The CNN catches local patterns (like "always uses on Friday nights")
+    and the LSTM catches longer-term trends.
+    
+    The model is trunk_layers(model_type) followed by one head_layers() head.
+    
+    categorical_input='embedding' swaps the one-hot columns for integer
+    category codes fed through a small embedding table. The model then
+    takes two inputs, [codes (days, 4) int32, numerics (days, n_features)],
+    where n_features counts only the numerical columns
+    (see batch_features.split_onehot).
+    
+    sequence_length=None builds a variable-length model: histories of any
+    length, zero-padded at the end when batched, with a Masking layer so
+    the recurrent layer skips the padding (a real day always has one
+    day-of-week flag set, so it is never all zeros). Only 'lstm' and 'gru'
+    support this - the hybrid's Conv1D/MaxPooling drop the mask.
+    """
+    
+    name, trunk = trunk_layers(model_type)
+    trunk = trunk + head_layers()
+    
+    if categorical_input == 'embedding':
+        return _embedding_model(sequence_length, n_features, trunk, name, embedding_dim)
+    
+    if sequence_length is None:
+        if model_type == 'hybrid':
+            raise ValueError("Variable-length input needs model_type 'lstm' or 'gru' "
+                             "(Conv1D/MaxPooling1D do not propagate the padding mask)")
+        trunk = [layers.Masking(mask_value=0.0)] + trunk
+    
+    model = keras.Sequential(
+        [layers.Input(shape=(sequence_length, n_features))] + trunk, name=name)
     
     return model
 
 
-def train_model(X_train, y_train, X_val, y_val, model_type='hybrid', epochs=100):
+def _embedding_model(sequence_length, n_numerical, trunk, name, embedding_dim):
+    """
+    Functional model: one shared embedding table for all category codes,
+    concatenated with the numerics and fed to the usual trunk.
+    Only builtin layers, so it saves to .h5 and converts to TFLite.
+    """
+    
+    codes = layers.Input(shape=(sequence_length, len(CATEGORY_FIELDS)), dtype='int32', name='categories')
+    numerics = layers.Input(shape=(sequence_length, n_numerical), name='numerics')
+    
+    embedded = layers.Embedding(N_CATEGORY_CODES, embedding_dim, name='category_embedding')(codes)
+    embedded = layers.Reshape((sequence_length, len(CATEGORY_FIELDS) * embedding_dim))(embedded)
+    x = layers.Concatenate()([embedded, numerics])
+    for layer in trunk:
+        x = layer(x)
+    
+    return keras.Model([codes, numerics], x, name=name + '_embedding')
+
+
+def split_dataset(X, y, test_size=0.2, val_size=0.2, seed=42):
+    """
+    Stratified train / validation / test split of the windows: test_size of
+    all windows is held out, then val_size of the rest.
+    Returns (X_train, X_val, X_test, y_train, y_val, y_test).
+    """
+    
+    X_temp, X_test, y_temp, y_test = train_test_split(
+        X, y, test_size=test_size, random_state=seed, stratify=y
+    )
+    
+    X_train, X_val, y_train, y_val = train_test_split(
+        X_temp, y_temp, test_size=val_size, random_state=seed, stratify=y_temp
+    )
+    return X_train, X_val, X_test, y_train, y_val, y_test
+
+def train_model(X_train, y_train, X_val, y_val, model_type='hybrid', epochs=100,
+                telemetry_path=None, telemetry_every=0, categorical_input='onehot',
+                checkpoint_dir=None):
     """
     Train the risk prediction model.
     
     We use class weighting because high-risk days are less common,
     and we really don't want to miss those.
-    """
     
-    sequence_length = X_train.shape[1]
-    n_features = X_train.shape[2]
+    With telemetry_path, per-epoch (and every telemetry_every batches)
+    metrics, step times and memory are streamed there as JSON lines.
+    
+    For categorical_input='embedding', X_train/X_val are (codes, numerics)
+    pairs from batch_features.split_onehot.
     
-    print(f"\nBuilding {model_type} model...")
-    print(f"Input shape: ({sequence_length} days, {n_features} features)")
+    X_train/X_val can also be batched tf.data datasets of (windows, labels)
+    (e.g. from tfrecord_shards.make_dataset); y_train/y_val are then unused.
+    
+    The best-AUC checkpoint goes to checkpoint_dir/best_model.keras; without a
+    checkpoint_dir it lives in a temporary directory that is removed after
+    training.
+    """
     
-    model = build_model(sequence_length, n_features, model_type)
+    streaming = isinstance(X_train, tf.data.Dataset)
+    
+    if streaming:
+        sequence_length, n_features = X_train.element_spec[0].shape[1:]
+        print(f"\nBuilding {model_type} model (streaming input)...")
+        print(f"Input shape: ({sequence_length} days, {n_features} features)")
+    elif categorical_input == 'embedding':
+        X_train, X_val = list(X_train), list(X_val)
+        sequence_length, n_features = X_train[1].shape[1:]
+        print(f"\nBuilding {model_type} model (embedding inputs)...")
+        print(f"Input shape: ({sequence_length} days, {len(CATEGORY_FIELDS)} codes + {n_features} numerics)")
+    else:
+        sequence_length = X_train.shape[1]
+        n_features = X_train.shape[2]
+        print(f"\nBuilding {model_type} model...")
+        print(f"Input shape: ({sequence_length} days, {n_features} features)")
+    
+    model = build_model(sequence_length, n_features, model_type, categorical_input)
     
     # Adam optimizer works well for this
     model.compile(
@@ -429,6 +574,9 @@ def train_model(X_train, y_train, X_val, y_val, model_type='hybrid', epochs=100)
     model.summary()
     
     # Callbacks to prevent overfitting and save best model
+    keep_checkpoint = checkpoint_dir is not None
+    checkpoint_dir = checkpoint_dir or tempfile.mkdtemp(prefix='grounded_checkpoint_')
+    os.makedirs(checkpoint_dir, exist_ok=True)
     callbacks = [
         keras.callbacks.EarlyStopping(
             monitor='val_loss',
@@ -444,7 +592,7 @@ def train_model(X_train, y_train, X_val, y_val, model_type='hybrid', epochs=100)
             verbose=1
         ),
         keras.callbacks.ModelCheckpoint(
-            'best_model.h5',
+            os.path.join(checkpoint_dir, 'best_model.keras'),
             monitor='val_auc',
             save_best_only=True,
             mode='max',
@@ -452,20 +600,35 @@ def train_model(X_train, y_train, X_val, y_val, model_type='hybrid', epochs=100)
         )
     ]
     
+    batch_size = 32
+    if telemetry_path:
+        # First in the list so the logged LR is the one this epoch trained with
+        callbacks.insert(0, TelemetryLogger(
+            telemetry_path, every_n_batches=telemetry_every,
+            batch_size=batch_size, n_samples=None if streaming else len(y_train),
+            run_info={'model_type': model_type, 'n_val': None if streaming else len(y_val)}))
+    
     # Give more weight to high-risk samples since they're less common
     # This helps the model learn to catch those important moments
-    class_weight = {0: 1.0, 1: 2.5}
+    class_weight = {0: 1.0, 1: POSITIVE_WEIGHT}
     
     print("\nStarting training...")
-    history = model.fit(
-        X_train, y_train,
-        validation_data=(X_val, y_val),
-        epochs=epochs,
-        batch_size=32,
-        callbacks=callbacks,
-        class_weight=class_weight,
-        verbose=1
-    )
+    if streaming:
+        # Datasets arrive batched and carry their own labels
+        data_args = dict(x=X_train, validation_data=X_val)
+    else:
+        data_args = dict(x=X_train, y=y_train, validation_data=(X_val, y_val), batch_size=batch_size)
+    try:
+        history = model.fit(
+            **data_args,
+            epochs=epochs,
+            callbacks=callbacks,
+            class_weight=class_weight,
+            verbose=1
+        )
+    finally:
+        if not keep_checkpoint:
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
     
     return model, history
 
@@ -477,52 +640,22 @@ def evaluate_model(model, X_test, y_test):
     For this use case, we care most about:
     - AUC: Can we distinguish high vs low risk?
     - Recall: Are we catching the high-risk moments?
-    """
     
-    from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score
+    Runs a single batched inference pass - loss, accuracy, AUC, the
+    confusion matrix and calibration all come from the same scores
+    (see evaluation.py).
+    """
     
     print("\n" + "="*60)
     print("MODEL EVALUATION")
     print("="*60)
     
-    # Get predictions
-    y_pred_proba = model.predict(X_test, verbose=0)
-    y_pred = (y_pred_proba > 0.5).astype(int).flatten()
-    
-    # Basic metrics
-    test_loss, test_acc, test_auc = model.evaluate(X_test, y_test, verbose=0)
-    print(f"\nTest Accuracy: {test_acc:.4f}")
-    print(f"Test AUC:      {test_auc:.4f}")
-    print(f"Test Loss:     {test_loss:.4f}")
-    
-    # Classification report
-    print("\nClassification Report:")
-    print(classification_report(y_test, y_pred, 
-                                target_names=['Low Risk', 'High Risk']))
-    
-    # Confusion matrix
-    cm = confusion_matrix(y_test, y_pred)
-    print("\nConfusion Matrix:")
-    print(f"True Negatives (Low Risk correctly identified):  {cm[0,0]}")
-    print(f"False Positives (False alarms):                  {cm[0,1]}")
-    print(f"False Negatives (Missed high-risk moments):      {cm[1,0]}")
-    print(f"True Positives (High Risk correctly identified): {cm[1,1]}")
-    
-    # Calculate precision and recall manually for clarity
-    precision = cm[1,1] / (cm[1,1] + cm[0,1]) if (cm[1,1] + cm[0,1]) > 0 else 0
-    recall = cm[1,1] / (cm[1,1] + cm[1,0]) if (cm[1,1] + cm[1,0]) > 0 else 0
-    
-    print(f"\nPrecision (how many alerts are real): {precision:.4f}")
-    print(f"Recall (how many real risks we catch): {recall:.4f}")
+    metrics = evaluate_arrays(model, X_test, y_test).result(threshold=0.5)
+    print_evaluation(metrics)
     
     print("="*60)
     
-    return {
-        'accuracy': test_acc,
-        'auc': test_auc,
-        'precision': precision,
-        'recall': recall
-    }
+    return metrics
 
 
 def plot_training_history(history):
@@ -611,10 +744,21 @@ def plot_training_history(history):
 #         json.dump(metadata, f, indent=2)
 #     print(f"Saved metadata to {metadata_path}")
 
-def save_model_for_mobile(model, preprocessor, output_dir='models'):
+def save_model_for_mobile(model, preprocessor, output_dir='models', fold_preprocessing_into_graph=True,
+                          model_version='1.0.0', extra_metadata=None):
     """
     Save the model in formats ready for mobile deployment.
     Also prints summary to console.
+    
+    model_version is normally assigned by model_registry (one per build);
+    extra_metadata is merged into model_metadata.json.
+    
+    With fold_preprocessing_into_graph, a second pair of artifacts
+    (grounded_model_raw.h5 / .tflite) takes raw daily values - category codes,
+    unscaled numbers and daily use counts - and does the one-hot encoding,
+    rolling averages and MinMax scaling inside the graph, so callers need
+    neither the pickle nor a reimplementation of prepare_features. It is
+    skipped for the two-input embedding model.
     """
     
     os.makedirs(output_dir, exist_ok=True)
@@ -624,10 +768,12 @@ def save_model_for_mobile(model, preprocessor, output_dir='models'):
     model.save(keras_path)
     print(f"\n✓ Saved Keras model to {keras_path}")
     
-    # Convert to TFLite
-    converter = tf.lite.TFLiteConverter.from_keras_model(model)
-    converter.optimizations = [tf.lite.Optimize.DEFAULT]
-    tflite_model = converter.convert()
+    # Faster-loading copies - model_formats.load_keras_model picks the best one
+    for fmt, path in derive_formats(model, output_dir, EXPORT_FORMATS).items():
+        print(f"✓ Saved {fmt} copy to {path}")
+    
+    # Convert to TFLite (fixed batch of 1 - see convert_to_tflite)
+    tflite_model = convert_to_tflite(model)
     
     tflite_path = os.path.join(output_dir, 'grounded_model.tflite')
     with open(tflite_path, 'wb') as f:
@@ -645,22 +791,84 @@ def save_model_for_mobile(model, preprocessor, output_dir='models'):
     print(f"✓ Saved scaler to {scaler_path}")
     
     # Save metadata
+    single_input = len(model.inputs) == 1
     metadata = {
-        'model_version': '1.0.0',
+        'model_version': model_version,
         'created_at': datetime.now().isoformat(),
-        'sequence_length': model.input_shape[1],
-        'n_features': model.input_shape[2],
-        'model_type': model.name
+        'sequence_length': model.inputs[0].shape[1],
+        'model_type': model.name,
+        # load_keras_model only uses a copy whose hash still matches
+        'model_sha256': keras_bundle_sha256(output_dir),
+        **(extra_metadata or {}),
     }
+    if single_input:
+        metadata['n_features'] = model.input_shape[2]
+    else:
+        # Embedding model: integer category codes plus scaled numerics
+        metadata['inputs'] = {tensor.name: list(tensor.shape[1:]) for tensor in model.inputs}
+    
+    if fold_preprocessing_into_graph and not single_input:
+        print("⚠ Skipped the raw-input model: preprocessing can only be folded into the "
+              "single-input (one-hot) model")
+    elif fold_preprocessing_into_graph:
+        # Raw values in, risk score out - no pickle, no feature code in the app
+        raw_model = fold_preprocessing(model, preprocessor.scaler, include_features=True)
+        raw_model.save(os.path.join(output_dir, 'grounded_model_raw.h5'))
+        raw_tflite_path = os.path.join(output_dir, 'grounded_model_raw.tflite')
+        with open(raw_tflite_path, 'wb') as f:
+            f.write(convert_to_tflite(raw_model))
+        print(f"✓ Saved raw-input model to {raw_tflite_path} "
+              f"({os.path.getsize(raw_tflite_path) / 1024:.2f} KB, preprocessing included)")
+        
+        metadata['raw_input_model'] = {
+            'files': ['grounded_model_raw.h5', 'grounded_model_raw.tflite'],
+            'inputs': {
+                **{name: {'shape': [model.input_shape[1]], 'dtype': 'int32', 'vocabulary': vocab}
+                   for name, vocab in CATEGORICAL_VOCABS.items()},
+                'day_of_week': {'shape': [model.input_shape[1]], 'dtype': 'int32', 'note': '0 = Monday'},
+                'numerics': {'shape': [model.input_shape[1], len(NUMERICAL_COLS)], 'dtype': 'float32',
+                             'columns': NUMERICAL_COLS},
+                'frequency': {'shape': [model.input_shape[1]], 'dtype': 'float32'},
+            },
+        }
     
     metadata_path = os.path.join(output_dir, 'model_metadata.json')
     with open(metadata_path, 'w') as f:
         json.dump(metadata, f, indent=2)
     print(f"✓ Saved metadata to {metadata_path}")
 
-def print_sample_predictions(model, preprocessor, data, n_samples=5):
+def select_samples(y, n_samples, stratify=True, seed=42):
+    """
+    Pick window indices to show. With stratify, classes are represented
+    equally (as far as each class has enough windows). The fixed default
+    seed keeps the printed samples the same from run to run.
+    """
+    
+    rng = np.random.default_rng(seed)
+    n_samples = min(n_samples, len(y))
+    if not stratify:
+        return rng.choice(len(y), n_samples, replace=False)
+    
+    classes = np.unique(y)
+    picked = []
+    remaining = n_samples
+    # Smallest class first so leftover quota goes to the bigger ones
+    for i, cls in enumerate(sorted(classes, key=lambda c: (y == c).sum())):
+        members = np.flatnonzero(y == cls)
+        quota = min(len(members), remaining // (len(classes) - i))
+        picked.append(rng.choice(members, quota, replace=False))
+        remaining -= quota
+    return rng.permutation(np.concatenate(picked))
+
+
+def print_sample_predictions(model, preprocessor, data, n_samples=5,
+                             stratify=True, max_printed=20, seed=42):
     """
     Print some example predictions to console for verification.
+    
+    All samples are scored in one batch, and each window's source day is
+    looked up through preprocessor.window_index. Returns a DataFrame with
+    one row per sample.
     """
     
     print("\n" + "="*80)
@@ -671,20 +879,23 @@ def print_sample_predictions(model, preprocessor, data, n_samples=5):
     features = preprocessor.prepare_features(data)
     labels = data['risk_label'].values
     
-    # Create sequences
-    X, y = preprocessor.create_sequences(features, labels, sequence_length=14)
+    # Create sequences (user-bounded, so every window maps to one user)
+    X, y = preprocessor.create_sequences(features, labels, sequence_length=14,
+                                         user_ids=data['user_id'].values,
+                                         day_nums=data['day_num'].values)
+    index = preprocessor.window_index
     
-    # Get random samples
-    indices = np.random.choice(len(X), min(n_samples, len(X)), replace=False)
+    # Pick samples and score them together
+    indices = select_samples(y, n_samples, stratify, seed)
+    predictions = model.predict(X[indices], batch_size=max(len(indices), 1), verbose=0)[:, 0]
     
-    for idx in indices:
-        sequence = X[idx:idx+1]
-        actual_label = y[idx]
-        prediction = model.predict(sequence, verbose=0)[0][0]
-        
-        # Get the actual day data
-        day_idx = idx + 14  # accounting for sequence length
-        day_data = data.iloc[day_idx]
+    rows = index['row'].values[indices]
+    samples = data.iloc[rows].reset_index(drop=True).assign(
+        prediction=predictions, actual=y[indices], correct=(predictions > 0.5) == y[indices])
+    
+    for _, day_data in samples.head(max_printed).iterrows():
+        prediction = day_data['prediction']
+        actual_label = day_data['actual']
         
         print(f"\n{'─'*80}")
         print(f"Day {day_data['day_num']} | User {day_data['user_id']}")
@@ -695,23 +906,91 @@ def print_sample_predictions(model, preprocessor, data, n_samples=5):
         print(f"Craving: {day_data['craving_intensity']:.1f}/10")
         print(f"\nPrediction: {prediction:.3f} (Risk: {'HIGH' if prediction > 0.5 else 'LOW'})")
         print(f"Actual: {'HIGH RISK' if actual_label == 1 else 'LOW RISK'}")
-        print(f"{'✓ CORRECT' if (prediction > 0.5) == actual_label else '✗ INCORRECT'}")
+        print(f"{'✓ CORRECT' if day_data['correct'] else '✗ INCORRECT'}")
+    
+    if len(samples) > max_printed:
+        print(f"\n… {len(samples) - max_printed} more samples not shown")
+    
+    print(f"\n📋 Sample summary ({len(samples)} windows):")
+    for label, name in [(0, 'Low risk'), (1, 'High risk')]:
+        group = samples[samples['actual'] == label]
+        if len(group):
+            print(f"   • {name:9}: {len(group):4d} samples | "
+                  f"{group['correct'].mean()*100:5.1f}% correct | "
+                  f"mean score {group['prediction'].mean():.3f}")
+    
+    return samples
+
 
 def main():
     """
     Main training pipeline with console output.
+    
+    Every step runs inside a profiler stage; pass --trace to keep the
+    per-stage timings and memory figures as JSON.
     """
     
+    parser = argparse.ArgumentParser(description="Train the Grounded risk model")
+    parser.add_argument('--trace', default=None,
+                        help="Write per-stage timing/memory trace (JSON) here")
+    parser.add_argument('--chrome-trace', default=None,
+                        help="Also write the trace in Chrome trace event format")
+    parser.add_argument('--no-tracemalloc', action='store_true',
+                        help="Skip Python heap tracing (lower overhead)")
+    parser.add_argument('--telemetry', default=None,
+                        help="Stream per-epoch training telemetry (JSONL) here")
+    parser.add_argument('--telemetry-every', type=int, default=0,
+                        help="Also log every N batches (0 = epochs only)")
+    parser.add_argument('--cv-folds', type=int, default=0,
+                        help="Run user-grouped K-fold cross-validation instead of a single split")
+    parser.add_argument('--cv-workers', type=int, default=None,
+                        help="Parallel fold workers (default: one per fold, up to the core count)")
+    parser.add_argument('--n-users', type=int, default=100)
+    parser.add_argument('--days-per-user', type=int, default=90)
+    parser.add_argument('--model-type', default='hybrid', choices=['hybrid', 'lstm', 'gru'])
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--registry', default='registry',
+                        help="Model registry directory (builds are keyed by their config)")
+    parser.add_argument('--no-registry', action='store_true',
+                        help="Always train and write only to models/")
+    parser.add_argument('--retrain', action='store_true',
+                        help="Train even if an identical build is already registered "
+                             "(replaces that build and its version)")
+    args = parser.parse_args()
+    
+    profiler = StageProfiler(trace_malloc=not args.no_tracemalloc)
+    
     print("="*80)
     print(" "*20 + "GROUNDED RISK PREDICTION MODEL")
     print(" "*25 + "Training Pipeline")
     print("="*80)
     
+    # Identical data, features, architecture and hyperparameters give the
+    # same key - reuse that build instead of training it again
+    registry = None if args.no_registry else ModelRegistry(args.registry)
+    spec = training_spec(args.n_users, args.days_per_user, model_type=args.model_type, epochs=args.epochs)
+    key = spec_key(spec)
+    cached = registry.lookup(key) if registry and not (args.retrain or args.cv_folds) else None
+    if cached:
+        with profiler.stage('publish'):
+            registry.publish(key, 'models')
+        print(f"\n✓ Build {cached['version']} ({key[:12]}) is already registered - skipping training")
+        print(f"   Trained {cached['created_at'][:19]} | artifacts copied to models/")
+        for name in ['auc', 'pr_auc', 'accuracy', 'recall', 'f1']:
+            if name in cached['metrics']:
+                print(f"   • {name:9} {cached['metrics'][name]:.4f}")
+        print("\n   Pass --retrain to train it again.")
+        profiler.print_summary()
+        if args.trace or args.chrome_trace:
+            profiler.write(args.trace or 'reports/train_trace.json', chrome_path=args.chrome_trace)
+        return
+    
     # Step 1: Generate synthetic data
     print("\n[STEP 1/7] Generating training data...")
     print("─"*80)
-    generator = GroundedDataGenerator()
-    data = generator.generate_multi_user_dataset(n_users=100, days_per_user=90)
+    with profiler.stage('generation'):
+        generator = GroundedDataGenerator()
+        data = generator.generate_multi_user_dataset(n_users=args.n_users, days_per_user=args.days_per_user)
     
     print(f"\n📊 Dataset Statistics:")
     print(f"   • Total days: {len(data):,}")
@@ -730,9 +1009,10 @@ def main():
     # Step 2: Preprocess
     print("\n[STEP 2/7] Preprocessing features...")
     print("─"*80)
-    preprocessor = DataPreprocessor()
-    features = preprocessor.prepare_features(data)
-    labels = data['risk_label'].values
+    with profiler.stage('preprocessing'):
+        preprocessor = DataPreprocessor()
+        features = preprocessor.prepare_features(data)
+        labels = data['risk_label'].values
     
     print(f"✓ Feature matrix: {features.shape[0]:,} samples × {features.shape[1]} features")
     print(f"✓ Labels: {labels.shape[0]:,} samples")
@@ -740,22 +1020,35 @@ def main():
     # Step 3: Create sequences
     print("\n[STEP 3/7] Creating time sequences...")
     print("─"*80)
-    X, y = preprocessor.create_sequences(features, labels, sequence_length=14)
+    with profiler.stage('sequencing'):
+        X, y = preprocessor.create_sequences(features, labels, sequence_length=14,
+                                             user_ids=data['user_id'].values,
+                                             day_nums=data['day_num'].values)
     
     print(f"✓ Sequences: {X.shape[0]:,} sequences")
     print(f"✓ Window size: {X.shape[1]} days")
     print(f"✓ Features per day: {X.shape[2]}")
     
+    if args.cv_folds:
+        # Windows of one user overlap heavily, so folds split by user, not by window
+        from cross_validation import cross_validate, print_report
+        with profiler.stage('cross_validation'):
+            report = cross_validate(X, y, preprocessor.window_index['user_id'].values, preprocessor.scaler,
+                                    n_folds=args.cv_folds, workers=args.cv_workers,
+                                    model_type=args.model_type, epochs=args.epochs)
+        print_report(report)
+        profiler.print_summary()
+        if args.trace or args.chrome_trace:
+            profiler.write(args.trace or 'reports/train_trace.json', chrome_path=args.chrome_trace)
+        return
+    
     # Step 4: Split data
     print("\n[STEP 4/7] Splitting dataset...")
     print("─"*80)
-    X_temp, X_test, y_temp, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
-    
-    X_train, X_val, y_train, y_val = train_test_split(
-        X_temp, y_temp, test_size=0.2, random_state=42, stratify=y_temp
-    )
+    with profiler.stage('splitting'):
+        X_train, X_val, X_test, y_train, y_val, y_test = split_dataset(
+            X, y, spec['split']['test_size'], spec['split']['val_size'], spec['split']['seed']
+        )
     
     print(f"   • Training:   {len(X_train):,} samples ({len(X_train)/len(X)*100:.1f}%)")
     print(f"   • Validation: {len(X_val):,} samples ({len(X_val)/len(X)*100:.1f}%)")
@@ -764,27 +1057,51 @@ def main():
     # Step 5: Train
     print("\n[STEP 5/7] Training model...")
     print("─"*80)
-    model, history = train_model(
-        X_train, y_train, 
-        X_val, y_val,
-        model_type='hybrid',
-        epochs=100
-    )
+    with profiler.stage('training', n_samples=len(X_train)):
+        model, history = train_model(
+            X_train, y_train, 
+            X_val, y_val,
+            model_type=args.model_type,
+            epochs=args.epochs,
+            telemetry_path=args.telemetry,
+            telemetry_every=args.telemetry_every
+        )
     
     # Step 6: Evaluate
     print("\n[STEP 6/7] Evaluating model...")
     print("─"*80)
-    metrics = evaluate_model(model, X_test, y_test)
+    with profiler.stage('evaluation', n_samples=len(X_test)):
+        metrics = evaluate_model(model, X_test, y_test)
     
     # Step 7: Show predictions
     print("\n[STEP 7/7] Sample predictions...")
-    print_sample_predictions(model, preprocessor, data, n_samples=5)
+    with profiler.stage('samples'):
+        print_sample_predictions(model, preprocessor, data, n_samples=5)
     
     # Save everything
     print("\n" + "="*80)
     print("SAVING MODEL FILES")
     print("="*80)
-    save_model_for_mobile(model, preprocessor)
+    with profiler.stage('export'):
+        if registry is None:
+            save_model_for_mobile(model, preprocessor)
+        else:
+            version = registry.next_version()
+            staging_dir = tempfile.mkdtemp(prefix='grounded_export_')
+            try:
+                save_model_for_mobile(model, preprocessor, output_dir=staging_dir, model_version=version,
+                                      extra_metadata={'registry_key': key})
+                stage_wall_s = {stage['name']: stage['wall_s'] for stage in profiler.stages}
+                registry.register(key, spec, staging_dir, version, metrics, benchmarks={'training': {
+                    'epochs_run': len(history.history['loss']),
+                    'stage_wall_s': stage_wall_s,
+                    'train_samples_per_sec': len(X_train) * len(history.history['loss']) / stage_wall_s['training'],
+                    'peak_rss_mb': peak_rss_mb(),
+                }})
+            finally:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            registry.publish(key, 'models')
+            print(f"✓ Registered build {version} ({key[:12]}) in {args.registry}/ and published to models/")
     
     # Plot if possible
     try:
@@ -798,11 +1115,20 @@ def main():
     print("="*80)
     print("\n📦 Generated Files:")
     print("   • models/grounded_model.h5 (Full Keras model)")
+    print("   • models/grounded_model.keras, _savedmodel/, .npz (Faster-loading copies)")
     print("   • models/grounded_model.tflite (Optimized for mobile)")
+    print("   • models/grounded_model_raw.tflite (Raw daily values in - no scaler needed)")
     print("   • models/feature_scaler.pkl (Data preprocessing)")
     print("   • models/model_metadata.json (Model configuration)")
+    if registry is not None:
+        print(f"   • {args.registry}/ (Every build by config hash - python model_registry.py list)")
     print("   • training_history.png (Performance graphs)")
     
+    profiler.print_summary()
+    if args.trace or args.chrome_trace:
+        profiler.write(args.trace or 'reports/train_trace.json', chrome_path=args.chrome_trace)
+        print(f"✓ Stage trace written to {args.trace or 'reports/train_trace.json'}")
+    
     print("\n📱 Next Steps:")
     print("   1. Test the model with: python test_model.py")
     print("   2. Copy .tflite file to Flutter assets/")
@@ -0,0 +1,248 @@
+"""
+Grounded App - Variable-Length Histories
+Trains and serves a model that scores any history from 1 to 90 days, so a
+new user gets a risk score on their second day and long-time users are not
+cut down to two weeks.
+
+    windows     every day of every user is a target; its window is all of
+                the user's earlier days, up to --max-length
+    masking     build_model(None, ...) puts a Masking layer in front of the
+                LSTM/GRU, so zero padding is skipped, not learned from
+    bucketing   training batches come from tf.data bucket_by_sequence_length:
+                windows of similar length are batched together and padded
+                only to their bucket's cap (7, 14, 30, 60, 90 days), which
+                also keeps the number of traced shapes at five
+    inference   a single history runs at its own length, no padding;
+                ScenarioTester accepts 1-90 days when it loads this model
+
+Reported: padded timesteps (bucketed vs everything padded to 90), test AUC
+per history-length band on held-out users, and single-history latency per
+length. Test users are picked before scaling, so the MinMax scaler is fitted
+on the training users only. Bands without windows (or with one class) have
+no AUC and are reported as null.
+
+Usage:
+    python variable_length.py --model-type gru --epochs 30 --save-dir models/variable
+    python test_mlv1.py    # with models/variable, scenarios may be shorter than 14 days
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+
+import numpy as np
+
+
+MAX_HISTORY_DAYS = 90
+
+# Bucket caps are boundary - 1: 1-7, 8-14, 15-30, 31-60, 61-90 days
+BUCKET_BOUNDARIES = [8, 15, 31, 61, MAX_HISTORY_DAYS + 1]
+
+# History-length bands for the per-length evaluation
+LENGTH_BANDS = [(1, 7), (8, 14), (15, 30), (31, 60), (61, MAX_HISTORY_DAYS)]
+
+LATENCY_LENGTHS = [1, 3, 7, 14, 30, 60, 90]
+
+
+def variable_windows(user_ids, min_length=1, max_length=MAX_HISTORY_DAYS):
+    """
+    (starts, targets) for rows sorted by user then day: the window of a
+    target row is rows [start, target) - every earlier day of the same user,
+    at most max_length of them. Targets with fewer than min_length earlier
+    days are skipped.
+    """
+    user_ids = np.asarray(user_ids)
+    idx = np.arange(len(user_ids))
+    new_user = np.r_[True, user_ids[1:] != user_ids[:-1]]
+    user_start = np.maximum.accumulate(np.where(new_user, idx, 0))
+
+    keep = idx - user_start >= min_length
+    starts = np.maximum(idx - max_length, user_start)
+    return starts[keep], idx[keep]
+
+
+def bucket_cap(lengths, boundaries=BUCKET_BOUNDARIES):
+    """Padded length of each window under bucketing."""
+    caps = np.asarray(boundaries) - 1
+    return caps[np.searchsorted(caps, lengths)]
+
+
+def bucketed_dataset(features, labels, starts, targets, batch_size=32,
+                     boundaries=BUCKET_BOUNDARIES, shuffle=False, seed=42):
+    """
+    Batched (windows, labels) tf.data pipeline. Windows are sliced from one
+    in-memory feature table and padded with zeros up to their bucket's cap.
+    """
+    import tensorflow as tf
+
+    table = tf.constant(features, dtype=tf.float32)
+    dataset = tf.data.Dataset.from_tensor_slices(
+        (starts.astype(np.int64), targets.astype(np.int64), labels[targets].astype(np.float32)))
+    if shuffle:
+        dataset = dataset.shuffle(len(starts), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.map(lambda start, target, label: (table[start:target], label),
+                          num_parallel_calls=tf.data.AUTOTUNE)
+    dataset = dataset.bucket_by_sequence_length(
+        element_length_func=lambda window, label: tf.shape(window)[0],
+        bucket_boundaries=boundaries,
+        bucket_batch_sizes=[batch_size] * (len(boundaries) + 1),
+        pad_to_bucket_boundary=True)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def padding_report(lengths, max_length=MAX_HISTORY_DAYS):
+    """Timesteps the model processes with bucketing vs padding all to max_length."""
+    real = int(lengths.sum())
+    bucketed = int(bucket_cap(lengths).sum())
+    padded = len(lengths) * max_length
+    return {'real_timesteps': real, 'bucketed_timesteps': bucketed, 'padded_timesteps': padded,
+            'bucketed_waste': 1 - real / bucketed, 'padded_waste': 1 - real / padded}
+
+
+def evaluate_by_length(model, dataset):
+    """Scores the dataset batch by batch; AUC overall and per LENGTH_BANDS band."""
+    from evaluation import StreamingEvaluator
+
+    scores, labels, lengths = [], [], []
+    for windows, batch_labels in dataset:
+        windows = windows.numpy()
+        scores.append(np.asarray(model.predict_on_batch(windows))[:, 0])
+        labels.append(batch_labels.numpy())
+        lengths.append(np.any(windows != 0, axis=2).sum(axis=1))
+    scores, labels, lengths = (np.concatenate(part) for part in (scores, labels, lengths))
+
+    def metrics(mask):
+        if not mask.any():
+            return {'n': 0, 'positives': 0, 'auc': None, 'accuracy': None}
+        evaluator = StreamingEvaluator()
+        evaluator.update(labels[mask], scores[mask])
+        result = evaluator.result(threshold=0.5)
+        # NaN (one class only) is not valid JSON
+        auc = float(result['auc'])
+        return {'n': int(mask.sum()), 'positives': int(labels[mask].sum()),
+                'auc': auc if np.isfinite(auc) else None, 'accuracy': float(result['accuracy'])}
+
+    report = {'all': metrics(np.ones(len(labels), dtype=bool))}
+    for low, high in LENGTH_BANDS:
+        report[f'{low}-{high}'] = metrics((lengths >= low) & (lengths <= high))
+    return report
+
+
+def latency_by_length(model, features, starts, targets, lengths=LATENCY_LENGTHS):
+    """p50 / p99 ms of one history per length (the last days of a real window)."""
+    from benchmark_inference import time_calls
+
+    available = targets - starts
+    results = {}
+    for length in lengths:
+        rows = np.flatnonzero(available >= length)
+        if len(rows) == 0:
+            continue
+        window = features[targets[rows[0]] - length:targets[rows[0]]][None].astype(np.float32)
+        times = time_calls(model.predict_on_batch, window)
+        results[length] = {'p50_ms': float(np.percentile(times, 50)), 'p99_ms': float(np.percentile(times, 99))}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and benchmark a variable-length (1-90 day) model")
+    parser.add_argument('--n-users', type=int, default=100)
+    parser.add_argument('--days-per-user', type=int, default=90)
+    parser.add_argument('--model-type', default='gru', choices=['lstm', 'gru'])
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--min-length', type=int, default=1)
+    parser.add_argument('--max-length', type=int, default=MAX_HISTORY_DAYS)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--save-dir', default=None, help="Save model, scaler and metadata here")
+    parser.add_argument('--output', default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    import joblib
+    import tensorflow as tf
+    from sklearn.model_selection import GroupShuffleSplit
+    from traning_scriptv1 import GroundedDataGenerator, DataPreprocessor, train_model
+
+    print("="*80)
+    print(" "*25 + "VARIABLE-LENGTH HISTORIES (1-90 DAYS)")
+    print("="*80)
+
+    np.random.seed(42)
+    tf.random.set_seed(42)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = GroundedDataGenerator().generate_multi_user_dataset(args.n_users, args.days_per_user)
+    labels = data['risk_label'].values
+    user_ids = data['user_id'].values
+
+    # Hold out test users before scaling: the first call fits the scaler on
+    # the training users, the second only transforms
+    splitter = GroupShuffleSplit(n_splits=1, test_size=0.2, random_state=42)
+    train_rows, _ = next(splitter.split(user_ids, groups=user_ids))
+    preprocessor = DataPreprocessor()
+    preprocessor.prepare_features(data.iloc[train_rows].copy())
+    features = preprocessor.prepare_features(data).astype(np.float32)
+    starts, targets = variable_windows(user_ids, args.min_length, args.max_length)
+    lengths = targets - starts
+
+    is_train_user = np.isin(user_ids[targets], user_ids[train_rows])
+    train_idx, test_idx = np.flatnonzero(is_train_user), np.flatnonzero(~is_train_user)
+    splitter = GroupShuffleSplit(n_splits=1, test_size=0.2, random_state=43)
+    fit_part, val_part = next(splitter.split(train_idx, groups=user_ids[targets[train_idx]]))
+    fit_idx, val_idx = train_idx[fit_part], train_idx[val_part]
+
+    print(f"\n✓ {len(targets):,} windows, {lengths.min()}-{lengths.max()} days "
+          f"(median {np.median(lengths):.0f}) | train {len(fit_idx):,} / val {len(val_idx):,} / "
+          f"test {len(test_idx):,} (split by user)")
+    padding = padding_report(lengths[fit_idx], args.max_length)
+    print(f"📊 Timesteps per epoch: {padding['real_timesteps']:,} real | "
+          f"{padding['bucketed_timesteps']:,} bucketed ({padding['bucketed_waste']*100:.1f}% padding) | "
+          f"{padding['padded_timesteps']:,} padded to {args.max_length} ({padding['padded_waste']*100:.1f}% padding)")
+
+    def subset(idx, shuffle=False):
+        return bucketed_dataset(features, labels, starts[idx], targets[idx], args.batch_size, shuffle=shuffle)
+
+    print(f"\n[{args.model_type}] Training with bucketed batches...")
+    with contextlib.redirect_stdout(io.StringIO()):
+        model, history = train_model(subset(fit_idx, shuffle=True), None, subset(val_idx), None,
+                                     model_type=args.model_type, epochs=args.epochs)
+    print(f"✓ {len(history.history['loss'])} epochs | best val AUC {max(history.history['val_auc']):.4f}")
+
+    evaluation = evaluate_by_length(model, subset(test_idx))
+    print("\n📊 Test AUC by history length (held-out users):")
+    for band, metrics in evaluation.items():
+        if metrics['auc'] is None:
+            print(f"   • {band:>7} days: no AUC | {metrics['n']:,} windows ({metrics['positives']} positive)")
+            continue
+        print(f"   • {band:>7} days: AUC {metrics['auc']:.4f} | accuracy {metrics['accuracy']:.4f} | "
+              f"{metrics['n']:,} windows ({metrics['positives']} positive)")
+
+    latency = latency_by_length(model, features, starts, targets)
+    print("\n⏱ Single-history latency by length:")
+    for length, times in latency.items():
+        print(f"   • {length:3d} days: p50 {times['p50_ms']:.2f} ms | p99 {times['p99_ms']:.2f} ms")
+
+    if args.save_dir:
+        os.makedirs(args.save_dir, exist_ok=True)
+        model.save(os.path.join(args.save_dir, 'grounded_model.h5'))
+        joblib.dump(preprocessor.scaler, os.path.join(args.save_dir, 'feature_scaler.pkl'))
+        with open(os.path.join(args.save_dir, 'model_metadata.json'), 'w') as f:
+            json.dump({'model_type': args.model_type, 'variable_length': True,
+                       'min_history_days': args.min_length, 'max_history_days': args.max_length,
+                       'bucket_boundaries': BUCKET_BOUNDARIES, 'n_features': features.shape[1]}, f, indent=2)
+        print(f"\n✓ Model saved to {args.save_dir}/")
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'settings': vars(args), 'padding': padding, 'evaluation': evaluation,
+                       'latency': {str(length): times for length, times in latency.items()}}, f, indent=2)
+        print(f"✓ Report written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Grounded App - What-If Sensitivity Sweep
+Scores a scenario under every combination of changes to its create_day
+fields, e.g. "sleep_quality 1..10 × mood 1..10 on each of the last 7 days",
+without building one history per variant.
+
+The base 14-day window is featurized once (batch_features, same columns as
+ScenarioTester). A variant only differs from it in the perturbed fields on
+the perturbed days, so each chunk of variants starts as a copy of the base
+window and gets just those columns overwritten:
+
+    numerical field     one scaled column on the selected days
+    categorical field   its one-hot block on the selected days
+    used / frequency    the frequency column, then both rolling
+                        frequencies for the whole window (they look back)
+
+Chunks go straight to model.predict_on_batch, so memory stays at one chunk
+however many variants there are. The result is a sensitivity surface with
+one axis per day selection and one per field.
+
+Fields change independently: sweeping used=False leaves context, amount
+etc. as they were; sweep them together for a consistent no-use day.
+
+Usage:
+    python whatif_sweep.py --scenario 1 --vary sleep_quality=1:10:0.5 --vary mood=1:10:0.5 --days=-1,-7:
+    python whatif_sweep.py --scenario 3 --vary craving_intensity=1:10:0.25 --vary mood=1:10:0.25 \\
+        --vary context=alone,friends,party --days all --output reports/whatif.npz
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from batch_features import (CATEGORICAL_VOCABS, DAYS, FEATURE_NAMES, NUMERICAL_COLS,
+                            featurize_columns, histories_to_columns, rolling_frequency)
+
+
+SEQUENCE_LENGTH = 14
+FREQUENCY_FIELDS = ['used', 'frequency']
+CATEGORICAL_FIELDS = list(CATEGORICAL_VOCABS) + ['day_of_week']
+SWEEP_FIELDS = NUMERICAL_COLS + CATEGORICAL_FIELDS + FREQUENCY_FIELDS
+
+
+def _day_mask(selection):
+    """(SEQUENCE_LENGTH,) bool mask for an int or a list of window day indices."""
+    mask = np.zeros(SEQUENCE_LENGTH, dtype=bool)
+    mask[np.atleast_1d(selection)] = True
+    return mask
+
+
+def _codes(field, values):
+    """Integer codes of categorical values (day_of_week is already a code)."""
+    if field == 'day_of_week':
+        return np.asarray(values, dtype=np.int64)
+    lookup = {name: i for i, name in enumerate(CATEGORICAL_VOCABS[field])}
+    unknown = [v for v in values if v not in lookup]
+    if unknown:
+        raise ValueError(f"Unknown {field} values: {unknown}")
+    return np.array([lookup[v] for v in values], dtype=np.int64)
+
+
+class WhatIfSweep:
+    """
+    Batched what-if scoring around one base history.
+    """
+
+    def __init__(self, model, scaler):
+        self.model = model
+        self.scaler = scaler
+        self.columns = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+    def _block(self, field):
+        """Feature columns of a categorical field's one-hot block."""
+        if field == 'day_of_week':
+            names = [f'day_{d}' for d in DAYS]
+        else:
+            prefix = {'context': 'context', 'time_of_day': 'time', 'method': 'method'}[field]
+            names = [f'{prefix}_{v}' for v in CATEGORICAL_VOCABS[field]]
+        return np.array([self.columns[name] for name in names])
+
+    def _patch(self, X, field, values, masks):
+        """Overwrite one field on the masked days. values and masks are per variant."""
+        if field in NUMERICAL_COLS:
+            col = self.columns[field]
+            i = NUMERICAL_COLS.index(field)
+            scaled = values * self.scaler.scale_[i] + self.scaler.min_[i]
+            X[:, :, col] = np.where(masks, scaled[:, None], X[:, :, col])
+        else:
+            block = self._block(field)
+            onehot = (values[:, None] == np.arange(len(block))).astype(X.dtype)
+            X[:, :, block] = np.where(masks[:, :, None], onehot[:, None, :], X[:, :, block])
+
+    def _patch_frequency(self, X, frequency):
+        """Rolling frequencies (scaled) from a (n, SEQUENCE_LENGTH) frequency array."""
+        for offset, (window, name) in enumerate([(7, 'frequency_7day'), (30, 'frequency_30day')]):
+            i = len(NUMERICAL_COLS) + offset
+            scaled = rolling_frequency(frequency, window) * self.scaler.scale_[i] + self.scaler.min_[i]
+            X[:, :, self.columns[name]] = scaled
+
+    def variants(self, base_window, base_frequency, grid, days, start, stop):
+        """Feature windows for flat variant indices [start, stop)."""
+        shape = (len(days),) + tuple(len(values) for _, values in grid)
+        index = np.unravel_index(np.arange(start, stop), shape)
+        masks = np.stack([_day_mask(selection) for selection in days])[index[0]]
+
+        X = np.repeat(base_window[None], stop - start, axis=0)
+        frequency = None
+        for (field, values), picks in zip(grid, index[1:]):
+            chosen = values[picks]
+            if field in FREQUENCY_FIELDS:
+                if frequency is None:
+                    frequency = np.repeat(base_frequency[None], stop - start, axis=0)
+                frequency = np.where(masks, chosen[:, None].astype(np.float64), frequency)
+            else:
+                self._patch(X, field, chosen, masks)
+        if frequency is not None:
+            self._patch_frequency(X, frequency)
+        return X
+
+    def run(self, history, grid, days=(-1,), batch_size=8192):
+        """
+        Score every variant. grid is {field: values}; days is a list of day
+        selections (an index or a list of indices into the last 14 days),
+        each changed together. Returns a dict with the base score, the
+        surface (len(days), len(values_1), ...) and sweep timings.
+        """
+        unknown = [field for field in grid if field not in SWEEP_FIELDS]
+        if unknown:
+            raise ValueError(f"Cannot sweep {unknown}; choose from {SWEEP_FIELDS}")
+        if len(history) < SEQUENCE_LENGTH:
+            raise ValueError(f"History needs {SEQUENCE_LENGTH} days, got {len(history)}")
+
+        columns = histories_to_columns([history], SEQUENCE_LENGTH)
+        base_window = featurize_columns(columns, self.scaler)[0]
+        base_frequency = columns['frequency'][0]
+        axes = []
+        for field, values in grid.items():
+            if field in CATEGORICAL_FIELDS:
+                axes.append((field, _codes(field, values)))
+            else:
+                axes.append((field, np.asarray(values, dtype=np.float64)))
+
+        shape = (len(days),) + tuple(len(values) for _, values in axes)
+        n_variants = int(np.prod(shape))
+        scores = np.empty(n_variants, dtype=np.float32)
+        build_s = score_s = 0.0
+        for start in range(0, n_variants, batch_size):
+            stop = min(start + batch_size, n_variants)
+            t0 = time.perf_counter()
+            X = self.variants(base_window, base_frequency, axes, list(days), start, stop)
+            t1 = time.perf_counter()
+            scores[start:stop] = np.asarray(self.model.predict_on_batch(X))[:, 0]
+            build_s += t1 - t0
+            score_s += time.perf_counter() - t1
+
+        base_score = float(np.asarray(self.model.predict_on_batch(base_window[None]))[0, 0])
+        return {
+            'base_score': base_score,
+            'surface': scores.reshape(shape),
+            'days': list(days),
+            'grid': {field: list(values) for field, values in grid.items()},
+            'n_variants': n_variants,
+            'build_s': build_s,
+            'score_s': score_s,
+        }
+
+
+def field_effects(result):
+    """
+    Per axis: mean score at each value (averaged over every other axis) and
+    the spread between the lowest and highest of those means.
+    """
+    surface = result['surface']
+    names = ['day'] + list(result['grid'])
+    labels = [result['days']] + list(result['grid'].values())
+    effects = {}
+    for axis, (name, values) in enumerate(zip(names, labels)):
+        others = tuple(a for a in range(surface.ndim) if a != axis)
+        means = surface.mean(axis=others)
+        effects[name] = {'values': values, 'mean_score': means.tolist(),
+                         'spread': float(means.max() - means.min())}
+    return effects
+
+
+def parse_values(spec):
+    """'1:10:0.5' → 1, 1.5, ... 10 (inclusive); 'a,b,c' → list; true/false → bool."""
+    if ':' in spec:
+        start, stop, step = (float(part) for part in spec.split(':'))
+        return list(np.round(np.arange(start, stop + step / 2, step), 6))
+    values = []
+    for part in spec.split(','):
+        if part.lower() in ('true', 'false'):
+            values.append(part.lower() == 'true')
+        else:
+            try:
+                values.append(int(part))
+            except ValueError:
+                try:
+                    values.append(float(part))
+                except ValueError:
+                    values.append(part)
+    return values
+
+
+def parse_days(specs):
+    """
+    Comma-separated day selections: 'all' → each of the 14 days alone;
+    '-1' → one day; '-7:' → the last 7 days together.
+    """
+    days = []
+    for spec in specs.split(','):
+        if spec == 'all':
+            days.extend(range(SEQUENCE_LENGTH))
+        elif ':' in spec:
+            start, stop = (int(part) if part else None for part in spec.split(':'))
+            days.append(list(range(SEQUENCE_LENGTH))[start:stop])
+        else:
+            days.append(int(spec))
+    return days
+
+
+def main():
+    parser = argparse.ArgumentParser(description="What-if sensitivity sweep around a scenario")
+    parser.add_argument('--model', default='models/grounded_model.h5')
+    parser.add_argument('--scaler', default='models/feature_scaler.pkl')
+    parser.add_argument('--scenario', type=int, default=1, help="ScenarioTester.build_scenario_N to start from")
+    parser.add_argument('--vary', action='append', required=True, metavar='FIELD=VALUES',
+                        help="e.g. sleep_quality=1:10:0.5 or context=alone,party (repeatable)")
+    parser.add_argument('--days', default='-1',
+                        help="Comma-separated day selections: index, 'start:stop' (changed together) "
+                             "or 'all'; write --days=-7: when it starts with a minus")
+    parser.add_argument('--batch-size', type=int, default=8192)
+    parser.add_argument('--output', default=None, help="Write the surface as .npz")
+    args = parser.parse_args()
+
+    from test_mlv1 import ScenarioTester
+
+    grid = {}
+    for spec in args.vary:
+        field, _, values = spec.partition('=')
+        grid[field] = parse_values(values)
+    days = parse_days(args.days)
+
+    tester = ScenarioTester(args.model, args.scaler)
+    builder = getattr(tester, f'build_scenario_{args.scenario}', None)
+    if builder is None:
+        print(f"❌ No scenario {args.scenario}")
+        return 1
+    name, history = builder()
+
+    sweep = WhatIfSweep(tester.model, tester.scaler)
+    sweep.run(history, {field: values[:1] for field, values in grid.items()}, days[:1])  # warm-up
+    result = sweep.run(history, grid, days, args.batch_size)
+
+    print("\n" + "="*80)
+    print(" "*27 + "WHAT-IF SENSITIVITY SWEEP")
+    print("="*80)
+    total_s = result['build_s'] + result['score_s']
+    print(f"\n📊 {name}: base score {result['base_score']:.3f}")
+    print(f"⏱ {result['n_variants']:,} variants in {total_s:.2f} s "
+          f"({result['n_variants'] / total_s:,.0f}/s; building {result['build_s']:.2f} s, "
+          f"scoring {result['score_s']:.2f} s)")
+
+    surface = result['surface']
+    print(f"   • Score range: {surface.min():.3f} - {surface.max():.3f}")
+    for field, effect in field_effects(result).items():
+        low, high = np.argmin(effect['mean_score']), np.argmax(effect['mean_score'])
+        print(f"   • {field:18} spread {effect['spread']:.3f} "
+              f"(lowest at {effect['values'][low]}, highest at {effect['values'][high]})")
+
+    if args.output:
+        np.savez(args.output, surface=surface, base_score=result['base_score'],
+                 days=np.array([str(d) for d in days]),
+                 **{f'values_{field}': np.array(values) for field, values in grid.items()})
+        print(f"\n✓ Surface written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())